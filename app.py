@@ -12,7 +12,7 @@ import streamlit as st
 import pandas as pd
 import sqlite3
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 from components.database_manager import DatabaseManager
@@ -20,8 +20,9 @@ from components.chat_interface import ChatInterface
 from components.query_processor import QueryProcessor
 from components.report_generator import ReportGenerator
 from components.visualization import VisualizationManager
-from utils.vanna_config import VannaConfig
+from utils.vanna_config import get_vanna_engine, reload_vanna_engine
 from utils.helpers import format_dataframe, get_status_color
+from utils.query_log import is_full_scan
 
 # 頁面配置
 st.set_page_config(
@@ -63,10 +64,10 @@ class MainApp:
     def __init__(self):
         self.db_manager = DatabaseManager()
         self.chat_interface = ChatInterface()
-        self.query_processor = QueryProcessor()
-        self.report_generator = ReportGenerator()
+        self.query_processor = QueryProcessor(self.db_manager)
+        self.report_generator = ReportGenerator(self.db_manager)
         self.viz_manager = VisualizationManager()
-        self.vanna_config = VannaConfig()
+        self.vanna_config = get_vanna_engine()
         
         # 初始化 session state
         if 'database_loaded' not in st.session_state:
@@ -183,7 +184,9 @@ class MainApp:
         col1, col2, col3, col4 = st.columns(4)
         
         try:
-            overview_stats = self.db_manager.get_overview_statistics()
+            # 總覽統計與兩個狀態分佈並行查詢
+            dashboard_data = self.db_manager.get_dashboard_data()
+            overview_stats = dashboard_data['overview']
             
             with col1:
                 st.subheader("配件總數")
@@ -212,7 +215,7 @@ class MainApp:
             
             with col1:
                 st.subheader("PAT狀態分佈")
-                pat_status_data = self.db_manager.get_pat_status_distribution()
+                pat_status_data = dashboard_data['pat_status']
                 if not pat_status_data.empty:
                     custom_colors = [ "#3D58F0", "#EF63FC", "#3375FF", "#FF7E33", "#79D7EE" ]
 
@@ -241,7 +244,7 @@ class MainApp:
             
             with col2:
                 st.subheader("KYEC狀態分佈")
-                kyec_status_data = self.db_manager.get_kyec_status_distribution()
+                kyec_status_data = dashboard_data['kyec_status']
                 if not kyec_status_data.empty:
                     custom_colors = [ "#3D58F0", "#CFE289", "#EF63FC", "#79D7EE" ,"#FF7E33"]
 
@@ -311,11 +314,13 @@ class MainApp:
         """顯示配件狀態統計"""
         st.subheader("📊 配件狀態詳細統計")
         
+        detailed_stats = self.db_manager.get_detailed_statistics()
+        
         col1, col2 = st.columns(2)
         
         with col1:
             st.write("**PAT 配件狀態統計**")
-            pat_stats = self.db_manager.get_detailed_pat_statistics()
+            pat_stats = detailed_stats['pat']
             if not pat_stats.empty:
                 st.dataframe(pat_stats, use_container_width=True)
             else:
@@ -323,11 +328,20 @@ class MainApp:
         
         with col2:
             st.write("**KYEC 配件狀態統計**")
-            kyec_stats = self.db_manager.get_detailed_kyec_statistics()
+            kyec_stats = detailed_stats['kyec']
             if not kyec_stats.empty:
                 st.dataframe(kyec_stats, use_container_width=True)
             else:
                 st.info("暫無 KYEC 統計資料")
+        
+        # 外包廠站點統計（設定站點資料庫時顯示）
+        if self.db_manager.site_registry:
+            st.write("**各站點配件狀態統計**")
+            site_stats = self.db_manager.get_site_statistics()
+            if not site_stats.empty:
+                st.dataframe(site_stats, use_container_width=True)
+            else:
+                st.info("暫無站點統計資料")
 
     def show_customer_analysis(self):
         """顯示客戶別分析"""
@@ -350,12 +364,16 @@ class MainApp:
         """顯示趨勢分析"""
         st.subheader("📈 配件狀態趨勢分析")
         
-        # 時間範圍選擇
+        # 時間範圍選擇（預設為週統計快照涵蓋的範圍）
+        first_week, last_week = self.db_manager.get_snapshot_date_range()
+        default_start = datetime.strptime(first_week, "%Y-%m-%d") if first_week else datetime.now().replace(day=1)
+        default_end = datetime.strptime(last_week, "%Y-%m-%d") + timedelta(days=6) if last_week else datetime.now()
+        
         col1, col2 = st.columns(2)
         with col1:
-            start_date = st.date_input("開始日期", datetime.now().replace(day=1))
+            start_date = st.date_input("開始日期", default_start)
         with col2:
-            end_date = st.date_input("結束日期", datetime.now())
+            end_date = st.date_input("結束日期", default_end)
         
         if start_date <= end_date:
             trend_data = self.db_manager.get_trend_analysis(start_date, end_date)
@@ -412,32 +430,56 @@ class MainApp:
         # 搜尋框
         search_term = st.text_input("🔍 搜尋配件編號或關鍵字")
         
-        # 獲取變更紀錄
-        change_logs = self.db_manager.get_change_logs(
+        page_size = st.selectbox("每頁筆數", [50, 100, 200], key="change_log_page_size")
+        
+        # 篩選條件變更時回到第一頁（游標堆疊記錄已瀏覽各頁的起點）
+        filter_signature = (table_filter, operation_filter, days_filter, search_term, page_size)
+        if st.session_state.get('change_log_filter_signature') != filter_signature:
+            st.session_state.change_log_filter_signature = filter_signature
+            st.session_state.change_log_cursors = [None]
+        cursors = st.session_state.change_log_cursors
+        
+        # 變更統計（彙總查詢，不載入全部紀錄）
+        summary = self.db_manager.get_change_log_summary(
             table_filter, operation_filter, days_filter, search_term
         )
         
-        if not change_logs.empty:
-            st.subheader(f"📊 找到 {len(change_logs)} 筆變更紀錄")
+        if summary['total'] > 0:
+            st.subheader(f"📊 找到 {summary['total']} 筆變更紀錄")
             
-            # 變更統計
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                st.metric("新增", len(change_logs[change_logs['operation'] == 'INSERT']))
+                st.metric("新增", summary['operations'].get('INSERT', 0))
             with col2:
-                st.metric("更新", len(change_logs[change_logs['operation'] == 'UPDATE']))
+                st.metric("更新", summary['operations'].get('UPDATE', 0))
             with col3:
-                st.metric("刪除", len(change_logs[change_logs['operation'] == 'DELETE']))
+                st.metric("刪除", summary['operations'].get('DELETE', 0))
             
-            # 變更紀錄表格
+            # 變更紀錄表格（僅載入目前頁）
+            change_logs, next_cursor = self.db_manager.get_change_logs_page(
+                table_filter, operation_filter, days_filter, search_term,
+                cursor=cursors[-1], page_size=page_size
+            )
             st.dataframe(change_logs, use_container_width=True)
             
+            col1, col2, col3 = st.columns([1, 2, 1])
+            
+            with col1:
+                if st.button("⬅️ 上一頁", disabled=len(cursors) <= 1, use_container_width=True):
+                    cursors.pop()
+                    st.rerun()
+            with col2:
+                order_note = "，搜尋結果依時間由新到舊排列" if search_term else ""
+                st.caption(f"第 {len(cursors)} 頁，每頁 {page_size} 筆{order_note}")
+            with col3:
+                if st.button("下一頁 ➡️", disabled=next_cursor is None, use_container_width=True):
+                    cursors.append(next_cursor)
+                    st.rerun()
+            
             # 變更趨勢圖
-            if len(change_logs) > 1:
-                daily_changes = change_logs.groupby(change_logs['timestamp'].dt.date).size().reset_index()
-                daily_changes.columns = ['日期', '變更次數']
-                
+            daily_changes = summary['daily']
+            if len(daily_changes) > 1:
                 fig = px.line(daily_changes, x='日期', y='變更次數',
                             title='每日變更次數趨勢')
                 st.plotly_chart(fig, use_container_width=True)
@@ -553,6 +595,25 @@ class MainApp:
                                 st.error("❌ 自訂報表生成失敗")
                     else:
                         st.warning("請至少選擇一個欄位")
+                
+                # 完整資料以 CSV 分批匯出（不受報表筆數限制）
+                if st.button("📄 匯出完整 CSV"):
+                    if selected_columns:
+                        with st.spinner("正在匯出 CSV..."):
+                            for table in tables:
+                                csv_file = self.report_generator.generate_custom_csv(
+                                    table, selected_columns, filter_conditions
+                                )
+                                if csv_file:
+                                    st.download_button(
+                                        label=f"📥 下載 {table}.csv",
+                                        data=csv_file,
+                                        file_name=f"{report_name}_{table}_{datetime.now().strftime('%Y%m%d')}.csv",
+                                        mime="text/csv",
+                                        key=f"custom_csv_{table}"
+                                    )
+                    else:
+                        st.warning("請至少選擇一個欄位")
 
     def show_settings(self):
         """顯示系統設定頁面"""
@@ -568,6 +629,28 @@ class MainApp:
             db_info = self.db_manager.get_database_info()
             for key, value in db_info.items():
                 st.write(f"**{key}**: {value}")
+            
+            with st.expander("🔍 資料品質檢查"):
+                quality_table = st.selectbox(
+                    "選擇資料表",
+                    ["pat_parts_all", "kyec_parts_all", "pat_stats_weekly", "kyec_stats_weekly", "table_change_log"],
+                    key="quality_table"
+                )
+                if st.button("開始檢查"):
+                    with st.spinner("正在檢查資料品質..."):
+                        quality_report = self.db_manager.check_table_quality(quality_table)
+                    if 'quality_score' in quality_report:
+                        st.metric("品質分數", quality_report['quality_score'])
+                        st.write(f"**資料筆數**: {quality_report['total_rows']}，"
+                                 f"**重複資料**: {quality_report['duplicate_rows']}")
+                        missing_df = pd.DataFrame([
+                            {'欄位': col, '缺失數量': info['count'], '缺失比例(%)': round(info['percentage'], 2),
+                             '資料類型': quality_report['data_types'].get(col)}
+                            for col, info in quality_report['missing_values'].items()
+                        ])
+                        st.dataframe(missing_df, use_container_width=True)
+                    else:
+                        st.warning(quality_report.get('message', '資料品質檢查失敗'))
         
         with col2:
             st.info("🔄 同步設定")
@@ -578,11 +661,52 @@ class MainApp:
                 with st.spinner("正在同步資料庫..."):
                     success = self.db_manager.manual_sync()
                     if success:
+                        # 資料庫結構可能改變，重新建立 AI 引擎以同步 DDL 訓練資料
+                        reload_vanna_engine()
                         st.success("✅ 資料庫同步成功！")
                         st.rerun()
                     else:
                         st.error("❌ 資料庫同步失敗")
         
+        # 查詢結果快取統計
+        st.info("⚡ 查詢結果快取")
+        cache_stats = self.db_manager.query_cache.get_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("命中次數", cache_stats['hits'])
+        with col2:
+            st.metric("未命中次數", cache_stats['misses'])
+        with col3:
+            st.metric("命中率", f"{cache_stats['hit_rate']:.1%}")
+        with col4:
+            st.metric("快取用量", f"{cache_stats['bytes'] / 1024 / 1024:.1f} / {cache_stats['max_bytes'] / 1024 / 1024:.0f} MB")
+        
+        st.caption(f"快取項目: {cache_stats['entries']}，淘汰次數: {cache_stats['evictions']}")
+        if st.button("🧹 清空查詢快取"):
+            self.db_manager.query_cache.clear()
+            st.rerun()
+        
+        # 慢查詢紀錄
+        st.info("🐢 慢查詢紀錄")
+        log_stats = self.db_manager.query_logger.get_stats()
+        st.caption(f"已記錄 {log_stats['total']} 個語句，其中 {log_stats['slow']} 個超過 "
+                   f"{log_stats['slow_threshold_ms']:g} ms（已擷取查詢計畫）")
+        
+        top_n = st.number_input("顯示最慢的查詢數", min_value=5, max_value=50, value=10, step=5)
+        slow_queries = self.db_manager.query_logger.top_slowest(int(top_n))
+        if not slow_queries.empty:
+            st.dataframe(slow_queries.drop(columns=['查詢計畫']), use_container_width=True)
+            for _, row in slow_queries[slow_queries['查詢計畫'].notna()].iterrows():
+                label = f"{'⚠️ 全表掃描 · ' if row['全表掃描'] else ''}{row['最長(ms)']} ms · {row['呼叫端']}"
+                with st.expander(label):
+                    st.code(row['SQL'], language='sql')
+                    plan = "\n".join(f"{line}    ◀ 全表掃描" if is_full_scan(line) else line
+                                     for line in row['查詢計畫'].splitlines())
+                    st.code(plan, language='text')
+        else:
+            st.write("暫無查詢紀錄")
+        
         st.markdown("---")
         
         # Vanna AI 設定
@@ -594,8 +718,28 @@ class MainApp:
             st.info("🧠 AI 模型狀態")
             ai_status = self.vanna_config.get_model_status()
             st.write(f"**模型狀態**: {ai_status['status']}")
-            st.write(f"**訓練資料數量**: {ai_status['training_data_count']}")
-            st.write(f"**最後訓練時間**: {ai_status['last_training']}")
+            if ai_status.get('error'):
+                st.error(f"❌ {ai_status['error']}")
+            else:
+                st.write(f"**訓練資料數量**: {ai_status['training_data_count']}")
+                st.write(f"**最後訓練時間**: {ai_status['last_training']}")
+                training_result = ai_status.get('last_training_result')
+                if training_result:
+                    failures = training_result['failed'] + training_result['rejected']
+                    st.caption(f"啟動時同步內建訓練資料: 新增 {training_result['added']} 筆、"
+                               f"已存在 {training_result['skipped']} 筆、移除 {training_result['removed']} 筆、"
+                               f"未變更 {training_result['unchanged']} 筆"
+                               + (f"，失敗或未通過驗證 {failures} 筆" if failures else ""))
+                if ai_status.get('api_key_missing'):
+                    st.warning("⚠️ 未設置 OpenAI API 金鑰，AI 功能將受限")
+            if st.button("🔄 重新載入 AI 引擎"):
+                with st.spinner("正在重新載入 AI 引擎..."):
+                    engine = reload_vanna_engine()
+                if engine.vn is None:
+                    st.error(f"❌ AI 引擎重新載入失敗: {engine.init_error}")
+                else:
+                    self.vanna_config = engine
+                    st.success(f"✅ AI 引擎已重新載入（耗時 {engine.load_seconds:.1f} 秒）")
 
             with st.expander("上傳 JSON/CSV 訓練檔"):
                 uploaded_file = st.file_uploader("選擇訓練資料檔案", type=["json", "csv"])
@@ -612,25 +756,78 @@ class MainApp:
 
                         # 匯入按鈕
                         if st.button("🚀 開始匯入訓練資料"):
-                            success_cnt = 0
-                            for _, row in training_df.iterrows():
-                                question = row.get("question") or row.get("Question")
-                                sql = row.get("sql") or row.get("SQL")
-                                if question and sql:
-                                    if self.vanna_config.add_training_data(question, sql):
-                                        success_cnt += 1
-                            st.success(f"✅ 匯入完成，共新增 {success_cnt} 筆訓練資料")
+                            with st.spinner("正在匯入訓練資料..."):
+                                result = self.vanna_config.bulk_add_training_data(
+                                    training_df.to_dict(orient="records"))
+                            if 'error' in result:
+                                st.error(f"❌ 匯入失敗: {result['error']}")
+                            else:
+                                st.success(f"✅ 匯入完成，共新增 {result['added']} 筆訓練資料"
+                                           f"（已存在 {result['skipped']} 筆，耗時 {result['seconds']:.1f} 秒，"
+                                           f"{result['items_per_second']:.0f} 筆/秒）")
+                                if result['incomplete'] or result['failed']:
+                                    st.warning(f"⚠️ 缺少問題或 SQL: {result['incomplete']} 筆，"
+                                               f"寫入失敗: {result['failed']} 筆")
+                                if result['rejected']:
+                                    with st.expander(f"未通過 SQL 安全性驗證: {len(result['rejected'])} 筆"):
+                                        st.dataframe(pd.DataFrame(result['rejected']), use_container_width=True)
                     except Exception as e:
                         st.error(f"❌ 讀取訓練資料失敗: {str(e)}")
-        
+
+            with st.expander("🧹 整理訓練資料"):
+                st.caption("合併內容相同的 DDL、文件說明與問題-SQL 對，每組保留一筆並重建向量資料庫")
+                if st.button("開始整理"):
+                    with st.spinner("正在整理訓練資料..."):
+                        report = self.vanna_config.compact_training_store()
+                    if 'error' in report:
+                        st.error(f"❌ 整理失敗: {report['error']}")
+                    else:
+                        removed = sum(report['removed'].values())
+                        st.success(f"✅ 整理完成，移除 {removed} 筆重複資料（耗時 {report['seconds']:.1f} 秒）")
+                        latency = {key: f"{report[key]:.1f}" if report[key] is not None else "-"
+                                   for key in ('latency_ms_before', 'latency_ms_after')}
+                        st.dataframe(pd.DataFrame({
+                            '項目': ['DDL', '文件說明', '問題-SQL', '總筆數', '磁碟用量 (MB)', '檢索延遲 (ms)'],
+                            '整理前': [report['before']['ddl'], report['before']['documentation'],
+                                      report['before']['sql'], report['before']['total'],
+                                      f"{report['disk_bytes_before'] / 1024 / 1024:.2f}",
+                                      latency['latency_ms_before']],
+                            '整理後': [report['after']['ddl'], report['after']['documentation'],
+                                      report['after']['sql'], report['after']['total'],
+                                      f"{report['disk_bytes_after'] / 1024 / 1024:.2f}",
+                                      latency['latency_ms_after']],
+                        }).astype(str), use_container_width=True)
+
         with col2:
             st.info("🎯 查詢設定")
-            max_results = st.number_input("最大查詢結果數", min_value=10, max_value=1000, value=100)
-            query_timeout = st.number_input("查詢超時時間(秒)", min_value=5, max_value=60, value=30)
+            query_settings = self.vanna_config.get_settings()
+            max_results = st.number_input("最大查詢結果數", min_value=10, max_value=1000,
+                                          value=query_settings['max_results'])
+            query_timeout = st.number_input("查詢超時時間(秒)", min_value=5, max_value=60,
+                                            value=query_settings['query_timeout'])
             
             if st.button("💾 儲存設定"):
                 self.vanna_config.update_settings(max_results, query_timeout)
                 st.success("✅ 設定已儲存！")
+            
+            st.info("⚡ 問題快取")
+            question_cache = self.vanna_config.question_cache
+            question_stats = question_cache.get_stats()
+            st.write(f"**命中率**: {question_stats['hit_rate']:.1%}"
+                     f"（完全比對 {question_stats['exact_hits']} / 語意比對 {question_stats['semantic_hits']}"
+                     f" / 未命中 {question_stats['misses']}）")
+            st.write(f"**節省的 SQL 生成時間**: {question_stats['saved_ms'] / 1000:.1f} 秒"
+                     f"，平均查詢 {question_stats['avg_lookup_ms']:.1f} ms")
+            st.caption(f"快取問題: {question_stats['entries']}，"
+                       f"因資料庫結構或訓練資料變更失效: {question_stats['invalidations']} 次")
+            threshold = st.slider("語意比對相似度門檻", min_value=0.80, max_value=1.00,
+                                  value=float(question_stats['similarity_threshold']), step=0.01,
+                                  help="調整後保存在問題快取檔案中，重新啟動後沿用")
+            if threshold != question_stats['similarity_threshold']:
+                question_cache.set_threshold(threshold)
+            if st.button("🧹 清空問題快取"):
+                question_cache.clear()
+                st.rerun()
 
 
         st.markdown("---")
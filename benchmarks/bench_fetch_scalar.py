@@ -0,0 +1,84 @@
+"""單值查詢路徑的延遲基準測試
+
+比較讀取單一值或少量資料的幾種方式：原本的 `pd.read_sql_query` 取 `.iloc[0]`，
+以及 DatabaseManager 的三種查詢入口：`fetch_frame`（未命中快取時建立 DataFrame）、
+`fetch_rows`（返回 tuple 列表）與 `fetch_scalar`（僅單值查詢）。最後一欄為直接以
+`conn.execute().fetchone()` 讀取的下限。各方式共用 DatabaseManager 的讀取連線
+（預備語句快取已暖機），結果為重複執行的中位數。
+
+執行方式（於專案根目錄）：
+    python benchmarks/bench_fetch_scalar.py [重複次數]
+"""
+import os
+import sys
+import time
+import logging
+import statistics
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.database_manager import DatabaseManager  # noqa: E402
+
+# (查詢, 是否為單值查詢)：fetch_scalar 只量測單值查詢
+QUERIES = {
+    '資料筆數': ("SELECT COUNT(*) FROM pat_parts_all", True),
+    '全文索引': ("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log_fts'", True),
+    '快照範圍': ("SELECT MIN(週開始日) as 開始, MAX(週開始日) as 結束 FROM parts_weekly_snapshot", False),
+    '總覽統計': ("SELECT 標準狀態, SUM(數量) as 數量 FROM parts_status_cube GROUP BY 標準狀態", False),
+}
+
+
+def _median_us(call, repeat: int) -> float:
+    """重複執行並返回中位數（微秒）"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    return statistics.median(timings)
+
+
+def _fetch_frame_uncached(db_manager: DatabaseManager, sql: str):
+    """清空查詢結果快取後執行 fetch_frame（量測未命中快取的路徑）"""
+    db_manager.query_cache.clear()
+    return db_manager.fetch_frame(sql).iloc[0]
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    logging.basicConfig(level=logging.WARNING)
+
+    db_manager = DatabaseManager()
+    conn = db_manager.connection_provider.get_connection()
+
+    methods = {
+        'read_sql_query': lambda sql: pd.read_sql_query(sql, conn).iloc[0],
+        'fetch_frame': lambda sql: _fetch_frame_uncached(db_manager, sql),
+        'fetch_rows': lambda sql: db_manager.fetch_rows(sql),
+        'fetch_scalar': lambda sql: db_manager.fetch_scalar(sql),
+        'fetchone 下限': lambda sql: conn.execute(sql).fetchone(),
+    }
+
+    print(f"資料庫: {db_manager.connection_provider.db_path}，每種方式執行 {repeat} 次取中位數\n")
+    print(f"{'查詢':<8}" + "".join(f"{name:>16}" for name in methods) + f"{'節省':>10}")
+    for name, (sql, scalar) in QUERIES.items():
+        timings = {}
+        for method, call in methods.items():
+            if method == 'fetch_scalar' and not scalar:
+                timings[method] = None
+                continue
+            call(sql)  # 暖機（編譯預備語句）
+            timings[method] = _median_us(lambda: call(sql), repeat)
+        fastest = timings['fetch_scalar'] if scalar else timings['fetch_rows']
+        saved = timings['read_sql_query'] / fastest
+        print(f"{name:<8}"
+              + "".join(f"{value:>16.1f}" if value is not None else f"{'-':>16}" for value in timings.values())
+              + f"{saved:>9.1f}x")
+    print("\n（單位: 微秒；fetch_frame 每次先清空查詢結果快取；「節省」為 read_sql_query 與 "
+          "fetch_scalar（單值查詢）或 fetch_rows 的延遲比）")
+
+
+if __name__ == '__main__':
+    main()
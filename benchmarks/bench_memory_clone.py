@@ -0,0 +1,77 @@
+"""磁碟與記憶體副本的查詢延遲基準測試
+
+以同一個資料庫分別建立一般（磁碟唯讀）與記憶體副本模式的 ConnectionProvider，
+執行應用程式常用的查詢並比較延遲。「首次查詢」量測開啟新連線並執行第一次查詢
+（含 schema 解析）的時間，「重複查詢」量測暖機後的中位數。
+
+執行方式（於專案根目錄）：
+    python benchmarks/bench_memory_clone.py [資料庫路徑]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db_connection import ConnectionProvider  # noqa: E402
+from utils.derived_database import resolve_read_path  # noqa: E402
+
+QUERIES = {
+    '總數統計': "SELECT COUNT(*) FROM pat_parts_all",
+    '狀態分佈': "SELECT 配件狀態, COUNT(*) FROM kyec_parts_all GROUP BY 配件狀態",
+    '客戶統計': """
+        SELECT 客戶名稱, COUNT(*) FROM pat_parts_all
+        WHERE 客戶名稱 IS NOT NULL GROUP BY 客戶名稱 ORDER BY COUNT(*) DESC LIMIT 20
+    """,
+    '模糊搜尋': "SELECT * FROM pat_parts_all WHERE 配件名稱 LIKE '%LB%' OR 客戶名稱 LIKE '%LB%'",
+    '變更紀錄': "SELECT * FROM table_change_log ORDER BY timestamp DESC, id DESC LIMIT 50",
+}
+
+
+def _run(conn, sql: str) -> float:
+    """執行查詢並讀取全部結果，返回耗時（毫秒）"""
+    started = time.perf_counter()
+    conn.execute(sql).fetchall()
+    return (time.perf_counter() - started) * 1000
+
+
+def measure(provider: ConnectionProvider, repeat: int):
+    """返回各查詢的 (首次查詢, 重複查詢中位數) 毫秒數"""
+    results = {}
+    for name, sql in QUERIES.items():
+        started = time.perf_counter()
+        conn = provider._open({})
+        first = (time.perf_counter() - started) * 1000 + _run(conn, sql)
+        warm = statistics.median(_run(conn, sql) for _ in range(repeat))
+        conn.close()
+        results[name] = (first, warm)
+    return results
+
+
+def main():
+    db_path = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else resolve_read_path("tooling_data.db"))
+    repeat = 200
+
+    disk = ConnectionProvider(db_path)
+    memory = ConnectionProvider(db_path)
+    started = time.perf_counter()
+    memory.enable_memory_clone()
+    clone_ms = (time.perf_counter() - started) * 1000
+
+    print(f"資料庫: {db_path} ({os.path.getsize(db_path) / 1024 / 1024:.2f} MB)")
+    print(f"建立記憶體副本耗時: {clone_ms:.1f} ms，重複查詢 {repeat} 次取中位數\n")
+
+    disk_results = measure(disk, repeat)
+    memory_results = measure(memory, repeat)
+
+    print(f"{'查詢':<8}{'磁碟首次':>10}{'記憶體首次':>10}{'磁碟重複':>10}{'記憶體重複':>10}")
+    for name in QUERIES:
+        disk_first, disk_warm = disk_results[name]
+        memory_first, memory_warm = memory_results[name]
+        print(f"{name:<8}{disk_first:>10.3f}{memory_first:>12.3f}{disk_warm:>11.3f}{memory_warm:>12.3f}")
+    print("\n（單位: 毫秒；本機檔案系統的頁面快取會縮小差距，網路或容器檔案系統上差距更大）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""SQL 安全性驗證微基準測試
+
+比較舊版驗證（整段轉大寫後逐一比對十個正規表達式）與 utils.sql_safety 的
+單次詞法掃描（未快取 / 快取命中），並列出兩者判斷不同的查詢。
+
+執行方式（於專案根目錄）：
+    python benchmarks/bench_sql_safety.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.sql_safety import SqlSafetyValidator, analyze_sql  # noqa: E402
+
+QUERIES = [
+    "SELECT COUNT(*) FROM pat_parts_all",
+    "SELECT 配件狀態, COUNT(*) as 數量 FROM pat_parts_all GROUP BY 配件狀態 ORDER BY 數量 DESC;",
+    """
+    SELECT 客戶名稱, COUNT(*) as 配件數量,
+           SUM(CASE WHEN 配件狀態 IN ('Repair', '維修中') THEN 1 ELSE 0 END) as 維修中配件
+    FROM pat_parts_all
+    WHERE 客戶名稱 IS NOT NULL AND 客戶名稱 != ''
+    GROUP BY 客戶名稱
+    ORDER BY 配件數量 DESC
+    LIMIT 20
+    """,
+    """
+    SELECT 配件編號, 配件名稱, 客戶名稱, 配件狀態, 'PAT' as 來源 FROM pat_parts_all WHERE 客戶名稱 LIKE '%創%'
+    UNION ALL
+    SELECT 配件編號, 板全號, 客戶名稱, 配件狀態, 'KYEC' as 來源 FROM kyec_parts_all WHERE 客戶名稱 LIKE '%創%'
+    """,
+    "SELECT * FROM table_change_log WHERE new_values LIKE '%UPDATE -- pending%' ORDER BY timestamp DESC LIMIT 50",
+    "SELECT operation, COUNT(*) FROM table_change_log WHERE operation = 'DELETE' GROUP BY operation",
+    "SELECT 1; DROP TABLE pat_parts_all",
+    "DELETE FROM pat_parts_all",
+]
+
+
+def legacy_validate(sql: str) -> bool:
+    """重現舊版 DatabaseManager.validate_sql_query"""
+    if not sql:
+        return False
+    query_cleaned = sql.strip().rstrip(';')
+    query_upper = query_cleaned.upper()
+    if not query_upper.startswith('SELECT'):
+        return False
+    dangerous_patterns = [
+        r'\bDROP\b', r'\bDELETE\b', r'\bINSERT\b', r'\bUPDATE\b',
+        r'\bALTER\b', r'\bCREATE\b', r'\bTRUNCATE\b', r'\bEXEC\b',
+        r'\bEXECUTE\b', r'--'
+    ]
+    for pattern in dangerous_patterns:
+        if re.search(pattern, query_upper):
+            return False
+    statements = sql.split(';')
+    if len([s for s in statements if s.strip()]) > 1:
+        return False
+    if 'UNION' in query_upper:
+        union_parts = re.split(r'\bUNION\s+(?:ALL\s+)?', query_upper)
+        for part in union_parts:
+            part = part.strip()
+            if part and not part.startswith('SELECT'):
+                return False
+    return True
+
+
+def _per_call_us(func, number: int) -> float:
+    """執行整組查詢 number 次，返回每次驗證的平均微秒數"""
+    elapsed = min(timeit.repeat(lambda: [func(q) for q in QUERIES], number=number, repeat=5))
+    return elapsed / (number * len(QUERIES)) * 1e6
+
+
+def main():
+    number = 2000
+
+    # 一個問題在聊天流程中會經過 VannaConfig 與 DatabaseManager 兩次驗證，報表流程更多
+    validations_per_query = 3
+
+    legacy_us = _per_call_us(legacy_validate, number)
+    cold_us = _per_call_us(analyze_sql, number)
+
+    validator = SqlSafetyValidator()
+    for query in QUERIES:
+        validator.validate(query)
+    cached_us = _per_call_us(validator.is_safe, number)
+
+    print(f"查詢數: {len(QUERIES)}，每組重複 {number} 次")
+    print(f"舊版正規表達式驗證:      {legacy_us:8.2f} µs / 次")
+    print(f"詞法掃描（未快取）:      {cold_us:8.2f} µs / 次  ({legacy_us / cold_us:.1f}x)")
+    print(f"詞法掃描（快取命中）:    {cached_us:8.2f} µs / 次  ({legacy_us / cached_us:.1f}x)")
+
+    flow_legacy = legacy_us * validations_per_query
+    flow_new = cold_us + cached_us * (validations_per_query - 1)
+    print(f"每個查詢驗證 {validations_per_query} 次: 舊版 {flow_legacy:.2f} µs，新版 {flow_new:.2f} µs "
+          f"({flow_legacy / flow_new:.1f}x)")
+
+    print("\n判斷結果差異（舊版 → 新版）:")
+    for query in QUERIES:
+        old, new = legacy_validate(query), analyze_sql(query)
+        if old != new.is_safe:
+            print(f"  {old} → {new.is_safe}: {' '.join(query.split())[:80]}")
+
+
+if __name__ == '__main__':
+    main()
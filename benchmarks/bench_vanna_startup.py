@@ -0,0 +1,48 @@
+"""Vanna AI 引擎建立成本的基準測試
+
+模擬 Streamlit 每次重新執行腳本時取得 AI 引擎的成本：
+- 每次建立：每次重新執行都建立新的 VannaConfig（原本 MainApp 與 ChatInterface 的做法）
+- 行程共用：透過 get_vanna_engine() 取得同一個引擎，只有第一次需要建立
+
+執行方式（於專案根目錄，需安裝 vanna 與 chromadb）：
+    python benchmarks/bench_vanna_startup.py [重新執行次數]
+"""
+import os
+import sys
+import time
+import logging
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.vanna_config import VannaConfig, get_vanna_engine  # noqa: E402
+
+
+def _timed_ms(call) -> float:
+    """執行並返回耗時（毫秒）"""
+    started = time.perf_counter()
+    call()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    reruns = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    logging.basicConfig(level=logging.WARNING)
+
+    # 先建立一次，讓向量資料庫與訓練清單就緒，之後的建立成本不含首次嵌入
+    warmup_ms = _timed_ms(VannaConfig)
+
+    per_rerun = [_timed_ms(VannaConfig) for _ in range(reruns)]
+
+    first_ms = _timed_ms(get_vanna_engine)
+    shared = [_timed_ms(get_vanna_engine) for _ in range(reruns)]
+
+    print(f"首次建立（含訓練清單同步）: {warmup_ms:.1f} ms\n")
+    print(f"{'方式':<10}{'第一次(ms)':>12}{'重新執行中位數(ms)':>20}{f'{reruns} 次合計(ms)':>16}")
+    print(f"{'每次建立':<10}{per_rerun[0]:>12.1f}{statistics.median(per_rerun):>20.3f}{sum(per_rerun):>16.1f}")
+    print(f"{'行程共用':<10}{first_ms:>12.1f}{statistics.median(shared):>20.3f}{first_ms + sum(shared):>16.1f}")
+    print("\n（原本每次重新執行會建立兩個引擎：MainApp 一個、每個工作階段的 ChatInterface 一個）")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,7 @@ from typing import List, Dict, Any, Optional
 import logging
 import plotly.express as px
 import plotly.graph_objects as go
-from utils.vanna_config import VannaConfig
+from utils.vanna_config import get_vanna_engine
 
 class ChatInterface:
     """聊天介面管理類別 - 基於 Vanna AI 官方範例"""
@@ -13,12 +13,9 @@ class ChatInterface:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         
-        # 初始化 Vanna AI
-        if 'vanna_config' not in st.session_state:
-            with st.spinner("🦖 正在初始化 AI 查詢引擎..."):
-                st.session_state.vanna_config = VannaConfig()
-        
-        self.vanna_config = st.session_state.vanna_config
+        # 使用行程共用的 Vanna AI 引擎（只在第一次建立時需要等待）
+        with st.spinner("🦖 正在初始化 AI 查詢引擎..."):
+            self.vanna_config = get_vanna_engine()
         
         # 初始化 session state
         if 'messages' not in st.session_state:
@@ -29,6 +26,9 @@ class ChatInterface:
     def render_chat_interface(self, selected_suggestion: str = ""):
         """渲染聊天介面 - 參考官方範例"""
         
+        # AI 查詢引擎初始化狀態
+        self._render_engine_notice()
+        
         # 顯示聊天歷史
         self._display_chat_history()
         
@@ -40,6 +40,13 @@ class ChatInterface:
         # 查詢輸入
         self._render_query_input()
     
+    def _render_engine_notice(self):
+        """顯示 AI 查詢引擎的初始化問題（未設置 API 金鑰或初始化失敗）"""
+        if self.vanna_config.init_error:
+            st.error(f"AI 查詢引擎初始化失敗: {self.vanna_config.init_error}")
+        elif self.vanna_config.api_key_missing:
+            st.warning("⚠️ 未設置 OpenAI API 金鑰，AI 功能將受限")
+    
     def _display_chat_history(self):
         """顯示聊天歷史"""
         if not st.session_state.messages:
@@ -85,6 +92,8 @@ class ChatInterface:
         if 'sql' in message and message['sql']:
             with st.expander("🔍 查看 SQL 查詢", expanded=False):
                 st.code(message['sql'], language='sql')
+                if message.get('cache_tier'):
+                    st.caption("⚡ 沿用問題快取中的 SQL" + ("（相似問題）" if message['cache_tier'] == 'semantic' else ""))
         
         # 顯示查詢結果
         if 'data' in message and not message['data'].empty:
@@ -92,6 +101,10 @@ class ChatInterface:
             
             st.markdown(f"**📊 查詢結果：** 找到 {len(df)} 筆資料")
             
+            # 結果被截斷或查詢超時中斷時提示使用者
+            if message.get('partial'):
+                st.warning(f"⚠️ {message.get('partial_message') or '僅顯示部分查詢結果'}")
+            
             # 顯示資料表格
             st.dataframe(df, use_container_width=True, height=min(400, (len(df) + 1) * 35))
             
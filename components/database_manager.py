@@ -2,26 +2,84 @@ import sqlite3
 import pandas as pd
 import requests
 import os
+import json
+import hashlib
+import tempfile
 from datetime import datetime, timedelta
 import streamlit as st
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple, Iterator, BinaryIO
 import logging
+from utils.db_connection import get_connection_provider
+from utils.derived_database import (CHANGE_LOG_FTS_COLUMNS, DerivedDatabaseBuilder, is_derived_table,
+                                    read_build_meta, resolve_read_path)
+from utils.delta_sync import apply_changes, compute_content_checksum, get_high_water_id
+from utils.query_cache import get_query_cache, run_cached_query
+from utils.query_governor import DEFAULT_CHUNK_SIZE, get_query_governor
+from utils.helpers import check_data_quality_chunks
+from utils.batch_executor import get_batch_executor
+from utils.parts_replica import get_parts_replica
+from utils.sql_safety import get_sql_validator
+from utils.schema_catalog import get_schema_catalog
+from utils.site_registry import SITES_UNIFIED_VIEW, get_site_registry
+from utils.query_log import get_query_logger, query_log_db_path
 
 class DatabaseManager:
     """資料庫管理類別，負責資料庫連接、查詢和同步"""
     
-    def __init__(self):
-        self.db_path = "tooling_data.db"
-        self.github_db_url = "https://github.com/username/repo/raw/main/tooling_data.db"  # 需要替換為實際 URL
+    def __init__(self, db_path: str = "tooling_data.db", db_url: Optional[str] = None,
+                 delta_url: Optional[str] = None, in_memory: Optional[bool] = None):
+        self.db_path = db_path
+        # 例如 https://github.com/<owner>/<repo>/raw/main/tooling_data.db，未設定時使用本地資料庫
+        self.github_db_url = db_url or os.getenv("TOOLING_DB_URL")
+        self.checksum_url = f"{self.github_db_url}.sha256" if self.github_db_url else None
+        # 增量同步端點：GET {delta_url}?since_id=<id>&limit=<n>，返回 table_change_log 新增的紀錄
+        self.delta_url = delta_url or os.getenv("TOOLING_DB_DELTA_URL")
+        self.max_delta_changes = 5000  # 差距超過此筆數時改為完整下載
+        self.sync_state_path = f"{self.db_path}.sync.json"
         self.cache_duration = 3600  # 1小時快取
-        self.last_download_time = None
+        self.download_chunk_size = 1024 * 1024  # 1MB 串流區塊
+        # 記憶體副本模式：讀取改由共享快取的記憶體資料庫提供（適用於網路或容器檔案系統）
+        if in_memory is None:
+            in_memory = os.getenv("TOOLING_DB_IN_MEMORY", "").lower() in ("1", "true", "yes")
+        self.in_memory = in_memory
         
         # 設置日誌
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
         
+        # 同步狀態跨 session 共用（記錄於資料庫旁的 JSON 檔）
+        sync_state = self._load_sync_state()
+        self.last_download_time = self._parse_state_time(sync_state.get('last_sync'))
+        
+        # 外包廠站點資料庫（各自同步，以 ATTACH 掛載）
+        self.site_registry = get_site_registry()
+        
         # 初始化資料庫
         self._initialize_database()
+        
+        # 行程共用的唯讀連線提供者（優先讀取衍生資料庫）
+        self.connection_provider = self._get_read_provider()
+        self.query_cache = get_query_cache()
+        self.query_governor = get_query_governor()
+        self.batch_executor = get_batch_executor()
+        
+        # 查詢紀錄（每個語句的耗時、筆數與呼叫端，慢查詢附查詢計畫）
+        self.query_logger = get_query_logger()
+        try:
+            self.query_logger.configure(query_log_db_path(self.db_path))
+        except Exception as e:
+            self.logger.warning(f"查詢紀錄資料庫初始化失敗，僅保留記憶體紀錄: {str(e)}")
+    
+    def _get_read_provider(self):
+        """取得讀取用的連線提供者，記憶體副本模式下同時建立副本"""
+        provider = get_connection_provider(resolve_read_path(self.db_path))
+        provider.configure_attachments(self.site_registry.attachments(), self.site_registry.view_statements)
+        if self.in_memory:
+            try:
+                provider.enable_memory_clone()
+            except Exception as e:
+                self.logger.error(f"資料庫記憶體副本建立失敗，改為讀取檔案: {str(e)}")
+        return provider
     
     def _initialize_database(self):
         """初始化資料庫連接"""
@@ -29,62 +87,308 @@ class DatabaseManager:
             if not os.path.exists(self.db_path):
                 self._download_database()
             elif self._should_update_database():
-                self._download_database()
+                self._sync_database()
+            
+            if os.path.exists(self.db_path):
+                self._refresh_derived_database()
+            
+            for alias, site in self.site_registry.sites.items():
+                if not os.path.exists(site['db_path']) or self._should_update_database(f"{site['db_path']}.sync.json"):
+                    self._download_database(site)
         except Exception as e:
             self.logger.error(f"資料庫初始化失敗: {str(e)}")
     
-    def _should_update_database(self) -> bool:
+    def sync_site(self, alias: str) -> bool:
+        """同步單一站點的資料庫（不影響其他站點與主資料庫的連線及快取）"""
+        site = self.site_registry.get(alias)
+        if site is None:
+            self.logger.error(f"未登錄的站點: {alias}")
+            return False
+        return self._download_database(site)
+    
+    def _refresh_derived_database(self, force: bool = False) -> bool:
+        """重建衍生資料庫（統計立方體、二級索引等預先計算的資料）"""
+        try:
+            builder = DerivedDatabaseBuilder(self.db_path, snapshot_time=self.last_download_time)
+            if not force and not builder.is_stale():
+                return True
+            
+            timings = builder.build()
+            self.logger.info(f"索引建置與 ANALYZE 耗時 {timings.get('建立索引', 0):.3f} 秒")
+            
+            # 通知共用連線重新開啟
+            get_connection_provider(builder.target_path).invalidate()
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"衍生資料庫建置失敗: {str(e)}")
+            return False
+    
+    def _should_update_database(self, state_path: Optional[str] = None) -> bool:
         """檢查是否需要更新資料庫"""
-        if not self.last_download_time:
+        last_check = self._parse_state_time(self._load_sync_state(state_path).get('last_check'))
+        if not last_check:
             return True
         
-        time_diff = datetime.now() - self.last_download_time
+        time_diff = datetime.now() - last_check
         return time_diff.total_seconds() > self.cache_duration
     
-    def _download_database(self) -> bool:
-        """從 GitHub 下載最新資料庫"""
+    def _load_sync_state(self, state_path: Optional[str] = None) -> Dict[str, Any]:
+        """讀取同步狀態（ETag、Last-Modified、校驗碼與同步時間）"""
         try:
-            # 如果是本地開發環境，直接使用現有資料庫
-            if os.path.exists(self.db_path):
-                self.logger.info("使用本地資料庫文件")
-                self.last_download_time = datetime.now()
+            with open(state_path or self.sync_state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_sync_state(self, state: Dict[str, Any], state_path: Optional[str] = None):
+        """以原子性更名寫入同步狀態"""
+        state_path = state_path or self.sync_state_path
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=".sync-", suffix=".json",
+                                            dir=os.path.dirname(os.path.abspath(state_path)))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, state_path)
+        except Exception as e:
+            self.logger.warning(f"同步狀態寫入失敗: {str(e)}")
+    
+    @staticmethod
+    def _parse_state_time(value: Optional[str]) -> Optional[datetime]:
+        """解析同步狀態中的時間字串"""
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    
+    def _fetch_published_checksum(self, checksum_url: Optional[str] = None) -> str:
+        """獲取發佈端公告的 SHA-256 校驗碼（sha256sum 格式）"""
+        checksum_url = checksum_url or self.checksum_url
+        response = requests.get(checksum_url, timeout=30)
+        response.raise_for_status()
+        
+        checksum = response.text.strip().split()[0].lower() if response.text.strip() else ""
+        if len(checksum) != 64:
+            raise ValueError(f"校驗碼格式不正確: {checksum_url}")
+        return checksum
+    
+    def _verify_database_file(self, path: str):
+        """確認下載的檔案為完整的 SQLite 資料庫"""
+        conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+        try:
+            result = conn.execute("PRAGMA quick_check").fetchone()
+        finally:
+            conn.close()
+        
+        if not result or result[0] != 'ok':
+            raise ValueError(f"資料庫完整性檢查失敗: {result}")
+    
+    def _sync_database(self) -> bool:
+        """同步資料庫：優先增量同步，無法增量時退回完整下載"""
+        if self.delta_url and os.path.exists(self.db_path):
+            if self._delta_sync_database():
                 return True
+            self.logger.info("增量同步無法完成，改為完整下載")
+        return self._download_database()
+    
+    def _fetch_delta_changes(self, since_id: int) -> Dict[str, Any]:
+        """獲取指定 id 之後的變更紀錄"""
+        response = requests.get(
+            self.delta_url,
+            params={'since_id': since_id, 'limit': self.max_delta_changes + 1},
+            timeout=30
+        )
+        response.raise_for_status()
+        return response.json()
+    
+    def _delta_sync_database(self) -> bool:
+        """依 table_change_log 增量同步本地資料庫，返回是否成功"""
+        tmp_path = None
+        try:
+            state = self._load_sync_state()
+            now = datetime.now().isoformat(timespec='seconds')
             
-            # 在生產環境中從 GitHub 下載
-            self.logger.info("正在從 GitHub 下載資料庫...")
-            response = requests.get(self.github_db_url, timeout=30)
-            response.raise_for_status()
+            local_conn = get_connection_provider(self.db_path).get_connection()
+            since_id = get_high_water_id(local_conn)
             
-            with open(self.db_path, 'wb') as f:
-                f.write(response.content)
+            payload = self._fetch_delta_changes(since_id)
+            changes = sorted(payload.get('changes', []), key=lambda change: change['id'])
+            latest_id = int(payload.get('latest_id', since_id))
+            expected_checksum = payload.get('checksum')
             
-            self.last_download_time = datetime.now()
-            self.logger.info("資料庫下載成功")
+            if latest_id < since_id:
+                self.logger.warning(f"遠端變更紀錄 ({latest_id}) 落後本地 ({since_id})，需完整下載")
+                return False
+            if len(changes) > self.max_delta_changes or latest_id - since_id > self.max_delta_changes:
+                self.logger.info(f"變更差距過大 ({latest_id - since_id} 筆)，需完整下載")
+                return False
+            if not expected_checksum:
+                self.logger.warning("增量同步回應缺少校驗碼，需完整下載")
+                return False
+            
+            if not changes:
+                if compute_content_checksum(local_conn) != expected_checksum:
+                    self.logger.warning("本地資料與遠端校驗碼不符，需完整下載")
+                    return False
+                self.logger.info("資料庫已是最新版本")
+                state['last_check'] = now
+                self._save_sync_state(state)
+                return True
+            
+            # 在暫存副本上套用變更，校驗後原子替換
+            fd, tmp_path = tempfile.mkstemp(prefix=".download-", suffix=".db",
+                                            dir=os.path.dirname(os.path.abspath(self.db_path)))
+            os.close(fd)
+            tmp_conn = sqlite3.connect(tmp_path)
+            try:
+                local_conn.backup(tmp_conn)
+                with tmp_conn:
+                    applied = apply_changes(tmp_conn, changes)
+                actual_checksum = compute_content_checksum(tmp_conn)
+            finally:
+                tmp_conn.close()
+            
+            if actual_checksum != expected_checksum:
+                self.logger.warning(f"增量同步後校驗碼不符: 預期 {expected_checksum}，實際 {actual_checksum}")
+                return False
+            
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.db_path)
+            tmp_path = None
+            
+            # 通知共用連線重新開啟
+            get_connection_provider(self.db_path).invalidate()
+            
+            state.update({
+                'delta_high_water_id': changes[-1]['id'],
+                'last_sync': now,
+                'last_check': now
+            })
+            self._save_sync_state(state)
+            
+            self.last_download_time = self._parse_state_time(now)
+            self.logger.info(f"增量同步完成，套用 {applied} 筆變更 (id {since_id} → {changes[-1]['id']})")
             return True
             
         except Exception as e:
-            self.logger.error(f"資料庫下載失敗: {str(e)}")
+            self.logger.error(f"增量同步失敗: {str(e)}")
             return False
+        
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def _download_database(self, site: Optional[Dict[str, Any]] = None) -> bool:
+        """從 GitHub 下載最新資料庫（條件請求、串流寫入暫存檔、校驗後原子替換）
+
+        指定 `site` 時下載該站點的資料庫，使用站點自己的網址與同步狀態檔。
+        """
+        db_path = site['db_path'] if site else self.db_path
+        db_url = site['url'] if site else self.github_db_url
+        state_path = f"{db_path}.sync.json"
+        label = f"站點 {site['alias']} 資料庫" if site else "資料庫"
+        tmp_path = None
+        try:
+            # 未設定下載網址時（本地開發環境），直接使用現有資料庫
+            if not db_url:
+                if os.path.exists(db_path):
+                    self.logger.info(f"使用本地{label}文件")
+                    if not site:
+                        self.last_download_time = datetime.now()
+                    return True
+                self.logger.error(f"未設定{'站點下載網址' if site else ' TOOLING_DB_URL'}，且本地{label}不存在")
+                return False
+            
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            state = self._load_sync_state(state_path)
+            now = datetime.now().isoformat(timespec='seconds')
+            
+            # 條件請求：資料庫未變更時伺服器回應 304，不需重新下載
+            headers = {}
+            if os.path.exists(db_path):
+                if state.get('etag'):
+                    headers['If-None-Match'] = state['etag']
+                if state.get('last_modified'):
+                    headers['If-Modified-Since'] = state['last_modified']
+            
+            self.logger.info(f"正在從 GitHub 檢查{label}更新...")
+            with requests.get(db_url, headers=headers, stream=True, timeout=30) as response:
+                if response.status_code == 304:
+                    self.logger.info(f"{label}未變更，略過下載")
+                    state['last_check'] = now
+                    self._save_sync_state(state, state_path)
+                    return True
+                
+                response.raise_for_status()
+                expected_checksum = self._fetch_published_checksum(f"{db_url}.sha256")
+                
+                # 串流寫入同目錄的暫存檔，同時計算校驗碼
+                fd, tmp_path = tempfile.mkstemp(prefix=".download-", suffix=".db",
+                                                dir=os.path.dirname(os.path.abspath(db_path)))
+                sha256 = hashlib.sha256()
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.download_chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            sha256.update(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+                
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+            
+            actual_checksum = sha256.hexdigest()
+            if actual_checksum != expected_checksum:
+                raise ValueError(f"校驗碼不符: 預期 {expected_checksum}，實際 {actual_checksum}")
+            
+            self._verify_database_file(tmp_path)
+            os.chmod(tmp_path, 0o644)
+            
+            # 原子性替換，正在讀取舊檔的連線不受影響
+            os.replace(tmp_path, db_path)
+            tmp_path = None
+            
+            # 通知共用連線重新開啟（站點資料庫由各連線依檔案特徵自行重新掛載）
+            if not site:
+                get_connection_provider(self.db_path).invalidate()
+            
+            state.update({
+                'etag': etag,
+                'last_modified': last_modified,
+                'sha256': actual_checksum,
+                'last_sync': now,
+                'last_check': now
+            })
+            self._save_sync_state(state, state_path)
+            
+            if not site:
+                self.last_download_time = self._parse_state_time(now)
+            self.logger.info(f"{label}下載成功")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"{label}下載失敗: {str(e)}")
+            return False
+        
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
     
     def check_database_connection(self) -> bool:
         """檢查資料庫連接狀態"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            conn.close()
+            catalog = get_schema_catalog(self.connection_provider)
             
             # 檢查必要的資料表是否存在
             required_tables = ['pat_parts_all', 'kyec_parts_all', 'pat_stats_weekly', 'kyec_stats_weekly', 'table_change_log']
-            existing_tables = [table[0] for table in tables]
+            missing_tables = catalog.missing_tables(required_tables)
             
-            for table in required_tables:
-                if table not in existing_tables:
-                    self.logger.warning(f"缺少必要資料表: {table}")
-                    return False
+            for table in missing_tables:
+                self.logger.warning(f"缺少必要資料表: {table}")
             
-            return True
+            return not missing_tables
             
         except Exception as e:
             self.logger.error(f"資料庫連接檢查失敗: {str(e)}")
@@ -101,72 +405,135 @@ class DatabaseManager:
             self.logger.error(f"獲取更新時間失敗: {str(e)}")
             return None
     
-    def execute_query(self, query: str, params: tuple = None) -> pd.DataFrame:
-        """執行 SQL 查詢並返回 DataFrame"""
+    def execute_query(self, query: str, params: tuple = None,
+                      max_rows: Optional[int] = None) -> pd.DataFrame:
+        """執行 SQL 查詢並返回 DataFrame（與 fetch_frame 相同）"""
+        return self.fetch_frame(query, params, max_rows=max_rows)
+    
+    def fetch_frame(self, query: str, params: tuple = None,
+                    max_rows: Optional[int] = None) -> pd.DataFrame:
+        """執行查詢並返回 DataFrame（經過查詢結果快取，適用於需要表格結果的統計與報表查詢）
+        
+        `max_rows` 用於限制臨時查詢（如使用者輸入的 SQL）的結果筆數，所有查詢都受執行時間上限約束。
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            
-            if params:
-                df = pd.read_sql_query(query, conn, params=params)
-            else:
-                df = pd.read_sql_query(query, conn)
-            
-            conn.close()
-            return df
-            
+            return run_cached_query(self.connection_provider, query, params, max_rows=max_rows,
+                                    cache=self.query_cache, governor=self.query_governor,
+                                    site_registry=self.site_registry)
         except Exception as e:
-            self.logger.error(f"查詢執行失敗: {str(e)}")
+            self.logger.error(f"查詢執行失敗: {str(e)}，SQL: {' '.join(query.split())[:200]}")
             return pd.DataFrame()
     
+    def fetch_rows(self, query: str, params: tuple = None, max_rows: Optional[int] = None) -> List[tuple]:
+        """執行查詢並返回 tuple 列表（不建立 DataFrame，適用於單值或少量資料的內建查詢）"""
+        try:
+            conn = self.connection_provider.get_connection()
+            return self.query_governor.fetch_rows(conn, query, params, max_rows=max_rows)
+        except Exception as e:
+            self.logger.error(f"查詢執行失敗: {str(e)}，SQL: {' '.join(query.split())[:200]}")
+            return []
+    
+    def fetch_scalar(self, query: str, params: tuple = None, default: Any = None) -> Any:
+        """執行查詢並返回第一列第一欄的值（無結果或值為 NULL 時返回 default）"""
+        rows = self.fetch_rows(query, params, max_rows=1)
+        if not rows or rows[0][0] is None:
+            return default
+        return rows[0][0]
+    
+    def execute_batch(self, queries: Dict[str, Tuple[str, Optional[tuple]]]) -> Dict[str, pd.DataFrame]:
+        """並行執行一組具名的獨立查詢 {名稱: (SQL, 參數)}，返回 {名稱: DataFrame}"""
+        results = self.batch_executor.run_batch({
+            name: (lambda query=query, params=params: self.fetch_frame(query, params))
+            for name, (query, params) in queries.items()
+        })
+        return {name: df if df is not None else pd.DataFrame() for name, df in results.items()}
+    
+    def run_batch(self, tasks: Dict[str, Any]) -> Dict[str, Any]:
+        """並行執行一組具名的獨立資料取得函式 {名稱: 無參數函式}，返回 {名稱: 結果}"""
+        return self.batch_executor.run_batch(tasks)
+    
+    def get_dashboard_data(self) -> Dict[str, Any]:
+        """並行獲取首頁儀表板所需的總覽統計與狀態分佈"""
+        results = self.run_batch({
+            'overview': self.get_overview_statistics,
+            'pat_status': self.get_pat_status_distribution,
+            'kyec_status': self.get_kyec_status_distribution,
+        })
+        return {
+            'overview': results['overview'] or {},
+            'pat_status': results['pat_status'] if results['pat_status'] is not None else pd.DataFrame(),
+            'kyec_status': results['kyec_status'] if results['kyec_status'] is not None else pd.DataFrame(),
+        }
+    
+    def get_detailed_statistics(self) -> Dict[str, pd.DataFrame]:
+        """並行獲取 PAT 與 KYEC 依配件種類的詳細統計"""
+        results = self.run_batch({
+            'pat': self.get_detailed_pat_statistics,
+            'kyec': self.get_detailed_kyec_statistics,
+        })
+        return {name: df if df is not None else pd.DataFrame() for name, df in results.items()}
+    
+    def iter_query(self, query: str, params: tuple = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   max_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """以串流方式執行 SQL 查詢，逐一產生 DataFrame 區塊（不經過結果快取）
+        
+        大型結果（匯出、資料品質檢查）使用此方法，記憶體用量只與區塊大小有關。
+        查詢錯誤與超時會拋出例外，由呼叫端決定如何處理已輸出的部分。
+        """
+        conn = self.connection_provider.get_connection()
+        yield from self.query_governor.iter_chunks(conn, query, params, chunk_size=chunk_size,
+                                                   max_rows=max_rows)
+    
+    def export_query_csv(self, query: str, params: tuple = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> Optional[BinaryIO]:
+        """將查詢結果分批寫成 CSV（UTF-8 BOM），返回以二進位模式開啟的暫存檔（可直接傳給 st.download_button）"""
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as tmp:
+                tmp_path = tmp.name
+                tmp.write('\ufeff'.encode('utf-8'))
+                header = True
+                for chunk in self.iter_query(query, params, chunk_size=chunk_size):
+                    tmp.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+                    header = False
+            
+            reader = open(tmp_path, 'rb')
+            # 已開啟的檔案在刪除路徑後仍可讀取；無法刪除（例如 Windows）時保留到系統清理暫存目錄
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return reader
+            
+        except Exception as e:
+            self.logger.error(f"CSV 匯出失敗: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+    
     
     def get_overview_statistics(self) -> Dict[str, int]:
         """獲取總覽統計資訊"""
         try:
-            stats = {}
-            
-            # 總配件數
-            total_query = """
-                SELECT COUNT(*) as count FROM (
-                    SELECT 配件編號 FROM pat_parts_all
-                    UNION ALL
-                    SELECT 配件編號 FROM kyec_parts_all
-                )
-            """
-            total_result = self.execute_query(total_query)
-            stats['total_parts'] = total_result['count'].iloc[0] if not total_result.empty else 0
-            
-            # 維修中配件
-            repair_query = """
-                SELECT COUNT(*) as count FROM (
-                    SELECT 配件編號 FROM pat_parts_all WHERE 配件狀態 IN ('OUT_REPAIR', 'REPAIR')
-                    UNION ALL
-                    SELECT 配件編號 FROM kyec_parts_all WHERE 配件狀態 IN ('客戶維修', '廠內維修')
-                )
-            """
-            repair_result = self.execute_query(repair_query)
-            stats['repair_parts'] = repair_result['count'].iloc[0] if not repair_result.empty else 0
-            
-            # 正常生產配件
-            normal_query = """
-                SELECT COUNT(*) as count FROM (
-                    SELECT 配件編號 FROM pat_parts_all WHERE 配件狀態 = 'PRODUCTION'
-                    UNION ALL
-                    SELECT 配件編號 FROM kyec_parts_all WHERE 配件狀態 = '正常生產'
-                )
-            """
-            normal_result = self.execute_query(normal_query)
-            stats['normal_parts'] = normal_result['count'].iloc[0] if not normal_result.empty else 0
-            
-            # 客戶借出配件
-            borrowed_query = """
-                SELECT COUNT(*) as count FROM (
-                    SELECT 配件編號 FROM pat_parts_all WHERE 配件狀態 = 'BORROW'
-                    UNION ALL
-                    SELECT 配件編號 FROM kyec_parts_all WHERE 配件狀態 = '客戶借出'
-                )
+            # 優先由記憶體副本計算
+            replica = get_parts_replica(self.connection_provider)
+            if replica is not None:
+                return replica.overview_statistics()
+            
+            # 由統計立方體一次取得各標準狀態的數量
+            query = """
+                SELECT 標準狀態, SUM(數量) as 數量
+                FROM parts_status_cube
+                GROUP BY 標準狀態
             """
-            borrowed_result = self.execute_query(borrowed_query)
-            stats['borrowed_parts'] = borrowed_result['count'].iloc[0] if not borrowed_result.empty else 0
+            counts = dict(self.fetch_rows(query))
+            
+            stats = {
+                'total_parts': int(sum(counts.values())),
+                'repair_parts': int(counts.get('廠內維修', 0) + counts.get('客戶維修', 0)),
+                'normal_parts': int(counts.get('正常生產', 0)),
+                'borrowed_parts': int(counts.get('客戶借出', 0))
+            }
             
             return stats
             
@@ -174,120 +541,169 @@ class DatabaseManager:
             self.logger.error(f"總覽統計獲取失敗: {str(e)}")
             return {}
     
-    def get_pat_status_distribution(self) -> pd.DataFrame:
-        """獲取 PAT 配件狀態分佈"""
+    def _get_status_distribution(self, source: str) -> pd.DataFrame:
+        """獲取指定來源的配件狀態分佈"""
+        replica = get_parts_replica(self.connection_provider)
+        if replica is not None:
+            return replica.status_distribution(source)
+        
         query = """
-            SELECT 配件狀態, COUNT(*) as 數量
-            FROM pat_parts_all
+            SELECT 配件狀態, SUM(數量) as 數量
+            FROM parts_status_cube
+            WHERE 來源 = ?
             GROUP BY 配件狀態
             ORDER BY 數量 DESC
         """
-        return self.execute_query(query)
+        return self.fetch_frame(query, (source,))
+    
+    def get_pat_status_distribution(self) -> pd.DataFrame:
+        """獲取 PAT 配件狀態分佈"""
+        return self._get_status_distribution('PAT')
     
     def get_kyec_status_distribution(self) -> pd.DataFrame:
         """獲取 KYEC 配件狀態分佈"""
-        query = """
-            SELECT 配件狀態, COUNT(*) as 數量
-            FROM kyec_parts_all
-            GROUP BY 配件狀態
-            ORDER BY 數量 DESC
-        """
-        return self.execute_query(query)
+        return self._get_status_distribution('KYEC')
+    
+    def _snapshot_range_condition(self, start_date=None, end_date=None) -> Tuple[str, List[Any]]:
+        """建立週快照的日期範圍條件（包含開始日期所在的那一週）"""
+        conditions = []
+        params = []
+        
+        if start_date is not None:
+            week_start = start_date - timedelta(days=start_date.weekday())
+            conditions.append("週開始日 >= ?")
+            params.append(week_start.strftime("%Y-%m-%d"))
+        if end_date is not None:
+            conditions.append("週開始日 <= ?")
+            params.append(end_date.strftime("%Y-%m-%d"))
+        
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where_clause, params
     
-    def get_status_trend_data(self) -> pd.DataFrame:
-        """獲取狀態趨勢資料"""
+    def get_status_trend_data(self, start_date=None, end_date=None) -> pd.DataFrame:
+        """獲取狀態趨勢資料（每週各狀態數量，由週統計快照計算）"""
         try:
-            # 從週統計表獲取趨勢資料
-            query = """
-                SELECT 每周狀態 as 日期, '正常生產' as 狀態, SUM(正常生產) as 數量
-                FROM pat_stats_weekly
-                GROUP BY 每周狀態
-                UNION ALL
-                SELECT 每周狀態 as 日期, '廠內維修' as 狀態, SUM(廠內維修) as 數量
-                FROM pat_stats_weekly
-                GROUP BY 每周狀態
-                UNION ALL
-                SELECT 每周狀態 as 日期, '客戶維修' as 狀態, SUM(客戶維修) as 數量
-                FROM pat_stats_weekly
-                GROUP BY 每周狀態
-                ORDER BY 日期
+            where_clause, params = self._snapshot_range_condition(start_date, end_date)
+            
+            replica = get_parts_replica(self.connection_provider)
+            if replica is not None:
+                start_week = params[0] if start_date is not None else None
+                end_week = params[-1] if end_date is not None else None
+                return replica.weekly_trend(start_week, end_week)
+            
+            query = f"""
+                SELECT 
+                    週開始日 as 日期,
+                    SUM(總數量) as 總數量,
+                    SUM(正常生產) as 正常生產,
+                    SUM(廠內維修) as 廠內維修,
+                    SUM(客戶維修) as 客戶維修,
+                    SUM(客戶借出) as 客戶借出
+                FROM parts_weekly_snapshot
+                {where_clause}
+                GROUP BY 週開始日
+                ORDER BY 週開始日
             """
-            return self.execute_query(query)
+            return self.fetch_frame(query, tuple(params) if params else None)
         except Exception as e:
             self.logger.error(f"趨勢資料獲取失敗: {str(e)}")
             return pd.DataFrame()
     
-    def get_detailed_pat_statistics(self) -> pd.DataFrame:
-        """獲取 PAT 詳細統計"""
+    def get_snapshot_date_range(self) -> Tuple[Optional[str], Optional[str]]:
+        """獲取週統計快照涵蓋的日期範圍 (最早週開始日, 最新週開始日)"""
+        try:
+            rows = self.fetch_rows(
+                "SELECT MIN(週開始日) as 開始, MAX(週開始日) as 結束 FROM parts_weekly_snapshot"
+            )
+            if not rows:
+                return None, None
+            return rows[0]
+        except Exception as e:
+            self.logger.error(f"快照日期範圍獲取失敗: {str(e)}")
+            return None, None
+    
+    def _get_detailed_statistics(self, source: str) -> pd.DataFrame:
+        """獲取指定來源依配件種類的詳細統計"""
+        replica = get_parts_replica(self.connection_provider)
+        if replica is not None:
+            return replica.detailed_statistics(source)
+        
         query = """
             SELECT 
                 配件種類,
-                COUNT(*) as 總數量,
-                SUM(CASE WHEN 配件狀態 = 'PRODUCTION' THEN 1 ELSE 0 END) as 正常生產,
-                SUM(CASE WHEN 配件狀態 = 'REPAIR' THEN 1 ELSE 0 END) as 廠內維修,
-                SUM(CASE WHEN 配件狀態 = 'OUT_REPAIR' THEN 1 ELSE 0 END) as 客戶維修,
-                SUM(CASE WHEN 配件狀態 = 'BORROW' THEN 1 ELSE 0 END) as 客戶借出
-            FROM pat_parts_all
+                SUM(數量) as 總數量,
+                SUM(CASE WHEN 標準狀態 = '正常生產' THEN 數量 ELSE 0 END) as 正常生產,
+                SUM(CASE WHEN 標準狀態 = '廠內維修' THEN 數量 ELSE 0 END) as 廠內維修,
+                SUM(CASE WHEN 標準狀態 = '客戶維修' THEN 數量 ELSE 0 END) as 客戶維修,
+                SUM(CASE WHEN 標準狀態 = '客戶借出' THEN 數量 ELSE 0 END) as 客戶借出
+            FROM parts_status_cube
+            WHERE 來源 = ?
             GROUP BY 配件種類
             ORDER BY 總數量 DESC
         """
-        return self.execute_query(query)
+        return self.fetch_frame(query, (source,))
+    
+    def get_detailed_pat_statistics(self) -> pd.DataFrame:
+        """獲取 PAT 詳細統計"""
+        return self._get_detailed_statistics('PAT')
     
     def get_detailed_kyec_statistics(self) -> pd.DataFrame:
         """獲取 KYEC 詳細統計"""
-        query = """
-            SELECT 
-                配件種類,
-                COUNT(*) as 總數量,
-                SUM(CASE WHEN 配件狀態 = '正常生產' THEN 1 ELSE 0 END) as 正常生產,
-                SUM(CASE WHEN 配件狀態 = '廠內維修' THEN 1 ELSE 0 END) as 廠內維修,
-                SUM(CASE WHEN 配件狀態 = '客戶維修' THEN 1 ELSE 0 END) as 客戶維修,
-                SUM(CASE WHEN 配件狀態 = '客戶借出' THEN 1 ELSE 0 END) as 客戶借出
-            FROM kyec_parts_all
-            GROUP BY 配件種類
-            ORDER BY 總數量 DESC
-        """
-        return self.execute_query(query)
+        return self._get_detailed_statistics('KYEC')
     
     def get_customer_statistics(self) -> pd.DataFrame:
         """獲取客戶統計資料"""
+        replica = get_parts_replica(self.connection_provider)
+        if replica is not None:
+            return replica.customer_statistics()
+        
         query = """
             SELECT 
                 客戶名稱,
-                COUNT(*) as 配件數量,
-                SUM(CASE WHEN 配件狀態 LIKE '%維修%' THEN 1 ELSE 0 END) as 維修中配件,
-                SUM(CASE WHEN 配件狀態 LIKE '%借出%' THEN 1 ELSE 0 END) as 借出配件
-            FROM (
-                SELECT 客戶名稱, 配件狀態 FROM pat_parts_all
-                UNION ALL
-                SELECT 客戶名稱, 配件狀態 FROM kyec_parts_all
-            )
+                SUM(數量) as 配件數量,
+                SUM(CASE WHEN 標準狀態 IN ('廠內維修', '客戶維修') THEN 數量 ELSE 0 END) as 維修中配件,
+                SUM(CASE WHEN 標準狀態 = '客戶借出' THEN 數量 ELSE 0 END) as 借出配件
+            FROM parts_status_cube
             GROUP BY 客戶名稱
             ORDER BY 配件數量 DESC
         """
-        return self.execute_query(query)
+        return self.fetch_frame(query)
+    
+    def get_site_statistics(self) -> pd.DataFrame:
+        """獲取各外包廠站點的配件狀態統計（跨站點統一檢視表）"""
+        if not self.site_registry:
+            return pd.DataFrame()
+        
+        query = f"""
+            SELECT 
+                站點代號,
+                COUNT(*) as 總數量,
+                SUM(CASE WHEN 標準狀態 = '正常生產' THEN 1 ELSE 0 END) as 正常生產,
+                SUM(CASE WHEN 標準狀態 = '廠內維修' THEN 1 ELSE 0 END) as 廠內維修,
+                SUM(CASE WHEN 標準狀態 = '客戶維修' THEN 1 ELSE 0 END) as 客戶維修,
+                SUM(CASE WHEN 標準狀態 = '客戶借出' THEN 1 ELSE 0 END) as 客戶借出
+            FROM {SITES_UNIFIED_VIEW}
+            GROUP BY 站點代號
+            ORDER BY 總數量 DESC
+        """
+        df = self.fetch_frame(query)
+        if not df.empty:
+            df.insert(1, '站點名稱', df['站點代號'].map(lambda alias: self.site_registry.get(alias)['name']))
+        return df
     
     def get_trend_analysis(self, start_date: datetime, end_date: datetime) -> pd.DataFrame:
-        """獲取指定時間範圍的趨勢分析"""
+        """獲取指定時間範圍的趨勢分析（依週開始日範圍查詢週統計快照）"""
         try:
-            # 由於週統計表的日期格式可能不標準，這裡提供一個基本的查詢
-            query = """
-                SELECT 
-                    每周狀態 as 日期,
-                    '正常生產' as 狀態,
-                    SUM(正常生產) as 數量
-                FROM pat_stats_weekly
-                GROUP BY 每周狀態
-                UNION ALL
-                SELECT 
-                    每周狀態 as 日期,
-                    '廠內維修' as 狀態,
-                    SUM(廠內維修) as 數量
-                FROM pat_stats_weekly
-                GROUP BY 每周狀態
-                ORDER BY 日期
-            """
-            return self.execute_query(query)
+            trend = self.get_status_trend_data(start_date, end_date)
+            if trend.empty:
+                return pd.DataFrame()
+            
+            return trend.melt(
+                id_vars='日期',
+                value_vars=['正常生產', '廠內維修', '客戶維修', '客戶借出'],
+                var_name='狀態',
+                value_name='數量'
+            )
         except Exception as e:
             self.logger.error(f"趨勢分析獲取失敗: {str(e)}")
             return pd.DataFrame()
@@ -304,43 +720,89 @@ class DatabaseManager:
             WHERE 維修天數 IS NOT NULL AND 維修天數 > 0
             ORDER BY 維修天數 DESC
         """
-        return self.execute_query(query)
+        return self.fetch_frame(query)
+    
+    def _has_change_log_fts(self) -> bool:
+        """檢查衍生資料庫是否有變更紀錄全文索引"""
+        return self.fetch_scalar(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log_fts'", default=0
+        ) == 1
+    
+    def _build_change_log_filters(self, table_filter: str, operation_filter: str,
+                                  days_filter: str) -> Tuple[List[str], List[Any]]:
+        """建立變更紀錄的篩選條件（可使用 table_name / operation / timestamp 索引）"""
+        conditions = []
+        params = []
+        
+        # 資料表篩選
+        if table_filter != "全部":
+            conditions.append("table_name = ?")
+            params.append(table_filter)
+        
+        # 操作類型篩選（資料中的操作類型大小寫不一）
+        if operation_filter != "全部":
+            conditions.append("operation IN (?, ?)")
+            params.extend([operation_filter.upper(), operation_filter.lower()])
+        
+        # 時間範圍篩選（ISO 格式時間戳可直接比較字串）
+        if days_filter != "全部":
+            days_map = {"最近7天": 7, "最近30天": 30, "最近90天": 90}
+            if days_filter in days_map:
+                days = days_map[days_filter]
+                cutoff_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+                conditions.append("timestamp >= ?")
+                params.append(cutoff_date)
+        
+        return conditions, params
+    
+    def _change_log_match_expression(self, search_term: str) -> Optional[str]:
+        """全文索引的 MATCH 表達式（trigram 需要至少 3 個字元；無法使用全文索引時返回 None）"""
+        if not search_term or len(search_term) < 3 or not self._has_change_log_fts():
+            return None
+        return '"' + search_term.replace('"', '""') + '"'
+    
+    def _build_change_log_search(self, search_term: str) -> Tuple[Optional[str], List[Any]]:
+        """建立變更紀錄的搜尋條件（可使用全文索引時以 MATCH 篩選，否則使用 LIKE）"""
+        if not search_term:
+            return None, []
+        
+        match_expression = self._change_log_match_expression(search_term)
+        if match_expression:
+            return "id IN (SELECT rowid FROM change_log_fts WHERE change_log_fts MATCH ?)", [match_expression]
+        
+        # 與全文索引搜尋相同的欄位
+        search_pattern = f"%{search_term}%"
+        condition = " OR ".join(f"{column} LIKE ?" for column in CHANGE_LOG_FTS_COLUMNS)
+        return f"({condition})", [search_pattern] * len(CHANGE_LOG_FTS_COLUMNS)
     
     def get_change_logs(self, table_filter: str = "全部", operation_filter: str = "全部", 
                        days_filter: str = "全部", search_term: str = "") -> pd.DataFrame:
-        """獲取變更紀錄"""
+        """獲取變更紀錄（有搜尋條件時以全文索引依相關度排序）"""
         try:
-            query = "SELECT * FROM table_change_log WHERE 1=1"
-            params = []
-            
-            # 資料表篩選
-            if table_filter != "全部":
-                query += " AND table_name = ?"
-                params.append(table_filter)
-            
-            # 操作類型篩選
-            if operation_filter != "全部":
-                query += " AND operation = ?"
-                params.append(operation_filter)
-            
-            # 時間範圍篩選
-            if days_filter != "全部":
-                days_map = {"最近7天": 7, "最近30天": 30, "最近90天": 90}
-                if days_filter in days_map:
-                    days = days_map[days_filter]
-                    cutoff_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-                    query += " AND DATE(timestamp) >= ?"
-                    params.append(cutoff_date)
-            
-            # 搜尋條件
-            if search_term:
-                query += " AND (row_key LIKE ? OR old_value LIKE ? OR new_value LIKE ?)"
-                search_pattern = f"%{search_term}%"
-                params.extend([search_pattern, search_pattern, search_pattern])
-            
-            query += " ORDER BY timestamp DESC LIMIT 1000"
-            
-            df = self.execute_query(query, tuple(params) if params else None)
+            conditions, params = self._build_change_log_filters(table_filter, operation_filter, days_filter)
+            where_clause = "".join(f" AND {condition}" for condition in conditions)
+            
+            match_expression = self._change_log_match_expression(search_term)
+            if match_expression:
+                query = f"""
+                    SELECT l.* FROM table_change_log l
+                    JOIN (
+                        SELECT rowid, rank FROM change_log_fts WHERE change_log_fts MATCH ?
+                    ) f ON f.rowid = l.id
+                    WHERE 1=1{where_clause}
+                    ORDER BY f.rank, l.timestamp DESC
+                    LIMIT 1000
+                """
+                params.insert(0, match_expression)
+            else:
+                query = f"SELECT * FROM table_change_log WHERE 1=1{where_clause}"
+                search_condition, search_params = self._build_change_log_search(search_term)
+                if search_condition:
+                    query += f" AND {search_condition}"
+                    params.extend(search_params)
+                query += " ORDER BY timestamp DESC LIMIT 1000"
+            
+            df = self.fetch_frame(query, tuple(params) if params else None)
             
             # 轉換時間戳格式
             if not df.empty and 'timestamp' in df.columns:
@@ -352,24 +814,114 @@ class DatabaseManager:
             self.logger.error(f"變更紀錄獲取失敗: {str(e)}")
             return pd.DataFrame()
     
-    def get_available_columns(self, tables: List[str]) -> List[str]:
-        """獲取指定資料表的可用欄位"""
+    def get_change_logs_page(self, table_filter: str = "全部", operation_filter: str = "全部",
+                             days_filter: str = "全部", search_term: str = "",
+                             cursor: Optional[Tuple[str, int]] = None,
+                             page_size: int = 50) -> Tuple[pd.DataFrame, Optional[Tuple[str, int]]]:
+        """以 (timestamp, id) 游標分頁獲取變更紀錄，返回 (本頁資料, 下一頁游標)
+
+        有搜尋條件時同樣依時間由新到舊排列（游標分頁需要固定的排序鍵），
+        需要依相關度排序時使用 get_change_logs。
+        """
         try:
-            columns = set()
+            conditions, params = self._build_change_log_filters(table_filter, operation_filter, days_filter)
+            
+            search_condition, search_params = self._build_change_log_search(search_term)
+            if search_condition:
+                conditions.append(search_condition)
+                params.extend(search_params)
+            
+            # 從上一頁最後一筆之後繼續（時間由新到舊，row value 比較可直接沿索引掃描）
+            if cursor:
+                conditions.append("(timestamp, id) < (?, ?)")
+                params.extend(cursor)
+            
+            where_clause = "".join(f" AND {condition}" for condition in conditions)
+            query = f"""
+                SELECT * FROM table_change_log
+                WHERE timestamp IS NOT NULL{where_clause}
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            """
+            params.append(page_size + 1)
             
-            for table in tables:
-                query = f"PRAGMA table_info({table})"
-                result = self.execute_query(query)
-                if not result.empty:
-                    table_columns = result['name'].tolist()
-                    columns.update(table_columns)
+            df = self.fetch_frame(query, tuple(params))
             
-            return sorted(list(columns))
+            # 多取一筆以判斷是否還有下一頁
+            next_cursor = None
+            if len(df) > page_size:
+                df = df.iloc[:page_size]
+                last_row = df.iloc[-1]
+                next_cursor = (last_row['timestamp'], int(last_row['id']))
+            
+            if not df.empty and 'timestamp' in df.columns:
+                df = df.copy()
+                df['timestamp'] = pd.to_datetime(df['timestamp'])
+            
+            return df, next_cursor
+            
+        except Exception as e:
+            self.logger.error(f"變更紀錄分頁獲取失敗: {str(e)}")
+            return pd.DataFrame(), None
+    
+    def get_change_log_summary(self, table_filter: str = "全部", operation_filter: str = "全部",
+                               days_filter: str = "全部", search_term: str = "") -> Dict[str, Any]:
+        """獲取符合條件的變更紀錄統計（總數、各操作類型數量與每日變更次數）"""
+        try:
+            conditions, params = self._build_change_log_filters(table_filter, operation_filter, days_filter)
+            
+            search_condition, search_params = self._build_change_log_search(search_term)
+            if search_condition:
+                conditions.append(search_condition)
+                params.extend(search_params)
+            
+            where_clause = "".join(f" AND {condition}" for condition in conditions)
+            query = f"""
+                SELECT SUBSTR(timestamp, 1, 10) as 日期, UPPER(operation) as 操作類型, COUNT(*) as 變更次數
+                FROM table_change_log
+                WHERE timestamp IS NOT NULL{where_clause}
+                GROUP BY 日期, 操作類型
+                ORDER BY 日期
+            """
+            result = self.fetch_frame(query, tuple(params) if params else None)
+            
+            if result.empty:
+                return {'total': 0, 'operations': {}, 'daily': pd.DataFrame(columns=['日期', '變更次數'])}
+            
+            daily = result.groupby('日期', as_index=False)['變更次數'].sum()
+            daily['日期'] = pd.to_datetime(daily['日期'])
+            
+            return {
+                'total': int(result['變更次數'].sum()),
+                'operations': result.groupby('操作類型')['變更次數'].sum().astype(int).to_dict(),
+                'daily': daily
+            }
+            
+        except Exception as e:
+            self.logger.error(f"變更紀錄統計獲取失敗: {str(e)}")
+            return {'total': 0, 'operations': {}, 'daily': pd.DataFrame(columns=['日期', '變更次數'])}
+    
+    def get_available_columns(self, tables: List[str]) -> List[str]:
+        """獲取指定資料表的可用欄位"""
+        try:
+            return get_schema_catalog(self.connection_provider).available_columns(tables)
             
         except Exception as e:
             self.logger.error(f"欄位資訊獲取失敗: {str(e)}")
             return []
     
+    def check_table_quality(self, table: str) -> Dict[str, Any]:
+        """以串流方式檢查整個資料表的資料品質"""
+        try:
+            if not get_schema_catalog(self.connection_provider).has_table(table):
+                raise ValueError(f"資料表不存在: {table}")
+            
+            return check_data_quality_chunks(self.iter_query(f'SELECT * FROM "{table}"'))
+            
+        except Exception as e:
+            self.logger.error(f"資料品質檢查失敗: {str(e)}")
+            return {'status': 'error', 'message': str(e)}
+    
     def get_database_info(self) -> Dict[str, Any]:
         """獲取資料庫資訊"""
         try:
@@ -381,14 +933,22 @@ class DatabaseManager:
                 size_mb = round(size_bytes / (1024 * 1024), 2)
                 info['資料庫大小'] = f"{size_mb} MB"
             
-            # 資料表數量
-            tables_query = "SELECT COUNT(*) as count FROM sqlite_master WHERE type='table'"
-            tables_result = self.execute_query(tables_query)
-            info['資料表數量'] = tables_result['count'].iloc[0] if not tables_result.empty else 0
+            if self.connection_provider.in_memory:
+                info['讀取模式'] = "記憶體副本"
+            
+            # 資料表數量（不含衍生資料庫新增的資料表與 SQLite 內部資料表）
+            info['資料表數量'] = len([name for name in get_schema_catalog(self.connection_provider).table_names()
+                                 if not is_derived_table(name) and not name.startswith('sqlite_')])
             
             # 最後修改時間
             info['最後修改時間'] = self.get_last_update_time()
             
+            # 衍生資料庫建置資訊
+            build_meta = read_build_meta(self.connection_provider.get_connection())
+            if build_meta['built_at']:
+                info['衍生資料庫建置時間'] = build_meta['built_at']
+                info['索引建置耗時'] = f"{build_meta['timings'].get('建立索引', 0):.3f} 秒"
+            
             return info
             
         except Exception as e:
@@ -402,60 +962,36 @@ class DatabaseManager:
         return "未知"
     
     def manual_sync(self) -> bool:
-        """手動同步資料庫"""
+        """手動同步資料庫（主資料庫與各站點各自同步，任一失敗不影響其他資料庫）"""
         try:
-            return self._download_database()
+            main_synced = self._sync_database() and self._refresh_derived_database(force=True)
+            if not main_synced:
+                self.logger.error("主資料庫同步失敗，仍繼續同步各站點資料庫")
+            
+            sites_synced = [self._download_database(site) for site in self.site_registry.sites.values()]
+            self.connection_provider = self._get_read_provider()
+            return main_synced and all(sites_synced)
         except Exception as e:
             self.logger.error(f"手動同步失敗: {str(e)}")
             return False
     
     def validate_sql_query(self, query: str) -> bool:
-        """驗證 SQL 查詢的安全性"""
-        if not query:
-            return False
-        
-        # 移除結尾的分號（這是正常的）
-        query_cleaned = query.strip().rstrip(';')
-        query_upper = query_cleaned.upper()
-        
-        # 只允許 SELECT 查詢
-        if not query_upper.startswith('SELECT'):
-            return False
-        
-        # 使用正則表達式檢查危險關鍵字（但允許在字串中出現）
-        import re
-        dangerous_patterns = [
-            r'\bDROP\b', r'\bDELETE\b', r'\bINSERT\b', r'\bUPDATE\b',
-            r'\bALTER\b', r'\bCREATE\b', r'\bTRUNCATE\b', r'\bEXEC\b',
-            r'\bEXECUTE\b', r'--'
-        ]
-        
-        for pattern in dangerous_patterns:
-            if re.search(pattern, query_upper):
-                return False
-        
-        # 檢查是否有多個語句（用分號分隔）
-        statements = query.split(';')
-        if len([s for s in statements if s.strip()]) > 1:
-            return False
-        
-        # UNION 查詢是允許的，但要檢查是否安全
-        if 'UNION' in query_upper:
-            # 確保 UNION 後面也是 SELECT
-            union_parts = re.split(r'\bUNION\s+(?:ALL\s+)?', query_upper)
-            for part in union_parts:
-                part = part.strip()
-                if part and not part.startswith('SELECT'):
-                    return False
-        
-        return True
+        """驗證 SQL 查詢的安全性（只允許單一唯讀查詢）"""
+        verdict = get_sql_validator().validate(query)
+        if not verdict.is_safe:
+            self.logger.warning(f"SQL 安全性驗證失敗: {verdict.reason}")
+        return verdict.is_safe
     
     def execute_safe_query(self, query: str) -> pd.DataFrame:
-        """執行安全的查詢（僅允許 SELECT）"""
+        """執行安全的查詢（僅允許以 SELECT / WITH 開始的單一唯讀查詢，由 SQL 安全性驗證判斷）"""
         if not self.validate_sql_query(query):
             raise ValueError("查詢包含不安全的 SQL 語句")
         
-        if not query.strip().upper().startswith('SELECT'):
-            raise ValueError("僅允許 SELECT 查詢")
+        return self.fetch_frame(query, max_rows=self.query_governor.max_rows)
+    
+    def iter_safe_query(self, query: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+        """以串流方式執行安全的查詢（與 execute_safe_query 相同的驗證），用於匯出完整結果"""
+        if not self.validate_sql_query(query):
+            raise ValueError("查詢包含不安全的 SQL 語句")
         
-        return self.execute_query(query)
\ No newline at end of file
+        yield from self.iter_query(query, chunk_size=chunk_size)
\ No newline at end of file
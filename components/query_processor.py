@@ -3,29 +3,41 @@ import sqlite3
 from typing import Dict, List, Any, Optional
 import logging
 from datetime import datetime, timedelta
+from components.database_manager import DatabaseManager
+from utils.query_cache import get_query_cache, run_cached_query
+from utils.query_governor import get_query_governor
+from utils.parts_replica import get_parts_replica
+from utils.sql_safety import get_sql_validator
 
 class QueryProcessor:
     """查詢處理器 - 處理複雜查詢和資料分析"""
     
-    def __init__(self):
+    def __init__(self, db_manager: Optional[DatabaseManager] = None):
         self.logger = logging.getLogger(__name__)
-        self.db_path = "tooling_data.db"
+        # 與 DatabaseManager 共用讀取連線（衍生資料庫與站點掛載由 DatabaseManager 維護）
+        self.db_manager = db_manager or DatabaseManager()
+        self.db_path = self.db_manager.db_path
+        self.query_cache = get_query_cache()
+        self.query_governor = get_query_governor()
+        self.site_registry = self.db_manager.site_registry
     
-    def execute_query(self, sql: str, params: tuple = None) -> pd.DataFrame:
-        """執行 SQL 查詢"""
+    @property
+    def connection_provider(self):
+        """目前的讀取連線提供者（同步後 DatabaseManager 會重新取得）"""
+        return self.db_manager.connection_provider
+    
+    def execute_query(self, sql: str, params: tuple = None,
+                      max_rows: Optional[int] = None) -> pd.DataFrame:
+        """執行 SQL 查詢
+        
+        `max_rows` 用於限制臨時查詢（如使用者輸入的 SQL）的結果筆數，所有查詢都受執行時間上限約束。
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            
-            if params:
-                df = pd.read_sql_query(sql, conn, params=params)
-            else:
-                df = pd.read_sql_query(sql, conn)
-            
-            conn.close()
-            return df
-            
+            return run_cached_query(self.connection_provider, sql, params, max_rows=max_rows,
+                                    cache=self.query_cache, governor=self.query_governor,
+                                    site_registry=self.site_registry)
         except Exception as e:
-            self.logger.error(f"查詢執行失敗: {str(e)}")
+            self.logger.error(f"查詢執行失敗: {str(e)}，SQL: {' '.join(sql.split())[:200]}")
             return pd.DataFrame()
     
     def get_parts_status_analysis(self) -> Dict[str, pd.DataFrame]:
@@ -33,41 +45,27 @@ class QueryProcessor:
         try:
             analysis = {}
             
-            # PAT 配件狀態統計
-            pat_query = """
-                SELECT 
-                    配件狀態,
-                    COUNT(*) as 數量,
-                    ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM pat_parts_all), 2) as 百分比
-                FROM pat_parts_all
-                GROUP BY 配件狀態
-                ORDER BY 數量 DESC
-            """
-            analysis['pat_status'] = self.execute_query(pat_query)
-            
-            # KYEC 配件狀態統計
-            kyec_query = """
+            # PAT / KYEC 配件狀態統計（由統計立方體切片）
+            source_query = """
                 SELECT 
                     配件狀態,
-                    COUNT(*) as 數量,
-                    ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM kyec_parts_all), 2) as 百分比
-                FROM kyec_parts_all
+                    SUM(數量) as 數量,
+                    ROUND(SUM(數量) * 100.0 / (SELECT SUM(數量) FROM parts_status_cube WHERE 來源 = ?), 2) as 百分比
+                FROM parts_status_cube
+                WHERE 來源 = ?
                 GROUP BY 配件狀態
                 ORDER BY 數量 DESC
             """
-            analysis['kyec_status'] = self.execute_query(kyec_query)
+            analysis['pat_status'] = self.execute_query(source_query, ('PAT', 'PAT'))
+            analysis['kyec_status'] = self.execute_query(source_query, ('KYEC', 'KYEC'))
             
             # 綜合狀態統計
             combined_query = """
                 SELECT 
                     配件狀態,
-                    COUNT(*) as 數量,
+                    SUM(數量) as 數量,
                     '綜合' as 來源
-                FROM (
-                    SELECT 配件狀態 FROM pat_parts_all
-                    UNION ALL
-                    SELECT 配件狀態 FROM kyec_parts_all
-                )
+                FROM parts_status_cube
                 GROUP BY 配件狀態
                 ORDER BY 數量 DESC
             """
@@ -84,19 +82,16 @@ class QueryProcessor:
         try:
             analysis = {}
             
-            # 客戶配件統計
+            # 客戶配件統計（由統一配件資料表的狀態旗標計算）
             customer_query = """
                 SELECT 
                     客戶名稱,
                     COUNT(*) as 配件總數,
-                    SUM(CASE WHEN 配件狀態 LIKE '%維修%' OR 配件狀態 LIKE '%REPAIR%' THEN 1 ELSE 0 END) as 維修中配件,
-                    SUM(CASE WHEN 配件狀態 LIKE '%借出%' OR 配件狀態 = 'BORROW' THEN 1 ELSE 0 END) as 借出配件,
-                    SUM(CASE WHEN 配件狀態 = '正常生產' OR 配件狀態 = 'PRODUCTION' THEN 1 ELSE 0 END) as 正常配件
-                FROM (
-                    SELECT 客戶名稱, 配件狀態 FROM pat_parts_all WHERE 客戶名稱 IS NOT NULL
-                    UNION ALL
-                    SELECT 客戶名稱, 配件狀態 FROM kyec_parts_all WHERE 客戶名稱 IS NOT NULL
-                )
+                    SUM(維修中) as 維修中配件,
+                    SUM(借出) as 借出配件,
+                    SUM(正常生產) as 正常配件
+                FROM parts_unified
+                WHERE 客戶名稱 IS NOT NULL
                 GROUP BY 客戶名稱
                 ORDER BY 配件總數 DESC
             """
@@ -113,12 +108,9 @@ class QueryProcessor:
                     SELECT 
                         客戶名稱,
                         COUNT(*) as 配件總數,
-                        SUM(CASE WHEN 配件狀態 LIKE '%維修%' OR 配件狀態 LIKE '%REPAIR%' THEN 1 ELSE 0 END) as 維修中配件
-                    FROM (
-                        SELECT 客戶名稱, 配件狀態 FROM pat_parts_all WHERE 客戶名稱 IS NOT NULL
-                        UNION ALL
-                        SELECT 客戶名稱, 配件狀態 FROM kyec_parts_all WHERE 客戶名稱 IS NOT NULL
-                    )
+                        SUM(維修中) as 維修中配件
+                    FROM parts_unified
+                    WHERE 客戶名稱 IS NOT NULL
                     GROUP BY 客戶名稱
                     HAVING 配件總數 >= 5
                 )
@@ -183,10 +175,10 @@ class QueryProcessor:
         try:
             analysis = {}
             
-            # 從週統計表獲取趨勢
+            # 從週統計快照獲取最近 days 天（以最新一週為基準）的趨勢
             trend_query = """
                 SELECT 
-                    每周狀態 as 時間週期,
+                    週開始日 as 時間週期,
                     SUM(總數量) as 總配件數,
                     SUM(正常生產) as 正常生產數,
                     SUM(廠內維修) as 廠內維修數,
@@ -194,17 +186,12 @@ class QueryProcessor:
                     SUM(客戶借出) as 客戶借出數,
                     ROUND(SUM(客戶維修) * 100.0 / SUM(總數量), 2) as 客戶維修率,
                     ROUND(SUM(廠內維修) * 100.0 / SUM(總數量), 2) as 廠內維修率
-                FROM (
-                    SELECT 每周狀態, 總數量, 正常生產, 廠內維修, 客戶維修, 客戶借出, 0 as 待release, 其它
-                    FROM pat_stats_weekly
-                    UNION ALL
-                    SELECT 每周狀態, 總數量, 正常生產, 廠內維修, 客戶維修, 客戶借出, 待release, 其它
-                    FROM kyec_stats_weekly
-                )
-                GROUP BY 每周狀態
+                FROM parts_weekly_snapshot
+                WHERE 週開始日 >= DATE((SELECT MAX(週開始日) FROM parts_weekly_snapshot), ?)
+                GROUP BY 週開始日
                 ORDER BY 時間週期
             """
-            analysis['weekly_trend'] = self.execute_query(trend_query)
+            analysis['weekly_trend'] = self.execute_query(trend_query, (f"-{int(days)} days",))
             
             return analysis
             
@@ -275,12 +262,12 @@ class QueryProcessor:
             pat_type_query = """
                 SELECT 
                     配件種類,
-                    COUNT(*) as 配件數量,
+                    SUM(數量) as 配件數量,
                     COUNT(DISTINCT 客戶名稱) as 客戶數量,
-                    SUM(CASE WHEN 配件狀態 = 'PRODUCTION' THEN 1 ELSE 0 END) as 可用數量,
-                    SUM(CASE WHEN 配件狀態 LIKE '%REPAIR%' THEN 1 ELSE 0 END) as 維修數量
-                FROM pat_parts_all
-                WHERE 配件種類 IS NOT NULL
+                    SUM(CASE WHEN 標準狀態 = '正常生產' THEN 數量 ELSE 0 END) as 可用數量,
+                    SUM(CASE WHEN 標準狀態 IN ('廠內維修', '客戶維修') THEN 數量 ELSE 0 END) as 維修數量
+                FROM parts_status_cube
+                WHERE 來源 = 'PAT' AND 配件種類 IS NOT NULL
                 GROUP BY 配件種類
                 ORDER BY 配件數量 DESC
             """
@@ -290,12 +277,12 @@ class QueryProcessor:
             kyec_type_query = """
                 SELECT 
                     配件種類,
-                    COUNT(*) as 配件數量,
+                    SUM(數量) as 配件數量,
                     COUNT(DISTINCT 客戶名稱) as 客戶數量,
-                    SUM(CASE WHEN 配件狀態 = '正常生產' THEN 1 ELSE 0 END) as 正常數量,
-                    SUM(CASE WHEN 配件狀態 LIKE '%維修%' THEN 1 ELSE 0 END) as 維修數量
-                FROM kyec_parts_all
-                WHERE 配件種類 IS NOT NULL
+                    SUM(CASE WHEN 標準狀態 = '正常生產' THEN 數量 ELSE 0 END) as 正常數量,
+                    SUM(CASE WHEN 標準狀態 IN ('廠內維修', '客戶維修') THEN 數量 ELSE 0 END) as 維修數量
+                FROM parts_status_cube
+                WHERE 來源 = 'KYEC' AND 配件種類 IS NOT NULL
                 GROUP BY 配件種類
                 ORDER BY 配件數量 DESC
             """
@@ -310,6 +297,12 @@ class QueryProcessor:
     def search_parts(self, search_term: str, search_type: str = "all") -> pd.DataFrame:
         """搜尋配件"""
         try:
+            # 優先由記憶體副本搜尋
+            # 含 LIKE 萬用字元的搜尋詞交由 SQL 處理
+            replica = get_parts_replica(self.connection_provider)
+            if replica is not None and not any(c in search_term for c in '%_'):
+                return replica.search_parts(search_term, search_type)
+            
             if search_type == "pat":
                 query = """
                     SELECT 配件編號, 配件名稱, 客戶名稱, 配件狀態, 站點, 配件種類, 開始時間
@@ -326,22 +319,15 @@ class QueryProcessor:
                 """
             else:  # all
                 query = """
-                    SELECT 配件編號, 配件名稱, 客戶名稱, 配件狀態, '站點' as 來源, 開始時間
-                    FROM pat_parts_all
+                    SELECT 配件編號, 配件名稱, 客戶名稱, 配件狀態, 來源, 開始時間
+                    FROM parts_unified
                     WHERE 配件編號 LIKE ? OR 配件名稱 LIKE ? OR 客戶名稱 LIKE ?
-                    UNION ALL
-                    SELECT 配件編號, 配件種類 as 配件名稱, 客戶名稱, 配件狀態, 'KYEC' as 來源, 狀態開始時間 as 開始時間
-                    FROM kyec_parts_all
-                    WHERE 配件編號 LIKE ? OR 配件種類 LIKE ? OR 客戶名稱 LIKE ?
                     ORDER BY 配件編號
                 """
             
             search_pattern = f"%{search_term}%"
             params = (search_pattern, search_pattern, search_pattern)
             
-            if search_type == "all":
-                params = params + params  # 重複參數給 UNION 查詢
-            
             return self.execute_query(query, params)
             
         except Exception as e:
@@ -389,42 +375,5 @@ class QueryProcessor:
             return {}
     
     def validate_query_safety(self, sql: str) -> bool:
-        """驗證查詢安全性"""
-        if not sql:
-            return False
-        
-        # 移除結尾的分號（這是正常的）
-        sql_cleaned = sql.strip().rstrip(';')
-        sql_upper = sql_cleaned.upper()
-        
-        # 只允許 SELECT 查詢
-        if not sql_upper.startswith('SELECT'):
-            return False
-        
-        # 使用正則表達式檢查危險關鍵字（但允許在字串中出現）
-        import re
-        dangerous_patterns = [
-            r'\bDROP\b', r'\bDELETE\b', r'\bINSERT\b', r'\bUPDATE\b',
-            r'\bALTER\b', r'\bCREATE\b', r'\bTRUNCATE\b', r'\bEXEC\b',
-            r'\bEXECUTE\b', r'--'
-        ]
-        
-        for pattern in dangerous_patterns:
-            if re.search(pattern, sql_upper):
-                return False
-        
-        # 檢查是否有多個語句（用分號分隔）
-        statements = sql.split(';')
-        if len([s for s in statements if s.strip()]) > 1:
-            return False
-        
-        # UNION 查詢是允許的，但要檢查是否安全
-        if 'UNION' in sql_upper:
-            # 確保 UNION 後面也是 SELECT
-            union_parts = re.split(r'\bUNION\s+(?:ALL\s+)?', sql_upper)
-            for part in union_parts:
-                part = part.strip()
-                if part and not part.startswith('SELECT'):
-                    return False
-        
-        return True
\ No newline at end of file
+        """驗證查詢安全性（只允許單一唯讀查詢）"""
+        return get_sql_validator().is_safe(sql)
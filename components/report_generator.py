@@ -6,7 +6,7 @@ from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.worksheet.table import Table, TableStyleInfo
 import io
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, BinaryIO
 import logging
 from components.database_manager import DatabaseManager
 from components.query_processor import QueryProcessor
@@ -14,10 +14,10 @@ from components.query_processor import QueryProcessor
 class ReportGenerator:
     """Excel 報表生成器"""
     
-    def __init__(self):
+    def __init__(self, db_manager: Optional[DatabaseManager] = None):
         self.logger = logging.getLogger(__name__)
-        self.db_manager = DatabaseManager()
-        self.query_processor = QueryProcessor()
+        self.db_manager = db_manager or DatabaseManager()
+        self.query_processor = QueryProcessor(self.db_manager)
         
         # 定義樣式
         self.header_font = Font(bold=True, color="FFFFFF")
@@ -37,12 +37,15 @@ class ReportGenerator:
             # 移除預設工作表
             workbook.remove(workbook.active)
             
-            # 建立各個工作表
-            self._create_overview_sheet(workbook)
-            self._create_pat_status_sheet(workbook)
-            self._create_kyec_status_sheet(workbook)
-            self._create_customer_analysis_sheet(workbook)
-            self._create_charts_sheet(workbook)
+            # 並行取得各工作表所需資料後依序建立工作表
+            data = self._fetch_report_data(['overview', 'pat_status', 'kyec_status',
+                                            'pat_stats', 'kyec_stats', 'customer_stats'])
+            
+            self._create_overview_sheet(workbook, data)
+            self._create_pat_status_sheet(workbook, data)
+            self._create_kyec_status_sheet(workbook, data)
+            self._create_customer_analysis_sheet(workbook, data)
+            self._create_charts_sheet(workbook, data)
             
             return self._save_workbook_to_bytes(workbook)
             
@@ -50,7 +53,27 @@ class ReportGenerator:
             self.logger.error(f"狀態報表生成失敗: {str(e)}")
             return None
     
-    def _create_overview_sheet(self, workbook):
+    def _fetch_report_data(self, names: List[str]) -> Dict[str, Any]:
+        """以批次查詢並行取得報表所需的資料"""
+        fetchers = {
+            'overview': self.db_manager.get_overview_statistics,
+            'pat_status': self.db_manager.get_pat_status_distribution,
+            'kyec_status': self.db_manager.get_kyec_status_distribution,
+            'pat_stats': self.db_manager.get_detailed_pat_statistics,
+            'kyec_stats': self.db_manager.get_detailed_kyec_statistics,
+            'customer_stats': self.db_manager.get_customer_statistics,
+            'trend_data': self.db_manager.get_status_trend_data,
+            'change_logs': lambda: self.db_manager.get_change_logs(days_filter="最近30天"),
+        }
+        results = self.db_manager.run_batch({name: fetchers[name] for name in names})
+        
+        # 失敗的工作以空結果代替
+        for name, value in results.items():
+            if value is None:
+                results[name] = {} if name == 'overview' else pd.DataFrame()
+        return results
+    
+    def _create_overview_sheet(self, workbook, data: Dict[str, Any]):
         """建立總覽工作表"""
         ws = workbook.create_sheet("總覽統計")
         
@@ -60,7 +83,7 @@ class ReportGenerator:
         ws['A2'] = f"生成時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         
         # 獲取統計資料
-        overview_stats = self.db_manager.get_overview_statistics()
+        overview_stats = data['overview']
         
         # 總覽統計
         ws['A4'] = "總覽統計"
@@ -84,7 +107,7 @@ class ReportGenerator:
                 cell.border = self.border
         
         # PAT 狀態分佈
-        pat_status = self.db_manager.get_pat_status_distribution()
+        pat_status = data['pat_status']
         if not pat_status.empty:
             ws['A11'] = "PAT 配件狀態分佈"
             ws['A11'].font = self.header_font
@@ -93,7 +116,7 @@ class ReportGenerator:
             self._write_dataframe_to_sheet(ws, pat_status, start_row=12)
         
         # KYEC 狀態分佈
-        kyec_status = self.db_manager.get_kyec_status_distribution()
+        kyec_status = data['kyec_status']
         if not kyec_status.empty:
             ws['D11'] = "KYEC 配件狀態分佈"
             ws['D11'].font = self.header_font
@@ -114,7 +137,7 @@ class ReportGenerator:
             adjusted_width = min(max_length + 2, 50)
             ws.column_dimensions[column_letter].width = adjusted_width
     
-    def _create_pat_status_sheet(self, workbook):
+    def _create_pat_status_sheet(self, workbook, data: Dict[str, Any]):
         """建立 PAT 狀態詳細工作表"""
         ws = workbook.create_sheet("PAT 配件詳細")
         
@@ -123,7 +146,7 @@ class ReportGenerator:
         ws['A1'].font = Font(size=14, bold=True)
         
         # 獲取詳細統計
-        pat_stats = self.db_manager.get_detailed_pat_statistics()
+        pat_stats = data['pat_stats']
         
         if not pat_stats.empty:
             self._write_dataframe_to_sheet(ws, pat_stats, start_row=3, with_table=True)
@@ -131,7 +154,7 @@ class ReportGenerator:
             # 添加條件格式化
             self._apply_conditional_formatting(ws, pat_stats, start_row=4)
     
-    def _create_kyec_status_sheet(self, workbook):
+    def _create_kyec_status_sheet(self, workbook, data: Dict[str, Any]):
         """建立 KYEC 狀態詳細工作表"""
         ws = workbook.create_sheet("KYEC 配件詳細")
         
@@ -140,7 +163,7 @@ class ReportGenerator:
         ws['A1'].font = Font(size=14, bold=True)
         
         # 獲取詳細統計
-        kyec_stats = self.db_manager.get_detailed_kyec_statistics()
+        kyec_stats = data['kyec_stats']
         
         if not kyec_stats.empty:
             self._write_dataframe_to_sheet(ws, kyec_stats, start_row=3, with_table=True)
@@ -148,7 +171,7 @@ class ReportGenerator:
             # 添加條件格式化
             self._apply_conditional_formatting(ws, kyec_stats, start_row=4)
     
-    def _create_customer_analysis_sheet(self, workbook):
+    def _create_customer_analysis_sheet(self, workbook, data: Dict[str, Any]):
         """建立客戶分析工作表"""
         ws = workbook.create_sheet("客戶分析")
         
@@ -157,7 +180,7 @@ class ReportGenerator:
         ws['A1'].font = Font(size=14, bold=True)
         
         # 獲取客戶統計
-        customer_stats = self.db_manager.get_customer_statistics()
+        customer_stats = data['customer_stats']
         
         if not customer_stats.empty:
             self._write_dataframe_to_sheet(ws, customer_stats, start_row=3, with_table=True)
@@ -174,7 +197,7 @@ class ReportGenerator:
                     with_table=True
                 )
     
-    def _create_charts_sheet(self, workbook):
+    def _create_charts_sheet(self, workbook, data: Dict[str, Any]):
         """建立圖表工作表"""
         ws = workbook.create_sheet("圖表分析")
         
@@ -183,8 +206,8 @@ class ReportGenerator:
         ws['A1'].font = Font(size=14, bold=True)
         
         # 獲取資料用於圖表
-        pat_status = self.db_manager.get_pat_status_distribution()
-        kyec_status = self.db_manager.get_kyec_status_distribution()
+        pat_status = data['pat_status']
+        kyec_status = data['kyec_status']
         
         # PAT 狀態圓餅圖
         if not pat_status.empty:
@@ -215,7 +238,7 @@ class ReportGenerator:
             end_col = start_col + len(df.columns) - 1
             
             table_range = f"{worksheet.cell(start_row, start_col).coordinate}:{worksheet.cell(end_row, end_col).coordinate}"
-            table = Table(displayName=f"Table{start_row}", ref=table_range)
+            table = Table(displayName=self._next_table_name(worksheet), ref=table_range)
             
             style = TableStyleInfo(
                 name="TableStyleMedium9",
@@ -227,6 +250,51 @@ class ReportGenerator:
             table.tableStyleInfo = style
             worksheet.add_table(table)
     
+    def _next_table_name(self, worksheet) -> str:
+        """產生活頁簿內唯一的 Excel 表格名稱"""
+        table_count = sum(len(sheet.tables) for sheet in worksheet.parent.worksheets)
+        return f"Table{table_count + 1}"
+    
+    def _write_chunks_to_sheet(self, worksheet, chunks: Iterable[pd.DataFrame], start_row=1,
+                               start_col=1, with_table=False) -> int:
+        """將串流查詢的 DataFrame 區塊依序寫入工作表，返回寫入的資料筆數"""
+        columns = None
+        row_idx = start_row
+        
+        for chunk in chunks:
+            # 以第一個區塊的欄位寫入標題
+            if columns is None:
+                columns = list(chunk.columns)
+                for col_idx, column_name in enumerate(columns, start=start_col):
+                    cell = worksheet.cell(row=start_row, column=col_idx, value=column_name)
+                    cell.font = self.header_font
+                    cell.fill = self.header_fill
+                    cell.border = self.border
+            
+            for row in chunk.itertuples(index=False):
+                row_idx += 1
+                for col_idx, value in enumerate(row, start=start_col):
+                    cell = worksheet.cell(row=row_idx, column=col_idx, value=value)
+                    cell.border = self.border
+        
+        row_count = row_idx - start_row
+        
+        # 建立表格（Excel 表格至少需要一列資料）
+        if with_table and columns and row_count > 0:
+            end_col = start_col + len(columns) - 1
+            table_range = f"{worksheet.cell(start_row, start_col).coordinate}:{worksheet.cell(row_idx, end_col).coordinate}"
+            table = Table(displayName=self._next_table_name(worksheet), ref=table_range)
+            table.tableStyleInfo = TableStyleInfo(
+                name="TableStyleMedium9",
+                showFirstColumn=False,
+                showLastColumn=False,
+                showRowStripes=True,
+                showColumnStripes=True
+            )
+            worksheet.add_table(table)
+        
+        return row_count
+    
     def _add_pie_chart(self, worksheet, data, title, data_start, chart_position):
         """添加圓餅圖"""
         # 先將資料寫入工作表
@@ -291,8 +359,13 @@ class ReportGenerator:
             if date_range:
                 ws['A2'] = f"分析期間: {date_range[0]} 至 {date_range[1]}"
             
-            # 獲取趨勢資料
-            trend_data = self.db_manager.get_status_trend_data()
+            # 並行獲取趨勢資料與維修週期資料
+            results = self.db_manager.run_batch({
+                'trend': (lambda: self.db_manager.get_status_trend_data(date_range[0], date_range[1]))
+                         if date_range else self.db_manager.get_status_trend_data,
+                'maintenance': self.db_manager.get_maintenance_cycle_data,
+            })
+            trend_data = results['trend'] if results['trend'] is not None else pd.DataFrame()
             
             if not trend_data.empty:
                 self._write_dataframe_to_sheet(ws, trend_data, start_row=4, with_table=True)
@@ -301,8 +374,8 @@ class ReportGenerator:
                 self._add_trend_chart(ws, trend_data)
             
             # 維修週期分析
-            maintenance_data = self.db_manager.get_maintenance_cycle_data()
-            if not maintenance_data.empty:
+            maintenance_data = results['maintenance']
+            if maintenance_data is not None and not maintenance_data.empty:
                 ws2 = workbook.create_sheet("維修週期分析")
                 ws2['A1'] = "維修週期分析"
                 ws2['A1'].font = Font(size=14, bold=True)
@@ -418,32 +491,24 @@ class ReportGenerator:
             ws['A2'] = f"生成時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
             
             # 建立查詢
-            for i, table in enumerate(tables):
-                # 建立 SQL 查詢
-                selected_columns = [col for col in columns if col in self.db_manager.get_available_columns([table])]
+            start_row = 4
+            for table in tables:
+                query = self._build_custom_query(table, columns, filter_conditions)
                 
-                if selected_columns:
-                    query = f"SELECT {', '.join(selected_columns)} FROM {table}"
-                    
-                    if filter_conditions:
-                        query += f" WHERE {filter_conditions}"
-                    
+                if query:
                     query += " LIMIT 1000"  # 限制結果數量
                     
-                    # 執行查詢
+                    # 執行查詢（分批讀取並寫入）
                     if self.db_manager.validate_sql_query(query):
-                        result = self.db_manager.execute_query(query)
+                        row_count = self._write_chunks_to_sheet(
+                            ws, self.db_manager.iter_query(query), start_row=start_row, with_table=True
+                        )
                         
-                        if not result.empty:
-                            # 計算起始行
-                            start_row = 4 + i * (len(result) + 5)
-                            
+                        if row_count > 0:
                             # 添加表格標題
                             ws[f'A{start_row - 1}'] = f"{table} 資料"
                             ws[f'A{start_row - 1}'].font = Font(size=12, bold=True)
-                            
-                            # 寫入資料
-                            self._write_dataframe_to_sheet(ws, result, start_row=start_row, with_table=True)
+                            start_row += row_count + 5
             
             return self._save_workbook_to_bytes(workbook)
             
@@ -451,6 +516,34 @@ class ReportGenerator:
             self.logger.error(f"自訂報表生成失敗: {str(e)}")
             return None
     
+    def _build_custom_query(self, table: str, columns: List[str], filter_conditions: str = "") -> Optional[str]:
+        """建立自訂報表的查詢（僅包含資料表中存在的欄位）"""
+        available_columns = self.db_manager.get_available_columns([table])
+        selected_columns = [col for col in columns if col in available_columns]
+        
+        if not selected_columns:
+            return None
+        
+        query = f"SELECT {', '.join(selected_columns)} FROM {table}"
+        if filter_conditions:
+            query += f" WHERE {filter_conditions}"
+        return query
+    
+    def generate_custom_csv(self, table: str, columns: List[str],
+                            filter_conditions: str = "") -> Optional[BinaryIO]:
+        """以串流方式匯出自訂報表的完整 CSV（不限筆數）"""
+        try:
+            query = self._build_custom_query(table, columns, filter_conditions)
+            
+            if not query or not self.db_manager.validate_sql_query(query):
+                return None
+            
+            return self.db_manager.export_query_csv(query)
+            
+        except Exception as e:
+            self.logger.error(f"自訂 CSV 匯出失敗: {str(e)}")
+            return None
+    
     def _save_workbook_to_bytes(self, workbook) -> bytes:
         """將工作簿儲存為位元組"""
         buffer = io.BytesIO()
@@ -464,21 +557,25 @@ class ReportGenerator:
             workbook = openpyxl.Workbook()
             workbook.remove(workbook.active)
             
+            # 並行取得所有工作表所需資料
+            data = self._fetch_report_data(['overview', 'pat_status', 'kyec_status', 'pat_stats',
+                                            'kyec_stats', 'customer_stats', 'trend_data', 'change_logs'])
+            
             # 執行摘要
-            self._create_executive_summary(workbook)
+            self._create_executive_summary(workbook, data)
             
             # 詳細分析
-            self._create_overview_sheet(workbook)
-            self._create_pat_status_sheet(workbook)
-            self._create_kyec_status_sheet(workbook)
-            self._create_customer_analysis_sheet(workbook)
+            self._create_overview_sheet(workbook, data)
+            self._create_pat_status_sheet(workbook, data)
+            self._create_kyec_status_sheet(workbook, data)
+            self._create_customer_analysis_sheet(workbook, data)
             
             # 趨勢和變更分析
-            self._create_trend_analysis_sheet(workbook)
-            self._create_change_analysis_sheet(workbook)
+            self._create_trend_analysis_sheet(workbook, data)
+            self._create_change_analysis_sheet(workbook, data)
             
             # 圖表總覽
-            self._create_charts_sheet(workbook)
+            self._create_charts_sheet(workbook, data)
             
             return self._save_workbook_to_bytes(workbook)
             
@@ -486,7 +583,7 @@ class ReportGenerator:
             self.logger.error(f"綜合報表生成失敗: {str(e)}")
             return None
     
-    def _create_executive_summary(self, workbook):
+    def _create_executive_summary(self, workbook, data: Dict[str, Any]):
         """建立執行摘要"""
         ws = workbook.create_sheet("執行摘要")
         
@@ -496,7 +593,7 @@ class ReportGenerator:
         ws['A2'] = f"報表日期: {datetime.now().strftime('%Y年%m月%d日')}"
         
         # 關鍵指標
-        overview_stats = self.db_manager.get_overview_statistics()
+        overview_stats = data['overview']
         
         ws['A4'] = "關鍵績效指標"
         ws['A4'].font = Font(size=14, bold=True)
@@ -522,18 +619,18 @@ class ReportGenerator:
         ws.column_dimensions['B'].width = 12
         ws.column_dimensions['C'].width = 40
     
-    def _create_trend_analysis_sheet(self, workbook):
+    def _create_trend_analysis_sheet(self, workbook, data: Dict[str, Any]):
         """建立趨勢分析工作表"""
         ws = workbook.create_sheet("趨勢分析")
         
         ws['A1'] = "配件狀態趨勢分析"
         ws['A1'].font = Font(size=14, bold=True)
         
-        trend_data = self.db_manager.get_status_trend_data()
+        trend_data = data['trend_data']
         if not trend_data.empty:
             self._write_dataframe_to_sheet(ws, trend_data, start_row=3, with_table=True)
     
-    def _create_change_analysis_sheet(self, workbook):
+    def _create_change_analysis_sheet(self, workbook, data: Dict[str, Any]):
         """建立變更分析工作表"""
         ws = workbook.create_sheet("變更分析")
         
@@ -541,7 +638,7 @@ class ReportGenerator:
         ws['A1'].font = Font(size=14, bold=True)
         
         # 最近30天的變更統計
-        change_logs = self.db_manager.get_change_logs(days_filter="最近30天")
+        change_logs = data['change_logs']
         
         if not change_logs.empty:
             # 按日期統計變更
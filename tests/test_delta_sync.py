@@ -0,0 +1,235 @@
+"""增量同步（apply_changes / compute_content_checksum）與 DatabaseManager 同步流程測試"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import components.database_manager as database_manager
+from components.database_manager import DatabaseManager
+from utils.delta_sync import (CHANGE_LOG_COLUMNS, DELTA_TABLE_KEYS, apply_changes,
+                              compute_content_checksum, get_high_water_id)
+
+
+def _create_database(path, parts=(('P-1', '正常', 'A'), ('P-2', '維修', 'B'))):
+    """建立含可同步資料表與變更紀錄的小型資料庫"""
+    conn = sqlite3.connect(path)
+    for table, key_column in DELTA_TABLE_KEYS.items():
+        conn.execute(f'CREATE TABLE "{table}" ("{key_column}" TEXT PRIMARY KEY, 狀態 TEXT, 客戶名稱 TEXT)')
+    conn.executemany('INSERT INTO pat_parts_all VALUES (?, ?, ?)', parts)
+    conn.execute(f"CREATE TABLE table_change_log ({', '.join(CHANGE_LOG_COLUMNS)})")
+    conn.execute("INSERT INTO table_change_log (id, table_name, operation, timestamp) "
+                 "VALUES (1, 'pat_parts_all', 'INSERT', '2025-01-06 08:00:00')")
+    conn.commit()
+    conn.close()
+
+
+def _change(change_id, operation, row_key, column=None, new_value=None, table='pat_parts_all'):
+    return {'id': change_id, 'table_name': table, 'operation': operation,
+            'timestamp': '2025-01-13 08:00:00', 'row_key': json.dumps([row_key]),
+            'column_name': column, 'old_value': None, 'new_value': new_value,
+            'user': 'tester', 'note': None}
+
+
+CHANGES = [
+    _change(2, 'UPDATE', 'P-1', '狀態', '維修'),
+    _change(3, 'INSERT', 'P-3', '狀態', '正常'),
+    _change(4, 'update', 'P-3', '客戶名稱', 'C'),
+    _change(5, 'DELETE', 'P-2'),
+]
+
+
+def _rows(conn, table='pat_parts_all'):
+    return conn.execute(f'SELECT * FROM "{table}" ORDER BY 1').fetchall()
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = tmp_path / "tooling_data.db"
+    _create_database(str(path))
+    return str(path)
+
+
+def test_apply_changes_upserts_and_deletes_by_key(db_file):
+    conn = sqlite3.connect(db_file)
+    with conn:
+        applied = apply_changes(conn, CHANGES)
+
+    assert applied == len(CHANGES)
+    assert _rows(conn) == [('P-1', '維修', 'A'), ('P-3', '正常', 'C')]
+    assert get_high_water_id(conn) == 5
+    assert conn.execute("SELECT COUNT(*) FROM table_change_log").fetchone()[0] == 1 + len(CHANGES)
+
+
+def test_apply_changes_insert_of_existing_key_updates_in_place(db_file):
+    conn = sqlite3.connect(db_file)
+    with conn:
+        apply_changes(conn, [_change(2, 'INSERT', 'P-1', '客戶名稱', 'Z')])
+    assert _rows(conn)[0] == ('P-1', '正常', 'Z')
+
+
+@pytest.mark.parametrize('change', [
+    _change(2, 'UPDATE', 'P-1', '狀態', 'x', table='table_change_log'),
+    _change(2, 'UPDATE', 'P-1', '不存在的欄位', 'x'),
+    _change(2, 'UPDATE', 'P-404', '狀態', 'x'),
+    _change(2, 'MERGE', 'P-1', '狀態', 'x'),
+    dict(_change(2, 'UPDATE', 'P-1', '狀態', 'x'), row_key='["P-1", 2]'),
+    dict(_change(2, 'UPDATE', 'P-1', '狀態', 'x'), row_key='not json'),
+])
+def test_apply_changes_rejects_unsafe_changes(db_file, change):
+    conn = sqlite3.connect(db_file)
+    with pytest.raises(ValueError):
+        with conn:
+            apply_changes(conn, [change])
+    # 交易回滾，資料未被修改
+    assert _rows(conn) == [('P-1', '正常', 'A'), ('P-2', '維修', 'B')]
+
+
+def test_content_checksum_ignores_physical_row_order(tmp_path):
+    first, second = str(tmp_path / "a.db"), str(tmp_path / "b.db")
+    _create_database(first, parts=(('P-1', '正常', 'A'), ('P-2', '維修', 'B')))
+    _create_database(second, parts=(('P-2', '維修', 'B'), ('P-1', '正常', 'A')))
+
+    assert compute_content_checksum(sqlite3.connect(first)) == compute_content_checksum(sqlite3.connect(second))
+
+    conn = sqlite3.connect(second)
+    with conn:
+        conn.execute("UPDATE pat_parts_all SET 狀態 = '報廢' WHERE 配件編號 = 'P-1'")
+    assert compute_content_checksum(sqlite3.connect(first)) != compute_content_checksum(conn)
+
+
+class _FakeResponse:
+    """requests 回應的替身（支援串流與 context manager）"""
+
+    def __init__(self, status_code=200, content=b'', text='', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.text = text
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+
+@pytest.fixture
+def manager(db_file, monkeypatch):
+    """不在建構時同步的 DatabaseManager（網路請求由各測試替換）"""
+    monkeypatch.setattr(DatabaseManager, '_initialize_database', lambda self: None)
+    return DatabaseManager(db_path=db_file, db_url="https://example.test/tooling_data.db",
+                           delta_url="https://example.test/delta")
+
+
+def _expected_checksum(db_file, tmp_path, changes):
+    """在副本上套用變更後的校驗碼（模擬發佈端）"""
+    copy = str(tmp_path / "published.db")
+    shutil.copyfile(db_file, copy)
+    conn = sqlite3.connect(copy)
+    with conn:
+        apply_changes(conn, changes)
+    checksum = compute_content_checksum(conn)
+    conn.close()
+    return checksum
+
+
+def test_delta_sync_applies_changes_when_checksum_matches(manager, db_file, tmp_path, monkeypatch):
+    checksum = _expected_checksum(db_file, tmp_path, CHANGES)
+    monkeypatch.setattr(manager, '_fetch_delta_changes',
+                        lambda since_id: {'changes': CHANGES, 'latest_id': 5, 'checksum': checksum})
+    monkeypatch.setattr(manager, '_download_database', lambda site=None: pytest.fail("不應完整下載"))
+
+    assert manager._sync_database()
+    assert _rows(sqlite3.connect(db_file)) == [('P-1', '維修', 'A'), ('P-3', '正常', 'C')]
+    assert manager._load_sync_state()['delta_high_water_id'] == 5
+
+
+def test_delta_sync_falls_back_to_full_download_on_bad_checksum(manager, db_file, monkeypatch):
+    with open(db_file, 'rb') as f:
+        original = f.read()
+    downloads = []
+    monkeypatch.setattr(manager, '_fetch_delta_changes',
+                        lambda since_id: {'changes': CHANGES, 'latest_id': 5, 'checksum': '0' * 64})
+    monkeypatch.setattr(manager, '_download_database', lambda site=None: downloads.append(site) or True)
+
+    assert manager._sync_database()
+    assert downloads == [None]
+    # 校驗失敗時本地檔案保持原樣，也不留下暫存檔
+    with open(db_file, 'rb') as f:
+        assert f.read() == original
+    assert not [name for name in os.listdir(os.path.dirname(db_file)) if name.startswith('.download-')]
+
+
+def test_delta_sync_falls_back_when_gap_is_too_large(manager, monkeypatch):
+    downloads = []
+    monkeypatch.setattr(manager, '_fetch_delta_changes',
+                        lambda since_id: {'changes': [], 'latest_id': manager.max_delta_changes + 10,
+                                          'checksum': '0' * 64})
+    monkeypatch.setattr(manager, '_download_database', lambda site=None: downloads.append(site) or True)
+
+    assert manager._sync_database()
+    assert downloads == [None]
+
+
+def _published_database(tmp_path):
+    """發佈端的新版資料庫內容與 sha256sum 格式的校驗碼"""
+    path = str(tmp_path / "remote.db")
+    _create_database(path, parts=(('P-9', '正常', 'R'),))
+    with open(path, 'rb') as f:
+        content = f.read()
+    return content, f"{hashlib.sha256(content).hexdigest()}  tooling_data.db\n"
+
+
+def test_download_verifies_sha256_and_uses_etag(manager, db_file, tmp_path, monkeypatch):
+    content, checksum_text = _published_database(tmp_path)
+    requests_seen = []
+
+    def fake_get(url, headers=None, stream=False, timeout=None):
+        requests_seen.append((url, dict(headers or {})))
+        if url.endswith('.sha256'):
+            return _FakeResponse(text=checksum_text)
+        if (headers or {}).get('If-None-Match') == '"v2"':
+            return _FakeResponse(status_code=304)
+        return _FakeResponse(content=content, headers={'ETag': '"v2"'})
+
+    monkeypatch.setattr(database_manager.requests, 'get', fake_get)
+
+    assert manager._download_database()
+    assert _rows(sqlite3.connect(db_file)) == [('P-9', '正常', 'R')]
+    state = manager._load_sync_state()
+    assert state['etag'] == '"v2"'
+    assert state['sha256'] == hashlib.sha256(content).hexdigest()
+
+    # 第二次以 If-None-Match 條件請求，伺服器回應 304 時不重新下載
+    assert manager._download_database()
+    assert requests_seen[-1] == (manager.github_db_url, {'If-None-Match': '"v2"'})
+    assert not any(url.endswith('.sha256') for url, _ in requests_seen[2:])
+
+
+def test_download_keeps_local_file_on_sha256_mismatch(manager, db_file, tmp_path, monkeypatch):
+    content, _ = _published_database(tmp_path)
+    with open(db_file, 'rb') as f:
+        original = f.read()
+
+    def fake_get(url, headers=None, stream=False, timeout=None):
+        if url.endswith('.sha256'):
+            return _FakeResponse(text='f' * 64)
+        return _FakeResponse(content=content)
+
+    monkeypatch.setattr(database_manager.requests, 'get', fake_get)
+
+    assert not manager._download_database()
+    with open(db_file, 'rb') as f:
+        assert f.read() == original
+    assert not [name for name in os.listdir(os.path.dirname(db_file)) if name.startswith('.download-')]
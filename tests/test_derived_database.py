@@ -0,0 +1,60 @@
+"""衍生資料庫週統計快照（parts_weekly_snapshot）測試"""
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from utils.derived_database import DerivedDatabaseBuilder
+
+SOURCE_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tooling_data.db")
+
+
+@pytest.fixture
+def source_path(tmp_path):
+    if not os.path.exists(SOURCE_DB):
+        pytest.skip("找不到 tooling_data.db")
+    path = str(tmp_path / "tooling_data.db")
+    shutil.copyfile(SOURCE_DB, path)
+    return path
+
+
+def _snapshot_weeks(builder):
+    conn = sqlite3.connect(builder.target_path)
+    try:
+        return conn.execute(
+            "SELECT 週開始日, COUNT(*) FROM parts_weekly_snapshot GROUP BY 週開始日 ORDER BY 週開始日"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def test_builds_in_consecutive_weeks_keep_both_snapshots(source_path):
+    DerivedDatabaseBuilder(source_path, snapshot_time=datetime(2026, 10, 7, 9)).build()
+    builder = DerivedDatabaseBuilder(source_path, snapshot_time=datetime(2026, 10, 14, 9))
+    builder.build()
+
+    weeks = _snapshot_weeks(builder)
+    assert [week for week, _ in weeks] == ['2026-10-05', '2026-10-12']
+    assert weeks[0][1] == weeks[1][1] > 0
+
+
+def test_rebuild_in_same_week_replaces_that_week(source_path):
+    DerivedDatabaseBuilder(source_path, snapshot_time=datetime(2026, 10, 12, 8)).build()
+    first = _snapshot_weeks(DerivedDatabaseBuilder(source_path))
+
+    builder = DerivedDatabaseBuilder(source_path, snapshot_time=datetime(2026, 10, 18, 23))
+    builder.build()
+
+    assert _snapshot_weeks(builder) == first
+
+
+def test_snapshot_week_falls_back_to_source_mtime(source_path):
+    mtime = datetime(2026, 10, 15, 12).timestamp()
+    os.utime(source_path, (mtime, mtime))
+
+    builder = DerivedDatabaseBuilder(source_path)
+    builder.build()
+
+    assert [week for week, _ in _snapshot_weeks(builder)] == ['2026-10-12']
@@ -0,0 +1,42 @@
+"""check_data_quality_chunks 與 check_data_quality 的一致性測試"""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from utils.helpers import check_data_quality, check_data_quality_chunks
+
+# 各批次的欄位型別不同：整數與浮點數混合、整批皆為 NULL、(1, 'a') 與 (1.0, 'a') 重複
+ROWS = [
+    (1, 'a', None),
+    (2, None, None),
+    (1.0, 'a', None),
+    (None, None, None),
+    (3, 'b', 5),
+    (3, 'b', 5),
+    (4, 'c', None),
+    (None, 'd', 7),
+]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (x, y, z)')
+    conn.executemany('INSERT INTO t VALUES (?, ?, ?)', ROWS)
+    yield conn
+    conn.close()
+
+
+def _plain(report):
+    """將 numpy 純量轉為 Python 值以便比較"""
+    if isinstance(report, dict):
+        return {key: _plain(value) for key, value in report.items()}
+    return report.item() if hasattr(report, 'item') else report
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, len(ROWS)])
+def test_chunked_quality_matches_full_frame(conn, chunk_size):
+    full = check_data_quality(pd.read_sql_query('SELECT * FROM t', conn))
+    chunked = check_data_quality_chunks(pd.read_sql_query('SELECT * FROM t', conn, chunksize=chunk_size))
+    assert _plain(chunked) == _plain(full)
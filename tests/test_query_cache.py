@@ -0,0 +1,137 @@
+"""查詢結果快取（QueryResultCache / run_cached_query）測試"""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from utils.query_cache import QueryResultCache, normalize_sql, run_cached_query
+from utils.query_governor import QueryGovernor
+from utils.site_registry import SiteRegistry
+
+
+def _frame(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({'id': range(rows), 'value': [float(i) for i in range(rows)]})
+
+
+def _size(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def test_make_key_normalizes_whitespace_but_not_string_literals():
+    assert normalize_sql("SELECT  *\n FROM t") == "SELECT * FROM t"
+    assert normalize_sql("SELECT 'a  b'   FROM t") == "SELECT 'a  b' FROM t"
+    assert QueryResultCache.make_key("SELECT *\nFROM t", None, 1) == QueryResultCache.make_key("SELECT * FROM t", (), 1)
+    assert QueryResultCache.make_key("SELECT ?", (1,), 1) != QueryResultCache.make_key("SELECT ?", (2,), 1)
+    assert QueryResultCache.make_key("SELECT 1", None, 1) != QueryResultCache.make_key("SELECT 1", None, 2)
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    df = _frame(10)
+    cache = QueryResultCache(max_bytes=_size(df) * 2)
+    cache.put('a', df)
+    cache.put('b', df)
+    assert cache.get('a') is not None       # a 成為最近使用
+
+    cache.put('c', df)
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_byte_budget_bounds_total_size():
+    small, large = _frame(10), _frame(100)
+    cache = QueryResultCache(max_bytes=_size(large) + _size(small))
+    for key in ('s1', 's2', 's3'):
+        cache.put(key, small)
+
+    cache.put('large', large)
+
+    stats = cache.get_stats()
+    assert stats['bytes'] <= cache.max_bytes
+    assert stats['entries'] == 2
+    assert cache.get('large') is not None and cache.get('s3') is not None
+
+
+def test_result_larger_than_budget_is_not_stored():
+    df = _frame(100)
+    cache = QueryResultCache(max_bytes=_size(df) - 1)
+    cache.put('big', df)
+
+    assert cache.get_stats()['entries'] == 0
+    assert cache.get('big') is None
+
+
+def test_replacing_a_key_does_not_double_count_bytes():
+    df = _frame(10)
+    cache = QueryResultCache()
+    cache.put('a', df)
+    cache.put('a', df)
+
+    assert cache.get_stats()['bytes'] == _size(df)
+
+
+def test_cached_frames_are_isolated_from_callers():
+    original = _frame(3)
+    cache = QueryResultCache()
+    cache.put('a', original)
+
+    # 寫入後修改原始 DataFrame 不影響快取
+    original.loc[0, 'value'] = -1.0
+    first = cache.get('a')
+    assert first.loc[0, 'value'] == 0.0
+
+    # 修改讀出的副本不影響下一次讀取
+    first.loc[1, 'value'] = -1.0
+    first['extra'] = 1
+    second = cache.get('a')
+    assert second.loc[1, 'value'] == 1.0
+    assert 'extra' not in second.columns
+
+
+class _Provider:
+    """只提供 run_cached_query 需要的介面的連線提供者"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.version = 1
+
+    def get_connection(self):
+        return self.conn
+
+    def version_token(self, sites=()):
+        return (self.version, tuple(sites))
+
+
+@pytest.fixture
+def provider():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (id INTEGER)')
+    conn.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(10)])
+    yield _Provider(conn)
+    conn.close()
+
+
+def test_run_cached_query_hits_until_version_changes(provider):
+    cache, governor = QueryResultCache(), QueryGovernor()
+    run = lambda: run_cached_query(provider, 'SELECT * FROM t', cache=cache, governor=governor,
+                                   site_registry=SiteRegistry())
+
+    assert len(run()) == 10
+    assert len(run()) == 10
+    assert cache.get_stats()['hits'] == 1
+
+    provider.version = 2
+    provider.conn.execute('INSERT INTO t VALUES (10)')
+    assert len(run()) == 11
+    assert cache.get_stats()['misses'] == 2
+
+
+def test_run_cached_query_does_not_cache_partial_results(provider):
+    cache, governor = QueryResultCache(), QueryGovernor()
+
+    df = run_cached_query(provider, 'SELECT * FROM t', max_rows=5, cache=cache, governor=governor,
+                          site_registry=SiteRegistry())
+
+    assert df.attrs['partial'] and len(df) == 5
+    assert cache.get_stats()['entries'] == 0
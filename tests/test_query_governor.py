@@ -0,0 +1,124 @@
+"""查詢限制器（筆數上限、執行時間上限與部分結果標記）測試"""
+import sqlite3
+
+import pytest
+
+from components.database_manager import DatabaseManager
+from utils.query_cache import get_query_cache
+from utils.query_governor import QueryGovernor, describe_partial_result
+
+# 無限遞迴的 CTE，只能由執行時間上限中斷
+SLOW_ROWS_SQL = """
+    WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c)
+    SELECT x FROM c WHERE x % 1000 = 0
+"""
+SLOW_AGGREGATE_SQL = """
+    WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c)
+    SELECT COUNT(*) FROM c
+"""
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)')
+    conn.executemany('INSERT INTO t VALUES (?, ?)', [(i, f'n{i}') for i in range(1, 11)])
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def governor():
+    return QueryGovernor(max_rows=5, timeout_seconds=0.2, fetch_size=3)
+
+
+def test_result_over_cap_is_truncated_and_marked_partial(conn, governor):
+    df = governor.run(conn, 'SELECT * FROM t ORDER BY id', max_rows=4)
+
+    assert df['id'].tolist() == [1, 2, 3, 4]
+    assert df.attrs['partial'] is True
+    assert df.attrs['partial_reason'] == 'row_limit'
+    assert describe_partial_result(df) == "結果超過最大查詢結果數，僅顯示前 4 筆資料"
+
+
+@pytest.mark.parametrize('max_rows', [10, 11, None])
+def test_result_within_cap_is_complete(conn, governor, max_rows):
+    df = governor.run(conn, 'SELECT * FROM t', max_rows=max_rows)
+
+    assert len(df) == 10
+    assert not df.attrs.get('partial')
+    assert describe_partial_result(df) is None
+
+
+def test_slow_query_returns_rows_read_before_deadline(conn, governor):
+    df = governor.run(conn, SLOW_ROWS_SQL)
+
+    assert len(df) > 0
+    assert df.attrs['partial'] is True
+    assert df.attrs['partial_reason'] == 'timeout'
+    # 中斷後連線仍可使用，進度回呼已移除
+    assert governor.run(conn, 'SELECT COUNT(*) AS n FROM t')['n'].iloc[0] == 10
+
+
+def test_slow_query_without_rows_raises_timeout(conn, governor):
+    with pytest.raises(TimeoutError):
+        governor.run(conn, SLOW_AGGREGATE_SQL)
+    with pytest.raises(TimeoutError):
+        governor.fetch_rows(conn, SLOW_AGGREGATE_SQL)
+
+
+def test_iter_chunks_marks_last_chunk_partial_at_cap(conn, governor):
+    chunks = list(governor.iter_chunks(conn, 'SELECT * FROM t ORDER BY id', chunk_size=3, max_rows=7))
+
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert [bool(chunk.attrs.get('partial')) for chunk in chunks] == [False, False, True]
+    assert chunks[-1].attrs['partial_reason'] == 'row_limit'
+
+
+def test_iter_chunks_is_interrupted_by_deadline(conn, governor):
+    with pytest.raises(TimeoutError):
+        for _ in governor.iter_chunks(conn, SLOW_ROWS_SQL, chunk_size=100):
+            pass
+
+
+def test_fetch_rows_limits_rows_without_partial_flag(conn, governor):
+    assert governor.fetch_rows(conn, 'SELECT id FROM t ORDER BY id', max_rows=2) == [(1,), (2,)]
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """以小型資料庫建立、不在建構時同步的 DatabaseManager"""
+    db_path = str(tmp_path / "tooling_data.db")
+    db = sqlite3.connect(db_path)
+    db.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)')
+    db.executemany('INSERT INTO t VALUES (?, ?)', [(i, f'n{i}') for i in range(1, 11)])
+    db.commit()
+    db.close()
+
+    monkeypatch.setattr(DatabaseManager, '_initialize_database', lambda self: None)
+    manager = DatabaseManager(db_path=db_path)
+    manager.query_governor = QueryGovernor(timeout_seconds=0.2)
+    get_query_cache().clear()
+    yield manager
+    get_query_cache().clear()
+
+
+def test_partial_results_are_never_cached(manager):
+    cache = manager.query_cache
+
+    truncated = manager.fetch_frame('SELECT * FROM t', max_rows=3)
+    assert truncated.attrs['partial'] and len(truncated) == 3
+    timed_out = manager.fetch_frame(SLOW_ROWS_SQL)
+    assert timed_out.attrs['partial_reason'] == 'timeout'
+    assert cache.get_stats()['entries'] == 0
+
+    manager.fetch_frame('SELECT * FROM t', max_rows=3)
+    assert cache.get_stats()['hits'] == 0
+
+
+def test_complete_results_are_cached(manager):
+    first = manager.fetch_frame('SELECT * FROM t', max_rows=20)
+    second = manager.fetch_frame('SELECT * FROM t', max_rows=20)
+
+    assert len(first) == len(second) == 10
+    assert manager.query_cache.get_stats()['hits'] == 1
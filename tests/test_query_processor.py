@@ -0,0 +1,47 @@
+"""QueryProcessor 與 DatabaseManager 共用讀取連線的測試"""
+import sqlite3
+
+import pytest
+
+from components.database_manager import DatabaseManager
+from components.query_processor import QueryProcessor
+from utils.query_cache import get_query_cache
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "tooling_data.db")
+    db = sqlite3.connect(db_path)
+    db.execute('CREATE TABLE t (id INTEGER)')
+    db.executemany('INSERT INTO t VALUES (?)', [(1,), (2,)])
+    db.commit()
+    db.close()
+
+    monkeypatch.setattr(DatabaseManager, '_initialize_database', lambda self: None)
+    get_query_cache().clear()
+    yield DatabaseManager(db_path=db_path)
+    get_query_cache().clear()
+
+
+def test_processor_reads_through_the_manager_provider(manager):
+    processor = QueryProcessor(manager)
+
+    assert processor.connection_provider is manager.connection_provider
+    assert processor.site_registry is manager.site_registry
+    assert processor.execute_query('SELECT COUNT(*) AS n FROM t')['n'].iloc[0] == 2
+
+
+def test_processor_follows_provider_refreshed_after_sync(manager, tmp_path):
+    processor = QueryProcessor(manager)
+
+    # 同步後 DatabaseManager 重新取得讀取連線（例如衍生資料庫剛建立完成）
+    other_path = str(tmp_path / "tooling_data_derived.db")
+    db = sqlite3.connect(other_path)
+    db.execute('CREATE TABLE t (id INTEGER)')
+    db.executemany('INSERT INTO t VALUES (?)', [(1,), (2,), (3,)])
+    db.commit()
+    db.close()
+    manager.connection_provider = manager._get_read_provider()
+
+    assert processor.connection_provider is manager.connection_provider
+    assert processor.execute_query('SELECT COUNT(*) AS n FROM t')['n'].iloc[0] == 3
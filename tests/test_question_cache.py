@@ -0,0 +1,97 @@
+"""問題到 SQL 快取（QuestionSqlCache）測試"""
+import numpy as np
+import pytest
+
+from utils.question_cache import SIMILARITY_ENV, QuestionSqlCache, normalize_question
+
+SQL = "SELECT COUNT(*) FROM pat_parts_all"
+
+# 問題對應的嵌入向量；「配件總數」與「配件數量」的餘弦相似度約 0.97，「維修中配件」約 0.5
+EMBEDDINGS = {
+    '配件數量': [1.0, 0.0],
+    '配件總數': [0.97, 0.243],
+    '維修中配件': [0.5, 0.866],
+}
+
+
+def embed(question):
+    return EMBEDDINGS[question]
+
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    monkeypatch.delenv(SIMILARITY_ENV, raising=False)
+    return str(tmp_path / "question_cache.db")
+
+
+def test_normalized_question_is_an_exact_match(cache_path):
+    cache = QuestionSqlCache(cache_path)
+    cache.store('配件數量', SQL, 'fp', 1200.0, embed('配件數量'))
+
+    assert normalize_question('  配件數量？ ') == normalize_question('配件數量')
+    result = cache.lookup('  配件數量？ ', 'fp', embed=lambda q: pytest.fail('完全比對不應計算嵌入向量'))
+
+    assert (result.sql, result.tier, result.similarity) == (SQL, 'exact', 1.0)
+
+
+@pytest.mark.parametrize('threshold, question, tier', [
+    (0.95, '配件總數', 'semantic'),
+    (0.98, '配件總數', None),
+    (0.95, '維修中配件', None),
+])
+def test_semantic_match_depends_on_cosine_threshold(cache_path, threshold, question, tier):
+    cache = QuestionSqlCache(cache_path, similarity_threshold=threshold)
+    cache.store('配件數量', SQL, 'fp', 1200.0, embed('配件數量'))
+
+    result = cache.lookup(question, 'fp', embed=embed)
+
+    assert result.tier == tier
+    assert result.sql == (SQL if tier else None)
+    if tier is None:
+        # 未命中時返回計算過的嵌入向量供寫入快取沿用
+        assert np.allclose(result.embedding, embed(question))
+
+
+def test_entries_from_another_fingerprint_are_purged(cache_path):
+    cache = QuestionSqlCache(cache_path)
+    cache.store('配件數量', SQL, 'old', 1200.0, embed('配件數量'))
+    cache.store('維修中配件', "SELECT * FROM pat_parts_all", 'old', 800.0, embed('維修中配件'))
+
+    result = cache.lookup('配件數量', 'new', embed=embed)
+
+    assert result.tier is None
+    stats = cache.get_stats()
+    assert (stats['entries'], stats['invalidations']) == (0, 1)
+    # 清除結果已寫入快取檔案，重新載入後不會復原
+    assert QuestionSqlCache(cache_path).get_stats()['entries'] == 0
+
+
+def test_entries_survive_reload_with_same_fingerprint(cache_path):
+    QuestionSqlCache(cache_path).store('配件數量', SQL, 'fp', 1200.0, embed('配件數量'))
+
+    result = QuestionSqlCache(cache_path).lookup('配件總數', 'fp', embed=embed)
+
+    assert (result.sql, result.tier) == (SQL, 'semantic')
+
+
+def test_threshold_set_at_runtime_is_persisted(cache_path, monkeypatch):
+    monkeypatch.setenv(SIMILARITY_ENV, '0.9')
+    assert QuestionSqlCache(cache_path).similarity_threshold == 0.9
+
+    QuestionSqlCache(cache_path).set_threshold(0.87)
+
+    # 保存的設定優先於環境變數，明確傳入的門檻優先於保存的設定
+    assert QuestionSqlCache(cache_path).similarity_threshold == 0.87
+    assert QuestionSqlCache(cache_path, similarity_threshold=0.99).similarity_threshold == 0.99
+
+
+def test_clear_keeps_saved_threshold(cache_path):
+    cache = QuestionSqlCache(cache_path)
+    cache.store('配件數量', SQL, 'fp', 1200.0, embed('配件數量'))
+    cache.set_threshold(0.85)
+
+    cache.clear()
+
+    reloaded = QuestionSqlCache(cache_path)
+    assert reloaded.get_stats()['entries'] == 0
+    assert reloaded.similarity_threshold == 0.85
@@ -0,0 +1,94 @@
+"""站點登錄表（別名驗證、查詢引用的站點）與站點獨立同步測試"""
+import json
+import os
+import sqlite3
+
+import pytest
+
+from components.database_manager import DatabaseManager
+from utils.site_registry import SITES_UNIFIED_VIEW, SiteRegistry
+
+SITES = [
+    {'alias': 'pat', 'name': 'PAT', 'source': 'PAT', 'db_path': 'sites/pat.db', 'url': 'https://example.test/pat.db'},
+    {'alias': 'kyec_2', 'source': 'KYEC', 'url': 'https://example.test/kyec.db'},
+]
+
+
+@pytest.mark.parametrize('alias', ['', '1pat', 'pat-2', 'pat.db', 'pat x', 'main', 'TEMP'])
+def test_invalid_or_reserved_alias_is_rejected(alias):
+    with pytest.raises(ValueError, match='別名不合法'):
+        SiteRegistry([{'alias': alias, 'source': 'PAT'}])
+
+
+def test_duplicate_alias_is_rejected():
+    with pytest.raises(ValueError, match='重複'):
+        SiteRegistry([{'alias': 'pat', 'source': 'PAT'}, {'alias': 'pat', 'source': 'KYEC'}])
+
+
+def test_unsupported_source_is_rejected():
+    with pytest.raises(ValueError, match='不支援'):
+        SiteRegistry([{'alias': 'pat', 'source': 'OTHER'}])
+
+
+def test_site_paths_are_resolved_against_config_directory(tmp_path):
+    config = tmp_path / "sites.json"
+    config.write_text(json.dumps({'sites': SITES}), encoding='utf-8')
+
+    registry = SiteRegistry.from_file(str(config))
+
+    assert registry.aliases() == ['pat', 'kyec_2']
+    assert registry.get('pat')['db_path'] == os.path.join(str(tmp_path), 'sites', 'pat.db')
+    assert registry.get('kyec_2')['db_path'] == os.path.join(str(tmp_path), 'kyec_2.db')
+    assert registry.get('kyec_2')['name'] == 'kyec_2'
+
+
+def test_missing_config_file_gives_empty_registry(tmp_path):
+    registry = SiteRegistry.from_file(str(tmp_path / "missing.json"))
+    assert not registry
+    assert registry.sites_for_query("SELECT * FROM pat.pat_parts_all") == ()
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT * FROM pat.pat_parts_all", ('pat',)),
+    ("SELECT * FROM PAT.pat_parts_all", ('pat',)),
+    ("SELECT * FROM pat . pat_parts_all", ('pat',)),
+    ("SELECT * FROM kyec_2.kyec_parts_all JOIN pat.pat_parts_all USING (配件編號)", ('pat', 'kyec_2')),
+    (f"SELECT * FROM {SITES_UNIFIED_VIEW}", ('pat', 'kyec_2')),
+    ("SELECT * FROM pat_parts_all", ()),
+    ("SELECT p.配件編號 FROM pat_parts_all p", ()),
+    ("SELECT * FROM mypat.pat_parts_all", ()),
+    ("SELECT * FROM main.pat.x", ()),
+])
+def test_sites_for_query_finds_referenced_sites(sql, expected):
+    registry = SiteRegistry(SITES)
+    assert registry.sites_for_query(sql) == expected
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "tooling_data.db")
+    sqlite3.connect(db_path).close()
+    monkeypatch.setattr(DatabaseManager, '_initialize_database', lambda self: None)
+    manager = DatabaseManager(db_path=db_path)
+    manager.site_registry = SiteRegistry(SITES, base_dir=str(tmp_path))
+    return manager
+
+
+@pytest.mark.parametrize('main_ok, site_results, expected', [
+    (False, {'pat': True, 'kyec_2': True}, False),
+    (True, {'pat': False, 'kyec_2': True}, False),
+    (True, {'pat': True, 'kyec_2': True}, True),
+])
+def test_manual_sync_syncs_every_site_independently(manager, monkeypatch, main_ok, site_results, expected):
+    synced_sites = []
+
+    def fake_download(site=None):
+        synced_sites.append(site['alias'])
+        return site_results[site['alias']]
+
+    monkeypatch.setattr(manager, '_sync_database', lambda: main_ok)
+    monkeypatch.setattr(manager, '_refresh_derived_database', lambda force=False: True)
+    monkeypatch.setattr(manager, '_download_database', fake_download)
+
+    assert manager.manual_sync() is expected
+    assert synced_sites == ['pat', 'kyec_2']
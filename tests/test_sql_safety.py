@@ -0,0 +1,136 @@
+"""SQL 安全性驗證（analyze_sql / SqlSafetyValidator）測試"""
+import pytest
+
+from utils.sql_safety import SqlSafetyValidator, SqlVerdict, analyze_sql
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT * FROM pat_parts_all WHERE 備註 = 'DROP TABLE pat_parts_all'",
+    "SELECT 'DELETE FROM x; UPDATE y SET z = 1' AS 說明",
+    "SELECT 1 -- DROP TABLE pat_parts_all",
+    "SELECT /* INSERT INTO x VALUES (1); */ 1",
+    'SELECT "DELETE" FROM pat_parts_all',
+    "SELECT [UPDATE], `ALTER` FROM pat_parts_all",
+    "SELECT 'it''s; DROP' AS 文字",
+])
+def test_keywords_inside_literals_and_comments_are_allowed(sql):
+    verdict = analyze_sql(sql)
+    assert verdict.is_safe, verdict.reason
+    assert verdict.statement_type == 'SELECT'
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT 1; DROP TABLE pat_parts_all",
+    "SELECT 1; SELECT 2",
+    "SELECT 1;; DELETE FROM pat_parts_all",
+    "SELECT 1; -- 註解\nDROP TABLE pat_parts_all",
+    "SELECT 1 /* 註解 */; VACUUM",
+])
+def test_stacked_statements_are_rejected(sql):
+    assert not analyze_sql(sql).is_safe
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT 1;",
+    "SELECT 1; -- 結尾註解",
+    "SELECT 1 ;  /* 結尾註解 */  ",
+])
+def test_trailing_semicolon_and_comments_are_allowed(sql):
+    assert analyze_sql(sql).is_safe
+
+
+@pytest.mark.parametrize('sql, statement_type', [
+    ("WITH t AS (SELECT 1 AS x) SELECT x FROM t", 'WITH'),
+    ("-- 說明\nWITH t AS (SELECT 1) SELECT * FROM t", 'WITH'),
+    ("SELECT 1 UNION SELECT 2", 'SELECT'),
+    ("SELECT 1 UNION ALL SELECT 2", 'SELECT'),
+    ("SELECT 1 UNION (SELECT 2)", 'SELECT'),
+    ("SELECT 1 EXCEPT SELECT 2 INTERSECT SELECT 3", 'SELECT'),
+    ("SELECT replace(配件名稱, 'a', 'b') FROM pat_parts_all", 'SELECT'),
+    ("SELECT REPLACE (配件名稱, 'a', 'b') FROM pat_parts_all", 'SELECT'),
+])
+def test_read_only_forms_are_allowed(sql, statement_type):
+    verdict = analyze_sql(sql)
+    assert verdict.is_safe, verdict.reason
+    assert verdict.statement_type == statement_type
+
+
+@pytest.mark.parametrize('sql', [
+    "REPLACE INTO pat_parts_all VALUES (1)",
+    "SELECT 1; REPLACE INTO pat_parts_all VALUES (1)",
+    "WITH t AS (SELECT 1) REPLACE INTO x SELECT * FROM t",
+    "INSERT OR REPLACE INTO x VALUES (1)",
+])
+def test_replace_statement_is_rejected(sql):
+    assert not analyze_sql(sql).is_safe
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT 1 UNION DELETE FROM x",
+    "SELECT 1 UNION 'x'",
+    "SELECT 1 UNION",
+    "SELECT 1 UNION VALUES (2)",
+])
+def test_set_operator_must_be_followed_by_select(sql):
+    assert not analyze_sql(sql).is_safe
+
+
+@pytest.mark.parametrize('sql, statement_type', [
+    ("PRAGMA table_info(pat_parts_all)", 'PRAGMA'),
+    ("ATTACH DATABASE 'other.db' AS other", 'ATTACH'),
+    ("EXPLAIN SELECT * FROM pat_parts_all", 'EXPLAIN'),
+    ("EXPLAIN QUERY PLAN SELECT 1", 'EXPLAIN'),
+    ("DETACH DATABASE other", 'DETACH'),
+    ("VACUUM", 'VACUUM'),
+    ("WITH t AS (SELECT 1) DELETE FROM x", 'WITH'),
+    ("SELECT * FROM pat_parts_all WHERE 1 = 1 PRAGMA", 'SELECT'),
+])
+def test_non_select_statements_are_rejected(sql, statement_type):
+    verdict = analyze_sql(sql)
+    assert not verdict.is_safe
+    assert verdict.statement_type == statement_type
+
+
+@pytest.mark.parametrize('sql', ["", "   ", "-- 只有註解", "SELECT 'unterminated", "SELECT /* 未結束"])
+def test_empty_or_unterminated_sql_is_rejected(sql):
+    assert not analyze_sql(sql).is_safe
+
+
+def test_validator_returns_cached_verdict_for_same_text():
+    validator = SqlSafetyValidator()
+    sql = "SELECT * FROM pat_parts_all WHERE 備註 = 'DROP'"
+
+    first = validator.validate(sql)
+    second = validator.validate(sql)
+
+    assert first == second == analyze_sql(sql)
+    assert validator.get_stats()['hits'] == 1
+    assert validator.get_stats()['misses'] == 1
+
+
+def test_validator_cache_is_keyed_on_exact_text():
+    validator = SqlSafetyValidator()
+    assert validator.is_safe("SELECT 1")
+    # 文字不同（多了第二個語句）時重新掃描，不沿用已快取的安全結果
+    assert not validator.is_safe("SELECT 1; DROP TABLE pat_parts_all")
+    assert validator.get_stats()['misses'] == 2
+
+
+def test_validator_cache_evicts_least_recently_used():
+    validator = SqlSafetyValidator(max_entries=2)
+    validator.validate("SELECT 1")
+    validator.validate("SELECT 2")
+    validator.validate("SELECT 1")
+    validator.validate("SELECT 3")
+
+    assert validator.get_stats()['entries'] == 2
+    validator.validate("SELECT 1")
+    assert validator.get_stats()['hits'] == 2
+    validator.validate("SELECT 2")
+    assert validator.get_stats()['misses'] == 4
+
+
+def test_validator_rejects_empty_sql_without_caching():
+    validator = SqlSafetyValidator()
+    assert validator.validate("") == SqlVerdict(False, '', '空白查詢')
+    assert validator.get_stats()['entries'] == 0
@@ -0,0 +1,90 @@
+"""訓練清單同步（TrainingManifest.sync）的數量回報測試"""
+import pytest
+
+from utils.training_manifest import TrainingManifest, training_item
+from utils.training_store import STORE_COLLECTIONS
+
+
+class _Collection:
+    def __init__(self):
+        self.items = {}
+
+    def count(self):
+        return len(self.items)
+
+    def get(self, ids=None, include=()):
+        return {'ids': [training_id for training_id in (ids or self.items) if training_id in self.items]}
+
+    def add(self, ids, documents, embeddings):
+        self.items.update(zip(ids, documents))
+
+
+class _Vanna:
+    """批次寫入路徑使用的 Vanna 替身（embedding_function 與各種類 collection）"""
+
+    def __init__(self):
+        self.embedded = 0
+        for attribute in STORE_COLLECTIONS.values():
+            setattr(self, attribute, _Collection())
+
+    def embedding_function(self, documents):
+        self.embedded += len(documents)
+        return [[0.0] for _ in documents]
+
+    def remove_training_data(self, training_id):
+        for attribute in STORE_COLLECTIONS.values():
+            getattr(self, attribute).items.pop(training_id, None)
+
+
+ITEMS = [
+    training_item('ddl', 'CREATE TABLE t (x)'),
+    training_item('documentation', '配件狀態說明'),
+    training_item('sql', 'SELECT COUNT(*) FROM pat_parts_all', question='配件數量'),
+]
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return TrainingManifest.for_store(str(tmp_path))
+
+
+def test_new_items_are_reported_as_added(manifest):
+    vn = _Vanna()
+    result = manifest.sync(vn, ITEMS)
+
+    assert (result['added'], result['skipped'], result['unchanged']) == (3, 0, 0)
+    assert vn.embedded == 3
+
+
+def test_items_already_in_store_are_reported_as_skipped(manifest, tmp_path):
+    vn = _Vanna()
+    manifest.sync(vn, ITEMS)
+
+    # 清單遺失但向量資料庫仍有相同項目：沿用既有 ID，不重新嵌入也不計為新增
+    fresh = TrainingManifest(str(tmp_path / "other_manifest.json"))
+    result = fresh.sync(vn, ITEMS)
+
+    assert (result['added'], result['skipped']) == (0, 3)
+    assert vn.embedded == 3
+    assert sorted(fresh.training_ids()) == sorted(manifest.training_ids())
+
+
+def test_unchanged_and_rejected_items_are_counted_separately(manifest):
+    vn = _Vanna()
+    manifest.sync(vn, ITEMS)
+
+    unsafe = training_item('sql', 'DELETE FROM pat_parts_all', question='刪除全部')
+    result = manifest.sync(vn, ITEMS + [unsafe])
+
+    assert result == {**result, 'added': 0, 'skipped': 0, 'rejected': 1, 'failed': 0, 'unchanged': 3}
+    assert unsafe['hash'] not in manifest.content_hashes()
+
+
+def test_removed_items_are_deleted_from_store(manifest):
+    vn = _Vanna()
+    manifest.sync(vn, ITEMS)
+
+    result = manifest.sync(vn, ITEMS[:2])
+
+    assert (result['removed'], result['unchanged']) == (1, 2)
+    assert vn.sql_collection.count() == 0
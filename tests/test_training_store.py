@@ -0,0 +1,167 @@
+"""向量資料庫訓練資料整理（compact_training_store）測試"""
+import json
+
+import pytest
+
+from utils.training_store import STAGING_SUFFIX, STORE_COLLECTIONS, compact_training_store
+
+
+class _FakeCollection:
+    """只實作整理流程使用的 Chroma collection 介面"""
+
+    def __init__(self, client, name, metadata=None):
+        self.client = client
+        self.name = name
+        self.metadata = metadata
+        self.items = {}
+
+    def _check_alive(self):
+        if self.client.collections.get(self.name) is not self:
+            raise RuntimeError(f"collection {self.name} 已不存在")
+
+    def count(self):
+        self._check_alive()
+        return len(self.items)
+
+    def get(self, ids=None, include=()):
+        self._check_alive()
+        keys = list(self.items)
+        if self.client.reverse_order:
+            keys.reverse()
+        if ids is not None:
+            keys = [key for key in keys if key in ids]
+        return {
+            'ids': keys,
+            'documents': [self.items[key][0] for key in keys],
+            'embeddings': [self.items[key][1] for key in keys],
+            'metadatas': [self.items[key][2] for key in keys],
+        }
+
+    def add(self, ids, documents, embeddings, metadatas=None):
+        self._check_alive()
+        for index, training_id in enumerate(ids):
+            self.items[training_id] = (documents[index], embeddings[index],
+                                       metadatas[index] if metadatas else None)
+
+    def modify(self, name=None, metadata=None):
+        self._check_alive()
+        if name is not None:
+            assert name not in self.client.collections
+            del self.client.collections[self.name]
+            self.name = name
+            self.client.collections[name] = self
+
+
+class _FakeClient:
+    def __init__(self, reverse_order=False):
+        self.collections = {}
+        self.reverse_order = reverse_order
+
+    def create_collection(self, name, embedding_function=None, metadata=None):
+        assert name not in self.collections
+        self.collections[name] = _FakeCollection(self, name, metadata)
+        return self.collections[name]
+
+    def delete_collection(self, name):
+        if name not in self.collections:
+            raise ValueError(f"collection {name} 不存在")
+        del self.collections[name]
+
+
+class _FakeVanna:
+    """具有 Chroma client 與各種類 collection 屬性的 Vanna 替身"""
+
+    def __init__(self, client):
+        self.chroma_client = client
+        self.embedding_function = lambda documents: [[0.0] for _ in documents]
+        for kind, attribute in STORE_COLLECTIONS.items():
+            setattr(self, attribute, client.create_collection(kind))
+
+
+def _sql_document(question, sql):
+    return json.dumps({'question': question, 'sql': sql}, ensure_ascii=False)
+
+
+def _populate(vn):
+    vn.sql_collection.add(
+        ids=['c-sql', 'a-sql', 'b-sql', 'd-sql'],
+        documents=[_sql_document('配件數量', 'SELECT COUNT(*) FROM pat_parts_all'),
+                   _sql_document('配件數量', 'SELECT  COUNT(*) FROM pat_parts_all;'),
+                   _sql_document('配件數量 ', 'SELECT COUNT(*)\nFROM pat_parts_all'),
+                   _sql_document('維修中配件', 'SELECT * FROM pat_parts_all')],
+        embeddings=[[1.0], [2.0], [3.0], [4.0]],
+    )
+    vn.ddl_collection.add(ids=['z-ddl', 'y-ddl'], documents=['CREATE TABLE t (x)', 'CREATE TABLE t (x);'],
+                          embeddings=[[5.0], [6.0]])
+
+
+@pytest.mark.parametrize('reverse_order', [False, True])
+def test_survivor_is_smallest_id_regardless_of_store_order(tmp_path, reverse_order):
+    vn = _FakeVanna(_FakeClient(reverse_order=reverse_order))
+    _populate(vn)
+
+    report = compact_training_store(vn, str(tmp_path))
+
+    assert sorted(vn.sql_collection.get()['ids']) == ['a-sql', 'd-sql']
+    assert vn.ddl_collection.get()['ids'] == ['y-ddl']
+    assert report['removed'] == {'ddl': 1, 'documentation': 0, 'sql': 2}
+    assert report['after']['total'] == 3
+
+
+@pytest.mark.parametrize('reverse_order', [False, True])
+def test_manifest_id_is_preferred_over_smallest_id(tmp_path, reverse_order):
+    vn = _FakeVanna(_FakeClient(reverse_order=reverse_order))
+    _populate(vn)
+
+    compact_training_store(vn, str(tmp_path), preferred_ids=['c-sql', 'b-sql'])
+
+    # 同一組有多個清單 ID 時取其中最小的
+    assert sorted(vn.sql_collection.get()['ids']) == ['b-sql', 'd-sql']
+
+
+def test_rebuilt_collection_keeps_name_and_vectors(tmp_path):
+    client = _FakeClient()
+    vn = _FakeVanna(client)
+    _populate(vn)
+
+    compact_training_store(vn, str(tmp_path))
+
+    assert sorted(client.collections) == ['ddl', 'documentation', 'sql']
+    assert vn.sql_collection is client.collections['sql']
+    assert vn.sql_collection.name == 'sql'
+    assert vn.sql_collection.items['a-sql'][1] == [2.0]
+
+
+def test_queries_always_see_a_live_collection_during_rebuild(tmp_path, monkeypatch):
+    client = _FakeClient()
+    vn = _FakeVanna(client)
+    _populate(vn)
+
+    # 重建過程中每次操作 Chroma 時，模擬另一個工作階段查詢 vn 目前的 collection
+    original_add, original_delete = _FakeCollection.add, client.delete_collection
+
+    def add_and_probe(self, *args, **kwargs):
+        original_add(self, *args, **kwargs)
+        vn.sql_collection.count()
+
+    def delete_and_probe(name):
+        original_delete(name)
+        vn.sql_collection.count()
+
+    monkeypatch.setattr(_FakeCollection, 'add', add_and_probe)
+    monkeypatch.setattr(client, 'delete_collection', delete_and_probe)
+
+    compact_training_store(vn, str(tmp_path))
+    assert vn.sql_collection.count() == 2
+
+
+def test_leftover_staging_collection_is_replaced(tmp_path):
+    client = _FakeClient()
+    vn = _FakeVanna(client)
+    _populate(vn)
+    client.create_collection(f"sql{STAGING_SUFFIX}").add(ids=['stale'], documents=['x'], embeddings=[[0.0]])
+
+    compact_training_store(vn, str(tmp_path))
+
+    assert f"sql{STAGING_SUFFIX}" not in client.collections
+    assert 'stale' not in vn.sql_collection.items
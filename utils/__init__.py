@@ -3,10 +3,32 @@ Utils module for Streamlit Vanna AI Chatbot
 
 This module contains utility functions and configurations:
 - VannaConfig: Vanna AI 配置和管理
+- ConnectionProvider: 行程共用的唯讀 SQLite 連線
+- QueryResultCache: 以資料庫版本為鍵的查詢結果快取
+- BatchExecutor: 以執行緒池並行執行獨立查詢
+- PartsReplica: 配件資料的記憶體常駐副本
+- SqlSafetyValidator: 以詞法掃描驗證唯讀 SQL 並快取結果
+- SchemaCatalog: 以資料庫版本快取的資料表結構目錄
+- SiteRegistry: 以 ATTACH 掛載的外包廠站點資料庫登錄表
+- QueryLogger: 查詢耗時紀錄與慢查詢的查詢計畫
+- TrainingManifest: 以內容雜湊追蹤已嵌入的內建訓練資料
+- compact_training_store: 合併向量資料庫中重複的訓練資料
+- QuestionSqlCache: 問題到 SQL 的完全比對與語意比對快取
 - helpers: 輔助函數和工具
 """
 
-from .vanna_config import VannaConfig
+from .vanna_config import VannaConfig, get_vanna_engine, reload_vanna_engine
+from .db_connection import ConnectionProvider, get_connection_provider
+from .query_cache import QueryResultCache, get_query_cache, run_cached_query
+from .batch_executor import BatchExecutor, get_batch_executor
+from .parts_replica import PartsReplica, get_parts_replica
+from .sql_safety import SqlSafetyValidator, SqlVerdict, analyze_sql, get_sql_validator
+from .schema_catalog import SchemaCatalog, get_schema_catalog
+from .site_registry import SiteRegistry, get_site_registry
+from .query_log import QueryLogger, get_query_logger
+from .training_manifest import TrainingManifest, training_item
+from .training_store import compact_training_store
+from .question_cache import QuestionSqlCache, normalize_question
 from .helpers import (
     format_dataframe,
     get_status_color,
@@ -19,6 +41,7 @@ from .helpers import (
     create_summary_table,
     generate_report_filename,
     check_data_quality,
+    check_data_quality_chunks,
     create_alert_message,
     format_time_duration,
     safe_divide,
@@ -28,6 +51,32 @@ from .helpers import (
 
 __all__ = [
     'VannaConfig',
+    'get_vanna_engine',
+    'reload_vanna_engine',
+    'ConnectionProvider',
+    'get_connection_provider',
+    'QueryResultCache',
+    'get_query_cache',
+    'run_cached_query',
+    'BatchExecutor',
+    'get_batch_executor',
+    'PartsReplica',
+    'get_parts_replica',
+    'SqlSafetyValidator',
+    'SqlVerdict',
+    'analyze_sql',
+    'get_sql_validator',
+    'SchemaCatalog',
+    'get_schema_catalog',
+    'SiteRegistry',
+    'get_site_registry',
+    'QueryLogger',
+    'get_query_logger',
+    'TrainingManifest',
+    'training_item',
+    'compact_training_store',
+    'QuestionSqlCache',
+    'normalize_question',
     'format_dataframe',
     'get_status_color',
     'format_number',
@@ -39,6 +88,7 @@ __all__ = [
     'create_summary_table',
     'generate_report_filename',
     'check_data_quality',
+    'check_data_quality_chunks',
     'create_alert_message',
     'format_time_duration',
     'safe_divide',
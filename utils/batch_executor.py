@@ -0,0 +1,69 @@
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# 批次查詢執行緒池的預設大小（SQLite 唯讀連線可並行讀取）
+DEFAULT_MAX_WORKERS = 4
+
+
+class BatchExecutor:
+    """行程共用的批次查詢執行器
+
+    將一組彼此獨立、具名的查詢工作送入有上限的執行緒池並等待全部完成，
+    頁面延遲取決於最慢的查詢而非總和。每個工作執行緒透過 ConnectionProvider
+    取得自己的唯讀連線。在工作執行緒內再次呼叫批次執行時改為直接依序執行，
+    避免巢狀批次佔滿執行緒池而互相等待。
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.logger = logging.getLogger(__name__)
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._worker_state = threading.local()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """延遲建立執行緒池"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="batch-query",
+                    initializer=self._mark_worker
+                )
+            return self._executor
+
+    def _mark_worker(self):
+        """標記目前執行緒為執行緒池的工作執行緒"""
+        self._worker_state.is_worker = True
+
+    def _run_task(self, name: str, task: Callable[[], Any]) -> Any:
+        """執行單一工作並記錄耗時，失敗時返回 None"""
+        started = time.perf_counter()
+        try:
+            return task()
+        except Exception as e:
+            self.logger.error(f"批次查詢 {name} 失敗: {str(e)}")
+            return None
+        finally:
+            self.logger.debug(f"批次查詢 {name} 耗時 {time.perf_counter() - started:.3f} 秒")
+
+    def run_batch(self, tasks: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """並行執行具名工作，全部完成後依名稱返回結果"""
+        if len(tasks) <= 1 or getattr(self._worker_state, 'is_worker', False):
+            return {name: self._run_task(name, task) for name, task in tasks.items()}
+
+        executor = self._get_executor()
+        futures = {name: executor.submit(self._run_task, name, task) for name, task in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+_batch_executor = BatchExecutor()
+
+
+def get_batch_executor() -> BatchExecutor:
+    """取得行程共用的批次查詢執行器"""
+    return _batch_executor
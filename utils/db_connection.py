@@ -0,0 +1,236 @@
+import os
+import sqlite3
+import threading
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 預設的 SQLite 讀取調校參數
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024  # 256 MB 記憶體映射
+DEFAULT_CACHE_SIZE = -64 * 1024        # 負值代表 KiB，約 64 MB 頁面快取
+
+# 每條連線保留的預備語句數量（相同 SQL 文字重複執行時不必重新編譯）
+DEFAULT_STATEMENT_CACHE = 256
+
+
+class ConnectionProvider:
+    """行程共用的唯讀 SQLite 連線提供者
+
+    每個執行緒持有自己的唯讀連線（URI `mode=ro`），重複使用以避免每次查詢都
+    重新開檔、解析 schema 與暖機頁面快取。當資料庫檔案被替換（inode、大小或
+    修改時間改變）或呼叫 `invalidate()` 時，各執行緒會在下一次取用時重新連線。
+
+    啟用記憶體副本模式（`enable_memory_clone()`）後，資料庫以 SQLite backup API
+    複製到共享快取的記憶體資料庫，所有執行緒改讀記憶體副本。檔案變更時建立新的
+    副本後再切換指向，讀取中的連線仍可完成目前的查詢。
+
+    站點資料庫（`configure_attachments()`）以 ATTACH 唯讀掛載在各自的 schema 別名下，
+    並可在每條連線建立跨站點的 TEMP VIEW。單一站點檔案替換時只重新掛載該站點，
+    其他站點與主資料庫的連線狀態、版本識別都不受影響。
+    """
+
+    def __init__(self, db_path: str, mmap_size: int = DEFAULT_MMAP_SIZE,
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        self.db_path = os.path.abspath(db_path)
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.logger = logging.getLogger(__name__)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+        # 記憶體副本: (URI, 保持副本存活的連線, 複製時的檔案特徵)
+        self.in_memory = False
+        self._memory: Optional[Tuple[str, sqlite3.Connection, Tuple[int, int, int]]] = None
+        self._memory_lock = threading.Lock()
+        self._memory_serial = 0
+
+        # 站點資料庫掛載: 別名 -> 路徑，以及依已掛載別名產生 TEMP VIEW SQL 的函式
+        self._attachments: Dict[str, str] = {}
+        self._view_builder: Optional[Callable[[List[str]], List[str]]] = None
+
+    def _file_signature(self, path: Optional[str] = None) -> Optional[Tuple[int, int, int]]:
+        """取得資料庫檔案特徵，用於偵測檔案替換"""
+        try:
+            stat = os.stat(path or self.db_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _site_signatures(self) -> Dict[str, Tuple[int, int, int]]:
+        """目前存在的站點資料庫檔案特徵"""
+        signatures = {}
+        for alias, path in self._attachments.items():
+            signature = self._file_signature(path)
+            if signature is not None:
+                signatures[alias] = signature
+        return signatures
+
+    def _open(self, sites: Dict[str, Tuple[int, int, int]]) -> sqlite3.Connection:
+        """開啟一條經過調校的唯讀連線，並掛載已存在的站點資料庫"""
+        memory = self._memory
+        if memory is not None:
+            conn = sqlite3.connect(memory[0], uri=True, check_same_thread=False,
+                                   cached_statements=DEFAULT_STATEMENT_CACHE)
+        else:
+            uri = f"file:{self.db_path}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                   cached_statements=DEFAULT_STATEMENT_CACHE)
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+            conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+
+        for alias in sites:
+            self._attach(conn, alias)
+        if sites and self._view_builder is not None:
+            for statement in self._view_builder(list(sites)):
+                conn.execute(statement)
+
+        # 記憶體資料庫無法以 mode=ro 開啟，改以 query_only 禁止寫入（需在建立 TEMP VIEW 之後）
+        if memory is not None:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _attach(self, conn: sqlite3.Connection, alias: str):
+        """以唯讀方式掛載站點資料庫"""
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (f"file:{self._attachments[alias]}?mode=ro",))
+
+    def get_connection(self) -> sqlite3.Connection:
+        """取得目前執行緒的唯讀連線，必要時重新開啟"""
+        signature = self._file_signature()
+        if signature is None:
+            raise FileNotFoundError(f"資料庫文件不存在: {self.db_path}")
+        if self.in_memory:
+            self._ensure_memory_clone(signature)
+
+        sites = self._site_signatures() if self._attachments else {}
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            if (self._local.generation == self._generation
+                    and self._local.signature == signature
+                    and self._local.sites.keys() == sites.keys()):
+                # 只重新掛載檔案已替換的站點
+                for alias, site_signature in sites.items():
+                    if self._local.sites[alias] != site_signature:
+                        conn.execute(f"DETACH DATABASE {alias}")
+                        self._attach(conn, alias)
+                        self._local.sites[alias] = site_signature
+                return conn
+            self._close_local()
+
+        conn = self._open(sites)
+        self._local.conn = conn
+        self._local.generation = self._generation
+        self._local.signature = signature
+        self._local.sites = sites
+        return conn
+
+    def _close_local(self):
+        """關閉目前執行緒的連線"""
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception as e:
+                self.logger.warning(f"關閉資料庫連線失敗: {str(e)}")
+
+    def version_token(self, sites: Iterable[str] = ()) -> Tuple:
+        """取得目前資料庫版本識別（路徑、檔案特徵與世代），供查詢結果快取使用
+
+        `sites` 指定查詢引用的站點別名，版本識別只包含這些站點的檔案特徵，
+        其他站點更新時不影響快取。
+        """
+        signature = self._file_signature()
+        if self.in_memory and signature is not None:
+            self._ensure_memory_clone(signature)
+        token = (self.db_path, signature, self._generation)
+        if sites:
+            token += tuple((alias, self._file_signature(self._attachments[alias])
+                            if alias in self._attachments else None) for alias in sites)
+        return token
+
+    def configure_attachments(self, attachments: Dict[str, str],
+                              view_builder: Optional[Callable[[List[str]], List[str]]] = None):
+        """設定要掛載的站點資料庫，設定變更時所有執行緒重新開啟連線"""
+        attachments = {alias: os.path.abspath(path) for alias, path in attachments.items()}
+        with self._lock:
+            if attachments == self._attachments and view_builder == self._view_builder:
+                return
+            self._attachments = attachments
+            self._view_builder = view_builder
+            self._generation += 1
+        self.logger.info(f"站點資料庫掛載設定已更新: {', '.join(attachments) or '無'}")
+
+    def invalidate(self):
+        """通知所有執行緒在下一次取用時重新開啟連線（例如資料庫檔案已替換）"""
+        if self.in_memory:
+            self.refresh_memory_clone()
+            return
+        with self._lock:
+            self._generation += 1
+        self.logger.info(f"資料庫連線已標記重新開啟: {self.db_path}")
+
+    def enable_memory_clone(self):
+        """啟用記憶體副本模式並立即建立副本"""
+        if self.in_memory:
+            return
+        self.refresh_memory_clone()
+        self.in_memory = True
+
+    def _ensure_memory_clone(self, signature: Tuple[int, int, int]):
+        """檔案特徵與記憶體副本不一致時重新複製"""
+        memory = self._memory
+        if memory is None or memory[2] != signature:
+            self.refresh_memory_clone(expected=memory)
+
+    def refresh_memory_clone(self, expected: Optional[Tuple] = None):
+        """以 backup API 將資料庫複製到新的共享快取記憶體資料庫，完成後切換指向
+
+        `expected` 為呼叫端看到的舊副本；若其他執行緒已完成更新則不重複複製。
+        """
+        with self._memory_lock:
+            if expected is not None and self._memory is not expected:
+                return
+
+            signature = self._file_signature()
+            if signature is None:
+                raise FileNotFoundError(f"資料庫文件不存在: {self.db_path}")
+
+            self._memory_serial += 1
+            uri = f"file:memdb-{os.getpid()}-{id(self)}-{self._memory_serial}?mode=memory&cache=shared"
+            keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            source = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                source.backup(keeper)
+            except Exception:
+                keeper.close()
+                raise
+            finally:
+                source.close()
+
+            with self._lock:
+                previous = self._memory
+                self._memory = (uri, keeper, signature)
+                self._generation += 1
+
+        # 舊副本在最後一條讀取連線關閉後釋放
+        if previous is not None:
+            previous[1].close()
+        self.logger.info(f"資料庫記憶體副本已更新: {self.db_path}")
+
+
+_providers: Dict[str, ConnectionProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_connection_provider(db_path: str = "tooling_data.db") -> ConnectionProvider:
+    """取得指定資料庫的行程共用連線提供者"""
+    key = os.path.abspath(db_path)
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = ConnectionProvider(key)
+            _providers[key] = provider
+        return provider
@@ -0,0 +1,101 @@
+import json
+import hashlib
+import sqlite3
+from typing import Any, Dict, Iterable, List
+
+# 可增量同步的資料表及其 row_key 對應的主鍵欄位
+DELTA_TABLE_KEYS = {
+    'pat_parts_all': '配件編號',
+    'kyec_parts_all': '配件編號',
+    'pat_stats_weekly': '配件種類編號',
+    'kyec_stats_weekly': '板全號',
+}
+
+CHANGE_LOG_COLUMNS = ('id', 'table_name', 'operation', 'timestamp', 'row_key',
+                      'column_name', 'old_value', 'new_value', 'user', 'note')
+
+
+def get_high_water_id(conn: sqlite3.Connection) -> int:
+    """獲取本地 table_change_log 的最大 id"""
+    row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM table_change_log").fetchone()
+    return int(row[0])
+
+
+def compute_content_checksum(conn: sqlite3.Connection) -> str:
+    """計算可同步資料表內容的 SHA-256 校驗碼
+
+    發佈端需以相同方式計算（資料表依名稱排序、資料列依主鍵排序、每列以 JSON 序列化），
+    才能比對增量同步後的內容是否一致。
+    """
+    digest = hashlib.sha256()
+    for table in sorted(DELTA_TABLE_KEYS):
+        key_column = DELTA_TABLE_KEYS[table]
+        digest.update(table.encode('utf-8'))
+        cursor = conn.execute(f'SELECT * FROM "{table}" ORDER BY "{key_column}"')
+        for row in cursor:
+            digest.update(json.dumps(row, ensure_ascii=False, default=str).encode('utf-8'))
+            digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _parse_row_key(row_key: str) -> Any:
+    """解析 row_key（JSON 陣列，僅支援單一主鍵）"""
+    try:
+        values = json.loads(row_key)
+    except (TypeError, ValueError):
+        raise ValueError(f"無法解析 row_key: {row_key}")
+
+    if not isinstance(values, list) or len(values) != 1:
+        raise ValueError(f"不支援的複合 row_key: {row_key}")
+    return values[0]
+
+
+def apply_changes(conn: sqlite3.Connection, changes: Iterable[Dict[str, Any]]) -> int:
+    """將變更紀錄套用到本地資料表並寫入 table_change_log，返回套用筆數
+
+    任何無法安全套用的變更都會拋出 ValueError，由呼叫端改為完整下載。
+    """
+    applied = 0
+    log_rows: List[tuple] = []
+    table_columns: Dict[str, set] = {}
+
+    for change in changes:
+        table = change.get('table_name')
+        operation = (change.get('operation') or '').lower()
+        column = change.get('column_name')
+
+        if table not in DELTA_TABLE_KEYS:
+            raise ValueError(f"不支援增量同步的資料表: {table}")
+
+        key_column = DELTA_TABLE_KEYS[table]
+        key = _parse_row_key(change.get('row_key'))
+
+        if operation in ('insert', 'update'):
+            if table not in table_columns:
+                table_columns[table] = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+            if column not in table_columns[table]:
+                raise ValueError(f"變更紀錄的欄位不存在: {table}.{column}")
+            if operation == 'insert':
+                conn.execute(
+                    f'INSERT INTO "{table}" ("{key_column}") '
+                    f'SELECT ? WHERE NOT EXISTS (SELECT 1 FROM "{table}" WHERE "{key_column}" = ?)',
+                    (key, key)
+                )
+            cursor = conn.execute(
+                f'UPDATE "{table}" SET "{column}" = ? WHERE "{key_column}" = ?',
+                (change.get('new_value'), key)
+            )
+            if cursor.rowcount == 0:
+                raise ValueError(f"找不到要更新的資料列: {table} {key}")
+        elif operation == 'delete':
+            conn.execute(f'DELETE FROM "{table}" WHERE "{key_column}" = ?', (key,))
+        else:
+            raise ValueError(f"不支援的操作類型: {change.get('operation')}")
+
+        log_rows.append(tuple(change.get(name) for name in CHANGE_LOG_COLUMNS))
+        applied += 1
+
+    column_list = ", ".join(CHANGE_LOG_COLUMNS)
+    placeholders = ", ".join("?" for _ in CHANGE_LOG_COLUMNS)
+    conn.executemany(f"INSERT INTO table_change_log ({column_list}) VALUES ({placeholders})", log_rows)
+    return applied
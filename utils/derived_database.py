@@ -0,0 +1,404 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 衍生資料庫結構版本，變更建置步驟時需遞增以觸發重建
+DERIVED_SCHEMA_VERSION = 5
+
+# 各來源原始配件狀態對應的標準狀態代碼（未列出者歸為 OTHER）
+STATUS_CODES = {
+    'PAT': {
+        'PRODUCTION': 'PRODUCTION',
+        'REPAIR': 'REPAIR',
+        'OUT_REPAIR': 'OUT_REPAIR',
+        'BORROW': 'BORROW',
+    },
+    'KYEC': {
+        '正常生產': 'PRODUCTION',
+        '廠內維修': 'REPAIR',
+        '客戶維修': 'OUT_REPAIR',
+        '客戶借出': 'BORROW',
+        '待release': 'PENDING_RELEASE',
+    },
+}
+
+# 標準狀態代碼的顯示名稱
+STATUS_LABELS = {
+    'PRODUCTION': '正常生產',
+    'REPAIR': '廠內維修',
+    'OUT_REPAIR': '客戶維修',
+    'BORROW': '客戶借出',
+    'PENDING_RELEASE': '待release',
+    'OTHER': '其它',
+}
+
+# 各來源的配件資料表
+SOURCE_TABLES = {
+    'PAT': 'pat_parts_all',
+    'KYEC': 'kyec_parts_all',
+}
+
+# 統一配件資料表各欄位在來源資料表中對應的欄位
+UNIFIED_COLUMNS = {
+    'PAT': {
+        '配件編號': '配件編號',
+        '配件名稱': '配件名稱',
+        '客戶名稱': '客戶名稱',
+        '配件種類': '配件種類',
+        '產品型號': '產品型號_簡化',
+        '站點': '站點',
+        '開始時間': '開始時間',
+    },
+    'KYEC': {
+        '配件編號': '配件編號',
+        '配件名稱': '配件種類',
+        '客戶名稱': '客戶名稱',
+        '配件種類': '配件種類',
+        '產品型號': '客戶產品型號',
+        '站點': '板全號',
+        '開始時間': '狀態開始時間',
+    },
+}
+
+# 衍生資料庫中的二級索引 (索引名稱, 資料表, 欄位)
+INDEX_DEFINITIONS = [
+    ('idx_pat_parts_status', 'pat_parts_all', ('配件狀態',)),
+    ('idx_pat_parts_part_no', 'pat_parts_all', ('配件編號',)),
+    ('idx_pat_parts_customer', 'pat_parts_all', ('客戶名稱',)),
+    ('idx_pat_parts_type', 'pat_parts_all', ('配件種類',)),
+    ('idx_kyec_parts_status', 'kyec_parts_all', ('配件狀態',)),
+    ('idx_kyec_parts_part_no', 'kyec_parts_all', ('配件編號',)),
+    ('idx_kyec_parts_customer', 'kyec_parts_all', ('客戶名稱',)),
+    ('idx_kyec_parts_type', 'kyec_parts_all', ('配件種類',)),
+    ('idx_change_log_timestamp', 'table_change_log', ('timestamp',)),
+    ('idx_change_log_table', 'table_change_log', ('table_name', 'timestamp')),
+    ('idx_change_log_operation', 'table_change_log', ('operation', 'timestamp')),
+    ('idx_change_log_row_key', 'table_change_log', ('row_key',)),
+]
+
+# 週統計快照的來源 (週統計表, 產品型號欄位, 站點欄位, 待release 欄位運算式)
+SNAPSHOT_SOURCES = {
+    'PAT': ('pat_stats_weekly', '產品型號_簡化', '站點', '0'),
+    'KYEC': ('kyec_stats_weekly', '客戶產品型號', '板全號', '待release'),
+}
+
+SNAPSHOT_COLUMNS = ('週開始日', '來源', '產品型號', '站點', '配件種類', '總數量', '正常生產',
+                    '廠內維修', '客戶維修', '客戶借出', '待release', '其它', '每周狀態')
+
+# 衍生資料庫新增的資料表（不屬於上游 schema）
+DERIVED_TABLES = ('parts_status_cube', 'derived_meta', 'change_log_fts', 'parts_weekly_snapshot',
+                  'parts_unified')
+
+# 變更紀錄全文索引涵蓋的欄位
+CHANGE_LOG_FTS_COLUMNS = ('row_key', 'column_name', 'old_value', 'new_value')
+
+_build_lock = threading.Lock()
+
+
+def derived_db_path(db_path: str) -> str:
+    """取得上游資料庫對應的衍生資料庫路徑"""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}_derived{ext or '.db'}"
+
+
+def resolve_read_path(db_path: str) -> str:
+    """取得查詢應使用的資料庫路徑（衍生資料庫存在時優先）"""
+    derived_path = derived_db_path(db_path)
+    return derived_path if os.path.exists(derived_path) else db_path
+
+
+def is_derived_table(name: str) -> bool:
+    """判斷資料表是否為衍生資料庫新增（含 FTS5 影子表與 ANALYZE 統計表）"""
+    return (name in DERIVED_TABLES
+            or name.startswith('change_log_fts_')
+            or name.startswith('sqlite_stat'))
+
+
+def status_code_case_sql(source: str, column: str = "配件狀態") -> str:
+    """產生將原始配件狀態轉為標準狀態代碼的 CASE 運算式"""
+    whens = " ".join(f"WHEN '{raw}' THEN '{code}'" for raw, code in STATUS_CODES.get(source, {}).items())
+    return f"CASE {column} {whens} ELSE 'OTHER' END"
+
+
+def status_label_case_sql(column: str = "狀態代碼") -> str:
+    """產生將標準狀態代碼轉為顯示名稱的 CASE 運算式"""
+    whens = " ".join(f"WHEN '{code}' THEN '{label}'" for code, label in STATUS_LABELS.items())
+    return f"CASE {column} {whens} END"
+
+
+class DerivedDatabaseBuilder:
+    """衍生資料庫建置器
+
+    以 SQLite backup API 複製上游資料庫（上游檔案保持不變），在副本中建立
+    查詢用的衍生資料結構，完成後以原子性更名取代舊的衍生資料庫。
+    """
+
+    def __init__(self, source_path: str, target_path: str = None, snapshot_time: Optional[datetime] = None):
+        self.source_path = os.path.abspath(source_path)
+        self.target_path = os.path.abspath(target_path or derived_db_path(source_path))
+        # 週統計快照所屬的時間（同步時間），未指定時使用上游檔案的修改時間
+        self.snapshot_time = snapshot_time
+        self.logger = logging.getLogger(__name__)
+
+    def _steps(self) -> List[Tuple[str, Callable[[sqlite3.Connection], None]]]:
+        """建置步驟（依序執行）"""
+        return [
+            ('統一配件資料表', self._build_parts_unified),
+            ('狀態統計立方體', self._build_status_cube),
+            ('建立索引', self._create_indexes),
+            ('變更紀錄全文索引', self._build_change_log_fts),
+            ('週統計快照', self._build_weekly_snapshot),
+        ]
+
+    def is_stale(self) -> bool:
+        """檢查衍生資料庫是否需要重建"""
+        if not os.path.exists(self.target_path):
+            return True
+        if os.path.getmtime(self.target_path) < os.path.getmtime(self.source_path):
+            return True
+        try:
+            conn = sqlite3.connect(f"file:{self.target_path}?mode=ro", uri=True)
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return True
+        return version != DERIVED_SCHEMA_VERSION
+
+    def build(self) -> Dict[str, float]:
+        """建置衍生資料庫，返回各步驟耗時（秒）"""
+        timings = {}
+
+        with _build_lock:
+            fd, tmp_path = tempfile.mkstemp(prefix=".derived-", suffix=".db",
+                                            dir=os.path.dirname(self.target_path))
+            os.close(fd)
+            try:
+                started = time.perf_counter()
+                source = sqlite3.connect(f"file:{self.source_path}?mode=ro", uri=True)
+                conn = sqlite3.connect(tmp_path)
+                try:
+                    source.backup(conn)
+                    timings['複製資料庫'] = time.perf_counter() - started
+
+                    for name, step in self._steps():
+                        step_started = time.perf_counter()
+                        step(conn)
+                        conn.commit()
+                        timings[name] = time.perf_counter() - step_started
+
+                    timings['總計'] = time.perf_counter() - started
+                    self._write_meta(conn, timings)
+                    conn.execute(f"PRAGMA user_version = {DERIVED_SCHEMA_VERSION}")
+                    conn.commit()
+                finally:
+                    conn.close()
+                    source.close()
+
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, self.target_path)
+                self.logger.info(f"衍生資料庫建置完成，耗時 {timings['總計']:.3f} 秒")
+                return timings
+
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def _build_parts_unified(self, conn: sqlite3.Connection):
+        """建立合併 PAT / KYEC 的統一配件資料表（含標準狀態代碼與狀態旗標）"""
+        conn.execute("DROP TABLE IF EXISTS parts_unified")
+        conn.execute("""
+            CREATE TABLE parts_unified (
+                來源 TEXT NOT NULL,
+                配件編號 TEXT,
+                配件名稱 TEXT,
+                客戶名稱 TEXT,
+                配件種類 TEXT,
+                產品型號 TEXT,
+                站點 TEXT,
+                開始時間 TEXT,
+                配件狀態 TEXT,
+                狀態代碼 TEXT NOT NULL,
+                標準狀態 TEXT NOT NULL,
+                維修中 INTEGER NOT NULL,
+                借出 INTEGER NOT NULL,
+                正常生產 INTEGER NOT NULL
+            )
+        """)
+
+        unified_columns = list(UNIFIED_COLUMNS['PAT'])
+        column_list = ", ".join(unified_columns)
+        for source, table in SOURCE_TABLES.items():
+            select_list = ", ".join(f"{UNIFIED_COLUMNS[source][column]} as {column}" for column in unified_columns)
+            conn.execute(f"""
+                INSERT INTO parts_unified (來源, {column_list}, 配件狀態, 狀態代碼, 標準狀態, 維修中, 借出, 正常生產)
+                SELECT 來源, {column_list}, 配件狀態, 狀態代碼, {status_label_case_sql()},
+                       狀態代碼 IN ('REPAIR', 'OUT_REPAIR'), 狀態代碼 = 'BORROW', 狀態代碼 = 'PRODUCTION'
+                FROM (
+                    SELECT ? as 來源, {select_list}, 配件狀態, {status_code_case_sql(source)} as 狀態代碼
+                    FROM {table}
+                )
+            """, (source,))
+
+        conn.execute("CREATE INDEX idx_parts_unified_status ON parts_unified (狀態代碼, 來源)")
+        conn.execute("CREATE INDEX idx_parts_unified_source ON parts_unified (來源, 狀態代碼)")
+        conn.execute("CREATE INDEX idx_parts_unified_customer ON parts_unified (客戶名稱, 狀態代碼)")
+        conn.execute("CREATE INDEX idx_parts_unified_part_no ON parts_unified (配件編號)")
+        conn.execute("CREATE INDEX idx_parts_unified_flags ON parts_unified (維修中, 借出, 正常生產)")
+
+    def _build_status_cube(self, conn: sqlite3.Connection):
+        """建立 (來源, 配件種類, 客戶名稱, 配件狀態) 的數量統計立方體"""
+        conn.execute("DROP TABLE IF EXISTS parts_status_cube")
+        conn.execute("""
+            CREATE TABLE parts_status_cube (
+                來源 TEXT NOT NULL,
+                配件種類 TEXT,
+                客戶名稱 TEXT,
+                配件狀態 TEXT,
+                標準狀態 TEXT,
+                數量 INTEGER NOT NULL
+            )
+        """)
+
+        conn.execute("""
+            INSERT INTO parts_status_cube (來源, 配件種類, 客戶名稱, 配件狀態, 標準狀態, 數量)
+            SELECT 來源, 配件種類, 客戶名稱, 配件狀態, 標準狀態, COUNT(*)
+            FROM parts_unified
+            GROUP BY 來源, 配件種類, 客戶名稱, 配件狀態, 標準狀態
+        """)
+
+        conn.execute("CREATE INDEX idx_parts_status_cube_source ON parts_status_cube (來源, 標準狀態)")
+
+    def _create_indexes(self, conn: sqlite3.Connection):
+        """建立宣告的二級索引並更新查詢規劃統計"""
+        for name, table, columns in INDEX_DEFINITIONS:
+            column_list = ", ".join(f'"{column}"' for column in columns)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({column_list})')
+        conn.execute("ANALYZE")
+
+    def _build_change_log_fts(self, conn: sqlite3.Connection):
+        """建立變更紀錄的 FTS5 (trigram) 全文索引，執行環境不支援時略過"""
+        column_list = ", ".join(CHANGE_LOG_FTS_COLUMNS)
+        try:
+            conn.execute(f"""
+                CREATE VIRTUAL TABLE change_log_fts USING fts5(
+                    {column_list},
+                    content='table_change_log',
+                    content_rowid='id',
+                    tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            self.logger.warning(f"SQLite 不支援 FTS5 trigram，變更紀錄搜尋將使用 LIKE: {str(e)}")
+            return
+
+        conn.execute("INSERT INTO change_log_fts (change_log_fts) VALUES ('rebuild')")
+
+    def _build_weekly_snapshot(self, conn: sqlite3.Connection):
+        """將本次週統計寫入以週開始日為鍵的快照表，並保留舊衍生資料庫中其他週的快照"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS parts_weekly_snapshot (
+                週開始日 TEXT NOT NULL,
+                來源 TEXT NOT NULL,
+                產品型號 TEXT NOT NULL,
+                站點 TEXT NOT NULL,
+                配件種類 TEXT NOT NULL,
+                總數量 INTEGER,
+                正常生產 INTEGER,
+                廠內維修 INTEGER,
+                客戶維修 INTEGER,
+                客戶借出 INTEGER,
+                待release INTEGER,
+                其它 INTEGER,
+                每周狀態 TEXT,
+                PRIMARY KEY (週開始日, 來源, 產品型號, 站點, 配件種類)
+            )
+        """)
+
+        column_list = ", ".join(SNAPSHOT_COLUMNS)
+        placeholders = ", ".join("?" for _ in SNAPSHOT_COLUMNS)
+        conn.executemany(
+            f"INSERT OR IGNORE INTO parts_weekly_snapshot ({column_list}) VALUES ({placeholders})",
+            self._load_previous_snapshots()
+        )
+
+        # 本週快照以最新資料覆蓋，其他週的快照保留
+        week_start = self._snapshot_week_start()
+        conn.execute("DELETE FROM parts_weekly_snapshot WHERE 週開始日 = ?", (week_start,))
+        for source, (table, product_column, station_column, pending_expression) in SNAPSHOT_SOURCES.items():
+            conn.execute(f"""
+                INSERT INTO parts_weekly_snapshot ({column_list})
+                SELECT ?, ?, COALESCE({product_column}, ''), COALESCE({station_column}, ''),
+                       COALESCE(配件種類, ''), SUM(總數量), SUM(正常生產), SUM(廠內維修), SUM(客戶維修),
+                       SUM(客戶借出), SUM({pending_expression}), SUM(其它),
+                       GROUP_CONCAT(NULLIF(每周狀態, ''), '; ')
+                FROM {table}
+                GROUP BY COALESCE({product_column}, ''), COALESCE({station_column}, ''), COALESCE(配件種類, '')
+            """, (week_start, source))
+
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_weekly_snapshot_source "
+                     "ON parts_weekly_snapshot (來源, 週開始日)")
+
+    def _snapshot_week_start(self) -> str:
+        """取得本次快照所屬的週開始日（週一）
+
+        以同步時間為準（每次同步各週都新增一筆快照，即使該週沒有變更紀錄）；
+        未提供同步時間時使用上游檔案的修改時間。
+        """
+        data_time = self.snapshot_time
+        if data_time is None:
+            data_time = datetime.fromtimestamp(os.path.getmtime(self.source_path))
+
+        week_start = data_time.date() - timedelta(days=data_time.weekday())
+        return week_start.strftime("%Y-%m-%d")
+
+    def _load_previous_snapshots(self) -> List[tuple]:
+        """讀取舊衍生資料庫中已累積的週快照"""
+        if not os.path.exists(self.target_path):
+            return []
+
+        column_list = ", ".join(SNAPSHOT_COLUMNS)
+        try:
+            previous = sqlite3.connect(f"file:{self.target_path}?mode=ro", uri=True)
+            try:
+                exists = previous.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'parts_weekly_snapshot'"
+                ).fetchone()
+                if not exists:
+                    return []
+                return previous.execute(f"SELECT {column_list} FROM parts_weekly_snapshot").fetchall()
+            finally:
+                previous.close()
+        except sqlite3.Error as e:
+            self.logger.warning(f"無法讀取舊的週統計快照，將重新累積: {str(e)}")
+            return []
+
+    def _write_meta(self, conn: sqlite3.Connection, timings: Dict[str, float]):
+        """記錄建置時間與各步驟耗時"""
+        conn.execute("CREATE TABLE IF NOT EXISTS derived_meta (key TEXT PRIMARY KEY, value TEXT)")
+        rows = [('built_at', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))]
+        rows.extend((f"timing:{name}", f"{seconds:.6f}") for name, seconds in timings.items())
+        conn.executemany("INSERT OR REPLACE INTO derived_meta (key, value) VALUES (?, ?)", rows)
+
+
+def read_build_meta(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """讀取衍生資料庫的建置資訊（建置時間與各步驟耗時）"""
+    meta = {'built_at': None, 'timings': {}}
+    try:
+        rows = conn.execute("SELECT key, value FROM derived_meta").fetchall()
+    except sqlite3.Error:
+        return meta
+
+    for key, value in rows:
+        if key.startswith('timing:'):
+            meta['timings'][key[len('timing:'):]] = float(value)
+        elif key == 'built_at':
+            meta['built_at'] = value
+    return meta
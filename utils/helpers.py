@@ -1,7 +1,8 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, Iterable
 import logging
 import re
 
@@ -279,6 +280,114 @@ def check_data_quality(df: pd.DataFrame) -> Dict[str, Any]:
         logging.error(f"資料品質檢查失敗: {str(e)}")
         return {'status': 'error', 'message': str(e)}
 
+def _canonical_row_hashes(chunk: pd.DataFrame) -> pd.Series:
+    """以與型別無關的正規化值計算資料列雜湊（整數與浮點數視為相同、空值一律視為 None）
+
+    各區塊推斷的型別可能不同（例如 1 與 1.0、全為空值的欄位），直接雜湊會讓
+    跨區塊的相同資料列被視為不同。
+    """
+    normalized = {}
+    for col in chunk.columns:
+        series = chunk[col]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            series = series.astype('float64')
+        values = series.astype(object).where(series.notna(), None)
+        normalized[col] = [
+            repr(float(value)) if isinstance(value, (int, float)) and not isinstance(value, bool) else repr(value)
+            for value in values
+        ]
+    return pd.util.hash_pandas_object(pd.DataFrame(normalized, index=chunk.index, dtype=object), index=False)
+
+def _merge_dtypes(current, dtype):
+    """合併兩個區塊推斷的型別（無共同型別時為 object）"""
+    if current == dtype:
+        return current
+    try:
+        return np.result_type(current, dtype)
+    except TypeError:
+        return np.dtype(object)
+
+def _full_frame_dtype(first_dtype, non_null_dtype, missing_count: int):
+    """推算整份資料載入為單一 DataFrame 時的欄位型別"""
+    if non_null_dtype is None:
+        return first_dtype
+    # 含空值的整數與布林欄位在整份資料中分別推斷為 float64 與 object
+    if missing_count and isinstance(non_null_dtype, np.dtype):
+        if non_null_dtype.kind in 'iu':
+            return np.dtype('float64')
+        if non_null_dtype.kind == 'b':
+            return np.dtype(object)
+    return non_null_dtype
+
+def check_data_quality_chunks(chunks: Iterable[pd.DataFrame]) -> Dict[str, Any]:
+    """分批檢查資料品質（逐區塊累計，記憶體用量與資料量無關，結果與 check_data_quality 相同）"""
+    try:
+        total_rows = 0
+        columns = None
+        missing_counts = {}
+        data_types = {}
+        non_null_types = {}
+        seen_hashes = set()
+        duplicate_rows = 0
+        
+        for chunk in chunks:
+            if columns is None:
+                columns = list(chunk.columns)
+                missing_counts = {col: 0 for col in columns}
+            if chunk.empty:
+                continue
+            
+            total_rows += len(chunk)
+            
+            # 累計缺失值
+            for col, count in chunk.isnull().sum().items():
+                missing_counts[col] += int(count)
+            
+            # 各區塊推斷的型別可能不同，取共同型別；全為空值的區塊不代表欄位型別，不參與合併
+            for col in columns:
+                series = chunk[col]
+                data_types.setdefault(col, series.dtype)
+                if series.isna().all():
+                    continue
+                if col in non_null_types:
+                    non_null_types[col] = _merge_dtypes(non_null_types[col], series.dtype)
+                else:
+                    non_null_types[col] = series.dtype
+            
+            # 以正規化後的資料列雜湊值判斷跨區塊的重複資料
+            row_hashes = _canonical_row_hashes(chunk)
+            duplicate_rows += int((row_hashes.duplicated() | row_hashes.isin(seen_hashes)).sum())
+            seen_hashes.update(row_hashes.tolist())
+        
+        if total_rows == 0:
+            return {'status': 'empty', 'message': '資料為空'}
+        
+        quality_report = {
+            'total_rows': total_rows,
+            'total_columns': len(columns),
+            'missing_values': {
+                col: {'count': count, 'percentage': (count / total_rows) * 100}
+                for col, count in missing_counts.items()
+            },
+            'duplicate_rows': duplicate_rows,
+            'data_types': {col: str(_full_frame_dtype(data_types[col], non_null_types.get(col), missing_counts[col]))
+                           for col in columns},
+            'quality_score': 0
+        }
+        
+        # 計算品質分數（與 check_data_quality 相同）
+        missing_ratio = sum(missing_counts.values()) / (total_rows * len(columns))
+        duplicate_ratio = duplicate_rows / total_rows
+        
+        quality_score = max(0, 100 - (missing_ratio * 50) - (duplicate_ratio * 30))
+        quality_report['quality_score'] = round(quality_score, 2)
+        
+        return quality_report
+        
+    except Exception as e:
+        logging.error(f"分批資料品質檢查失敗: {str(e)}")
+        return {'status': 'error', 'message': str(e)}
+
 def create_alert_message(message: str, alert_type: str = 'info') -> None:
     """建立警告訊息"""
     try:
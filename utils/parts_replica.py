@@ -0,0 +1,229 @@
+import threading
+import time
+import logging
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.db_connection import ConnectionProvider
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = None
+
+# 唯一值比例低於此值的文字欄位轉為 category
+CATEGORY_RATIO = 0.5
+
+# 常駐記憶體的資料表 (名稱: 查詢)
+REPLICA_TABLES = {
+    'unified': "SELECT * FROM parts_unified",
+    'pat': "SELECT * FROM pat_parts_all",
+    'kyec': "SELECT * FROM kyec_parts_all",
+    'weekly': "SELECT * FROM parts_weekly_snapshot",
+}
+
+# 搜尋結果欄位與可搜尋欄位（與 QueryProcessor.search_parts 的 SQL 相同）
+SEARCH_DEFINITIONS = {
+    'pat': ('pat', ['配件編號', '配件名稱', '客戶名稱', '配件狀態', '站點', '配件種類', '開始時間'],
+            ['配件編號', '配件名稱', '客戶名稱']),
+    'kyec': ('kyec', ['配件編號', '板全號', '客戶名稱', '配件狀態', '配件種類', '機台型號', '狀態開始時間'],
+             ['配件編號', '板全號', '客戶名稱']),
+    'all': ('unified', ['配件編號', '配件名稱', '客戶名稱', '配件狀態', '來源', '開始時間'],
+            ['配件編號', '配件名稱', '客戶名稱']),
+}
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """將文字欄位轉為 category（低基數）或 Arrow 字串（可用時）以降低記憶體用量"""
+    df = df.copy()
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            continue
+        if len(series) and series.nunique(dropna=True) / len(series) < CATEGORY_RATIO:
+            df[column] = series.astype('category')
+        elif STRING_DTYPE:
+            df[column] = series.astype(STRING_DTYPE)
+    return df
+
+
+def _plain_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """將結果中的 category / Arrow 字串欄位還原為一般欄位，與 SQL 查詢結果的型別一致"""
+    for column in df.columns:
+        dtype = df[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype) or (STRING_DTYPE and dtype == STRING_DTYPE):
+            values = df[column].to_numpy(dtype=object, na_value=None)
+            df[column] = pd.Series(list(values), index=df.index, dtype=None)
+    return df
+
+
+class PartsReplica:
+    """配件資料的記憶體常駐副本
+
+    每個資料庫版本只載入一次統一配件資料表、PAT / KYEC 原始資料表與週統計快照
+    （文字欄位壓縮為 category / Arrow 字串），並在載入時以向量化運算預先計算
+    儀表板與統計結果；搜尋則對預先排序、轉為小寫的欄位做子字串比對。
+    呼叫端取得的都是副本，可自由修改。
+    """
+
+    def __init__(self, frames: Dict[str, pd.DataFrame], version: Hashable):
+        self.frames = frames
+        self.version = version
+        self.load_seconds = 0.0
+
+        self._aggregates: Dict[Any, Any] = {}
+        self._search_index: Dict[str, Any] = {}
+        self._prepare()
+
+    @classmethod
+    def load(cls, provider: ConnectionProvider) -> "PartsReplica":
+        """從資料庫載入副本"""
+        started = time.perf_counter()
+        version = provider.version_token()
+        conn = provider.get_connection()
+        frames = {name: compact_frame(pd.read_sql_query(query, conn))
+                  for name, query in REPLICA_TABLES.items()}
+        replica = cls(frames, version)
+        replica.load_seconds = time.perf_counter() - started
+        return replica
+
+    def memory_bytes(self) -> int:
+        """副本佔用的記憶體（位元組）"""
+        return int(sum(df.memory_usage(index=True, deep=True).sum() for df in self.frames.values()))
+
+    def _prepare(self):
+        """預先計算與資料庫版本綁定的統計結果與搜尋索引"""
+        unified = self.frames['unified']
+        status = unified['標準狀態']
+
+        counts = status.value_counts()
+        self._aggregates['overview'] = {
+            'total_parts': int(counts.sum()),
+            'repair_parts': int(counts.get('廠內維修', 0) + counts.get('客戶維修', 0)),
+            'normal_parts': int(counts.get('正常生產', 0)),
+            'borrowed_parts': int(counts.get('客戶借出', 0))
+        }
+
+        flags = pd.DataFrame({
+            '總數量': 1,
+            '正常生產': (status == '正常生產').astype('int64'),
+            '廠內維修': (status == '廠內維修').astype('int64'),
+            '客戶維修': (status == '客戶維修').astype('int64'),
+            '客戶借出': (status == '客戶借出').astype('int64'),
+        }, index=unified.index)
+
+        for source in unified['來源'].dropna().unique():
+            in_source = unified['來源'] == source
+
+            distribution = unified.loc[in_source, '配件狀態'].value_counts(dropna=False)
+            distribution = distribution[distribution > 0].rename_axis('配件狀態').reset_index(name='數量')
+            self._aggregates[('status', source)] = _plain_columns(
+                distribution.sort_values('數量', ascending=False, kind='stable', ignore_index=True))
+
+            detailed = (flags[in_source].assign(配件種類=unified.loc[in_source, '配件種類'])
+                        .groupby('配件種類', observed=True, dropna=False, sort=False).sum().reset_index())
+            self._aggregates[('detailed', source)] = _plain_columns(
+                detailed.sort_values('總數量', ascending=False, kind='stable', ignore_index=True))
+
+        customers = pd.DataFrame({
+            '客戶名稱': unified['客戶名稱'],
+            '配件數量': 1,
+            '維修中配件': flags['廠內維修'] + flags['客戶維修'],
+            '借出配件': flags['客戶借出'],
+        }).groupby('客戶名稱', observed=True, dropna=False, sort=False).sum().reset_index()
+        self._aggregates['customers'] = _plain_columns(
+            customers.sort_values('配件數量', ascending=False, kind='stable', ignore_index=True))
+
+        trend_columns = ['總數量', '正常生產', '廠內維修', '客戶維修', '客戶借出']
+        weekly = (self.frames['weekly'].groupby('週開始日', observed=True, sort=True)[trend_columns].sum()
+                  .rename_axis('日期').reset_index())
+        self._aggregates['weekly'] = _plain_columns(weekly)
+
+        # 搜尋索引：依配件編號排序的結果欄位，以及各搜尋欄位以分隔字元串接的小寫字串
+        for search_type, (frame_name, result_columns, search_columns) in SEARCH_DEFINITIONS.items():
+            frame = self.frames[frame_name].sort_values('配件編號', kind='stable', na_position='first')
+            haystack = None
+            for column in search_columns:
+                values = frame[column].astype(object).where(frame[column].notna(), '').astype(str).str.lower()
+                haystack = values if haystack is None else haystack + '\x1f' + values
+            result = frame[result_columns].reset_index(drop=True).astype(object)
+            result = result.where(result.notna(), None)
+            # 全為文字的欄位：結果中有非空值時轉為字串型別（與 from_records 的推斷一致）
+            text_columns = {column: result[column].notna().to_numpy() for column in result_columns
+                            if result[column].map(lambda v: v is None or isinstance(v, str)).all()}
+            self._search_index[search_type] = (result, text_columns, haystack.to_numpy(dtype=object))
+
+    def overview_statistics(self) -> Dict[str, int]:
+        """總覽統計（與 DatabaseManager.get_overview_statistics 相同格式）"""
+        return dict(self._aggregates['overview'])
+
+    def status_distribution(self, source: str) -> pd.DataFrame:
+        """指定來源的配件狀態分佈"""
+        return self._aggregates.get(('status', source), pd.DataFrame(columns=['配件狀態', '數量'])).copy()
+
+    def detailed_statistics(self, source: str) -> pd.DataFrame:
+        """指定來源依配件種類的詳細統計"""
+        return self._aggregates.get(('detailed', source), pd.DataFrame()).copy()
+
+    def customer_statistics(self) -> pd.DataFrame:
+        """客戶配件統計（維修中包含廠內與客戶維修）"""
+        return self._aggregates['customers'].copy()
+
+    def search_parts(self, search_term: str, search_type: str = "all") -> pd.DataFrame:
+        """以子字串比對搜尋配件（對應 SQL 的 LIKE '%term%'，不分大小寫）"""
+        result, text_columns, haystack = self._search_index.get(search_type, self._search_index['all'])
+        needle = search_term.lower()
+        mask = np.fromiter((needle in value for value in haystack), dtype=bool, count=len(haystack))
+
+        matched = result[mask].reset_index(drop=True)
+        for column, not_null in text_columns.items():
+            if not_null[mask].any():
+                matched[column] = matched[column].astype('str')
+        return matched
+
+    def weekly_trend(self, start_week: Optional[str] = None, end_week: Optional[str] = None) -> pd.DataFrame:
+        """每週各狀態數量（週開始日範圍以字串比較）"""
+        weekly = self._aggregates['weekly']
+        mask = np.ones(len(weekly), dtype=bool)
+        if start_week is not None:
+            mask &= (weekly['日期'] >= start_week).to_numpy()
+        if end_week is not None:
+            mask &= (weekly['日期'] <= end_week).to_numpy()
+        return weekly[mask].reset_index(drop=True)
+
+
+_replicas: Dict[str, PartsReplica] = {}
+_failed_versions: Dict[str, Hashable] = {}
+_replicas_lock = threading.Lock()
+_logger = logging.getLogger(__name__)
+
+
+def get_parts_replica(provider: ConnectionProvider) -> Optional[PartsReplica]:
+    """取得資料庫目前版本的記憶體副本，資料庫檔案變更後重新載入
+
+    無法載入時（例如尚未建立衍生資料庫）返回 None，同一版本不再重試，
+    呼叫端改用 SQL 查詢。
+    """
+    version = provider.version_token()
+    with _replicas_lock:
+        replica = _replicas.get(provider.db_path)
+        if replica is not None and replica.version == version:
+            return replica
+        if _failed_versions.get(provider.db_path) == version:
+            return None
+
+        try:
+            replica = PartsReplica.load(provider)
+        except Exception as e:
+            _failed_versions[provider.db_path] = version
+            _replicas.pop(provider.db_path, None)
+            _logger.warning(f"配件記憶體副本載入失敗，改用 SQL 查詢: {str(e)}")
+            return None
+
+        _replicas[provider.db_path] = replica
+        _logger.info(f"配件記憶體副本已載入，耗時 {replica.load_seconds:.3f} 秒，"
+                     f"佔用 {replica.memory_bytes() / 1024 / 1024:.1f} MB")
+        return replica
@@ -0,0 +1,137 @@
+import re
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import pandas as pd
+
+from utils.query_governor import QueryGovernor, get_query_governor
+from utils.site_registry import SiteRegistry, get_site_registry
+
+# 預設的快取記憶體上限（以 DataFrame 實際佔用的位元組計算）
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# 字串常值或空白序列（正規化 SQL 時保留字串常值原樣）
+_SQL_TOKEN_PATTERN = re.compile(r"'(?:[^']|'')*'|\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """正規化 SQL 文字（合併字串常值以外的空白），作為快取鍵的一部分"""
+    def _replace(match):
+        token = match.group(0)
+        return token if token.startswith("'") else " "
+    return _SQL_TOKEN_PATTERN.sub(_replace, sql).strip()
+
+
+class QueryResultCache:
+    """以資料庫版本為鍵的查詢結果 LRU 快取
+
+    快取鍵包含正規化後的 SQL、參數與資料庫版本識別；資料庫檔案被替換後版本
+    改變，舊結果自然不再命中並隨 LRU 淘汰。總容量以 DataFrame 記憶體用量限制。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+
+        self._entries: "OrderedDict[Hashable, tuple[pd.DataFrame, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(sql: str, params: Optional[tuple], version: Hashable) -> Hashable:
+        """建立快取鍵"""
+        return (normalize_sql(sql), tuple(params) if params else (), version)
+
+    def get(self, key: Hashable) -> Optional[pd.DataFrame]:
+        """讀取快取結果（返回副本，呼叫端可自由修改）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            df = entry[0]
+        return df.copy()
+
+    def put(self, key: Hashable, df: pd.DataFrame):
+        """寫入查詢結果，超過容量時淘汰最久未使用的項目"""
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+
+        stored = df.copy()
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._current_bytes -= previous[1]
+
+            self._entries[key] = (stored, size)
+            self._current_bytes += size
+
+            while self._current_bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """清空快取並重設統計"""
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+        self.logger.info("查詢結果快取已清空")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取快取命中統計"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_query_cache = QueryResultCache()
+
+
+def get_query_cache() -> QueryResultCache:
+    """取得行程共用的查詢結果快取"""
+    return _query_cache
+
+
+def run_cached_query(provider, sql: str, params: Optional[tuple] = None, max_rows: Optional[int] = None,
+                     cache: Optional[QueryResultCache] = None, governor: Optional[QueryGovernor] = None,
+                     site_registry: Optional[SiteRegistry] = None) -> pd.DataFrame:
+    """經過查詢結果快取與查詢限制器執行查詢（DatabaseManager 與 QueryProcessor 共用）
+
+    快取鍵包含正規化 SQL、參數、資料庫版本識別與 `max_rows`；版本識別只包含查詢
+    引用的站點，其他站點更新時快取仍有效。被截斷或中斷的部分結果不寫入快取。
+    查詢失敗時拋出例外，由呼叫端記錄並處理。
+    """
+    cache = cache or get_query_cache()
+    governor = governor or get_query_governor()
+    site_registry = site_registry or get_site_registry()
+
+    version = provider.version_token(site_registry.sites_for_query(sql))
+    cache_key = cache.make_key(sql, params, (version, max_rows))
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    df = governor.run(provider.get_connection(), sql, params, max_rows=max_rows)
+    if not df.attrs.get('partial'):
+        cache.put(cache_key, df)
+    return df
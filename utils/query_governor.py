@@ -0,0 +1,251 @@
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from utils.query_log import get_query_logger
+
+# 預設的查詢限制（對應系統設定頁面的預設值）
+DEFAULT_MAX_ROWS = 100
+DEFAULT_TIMEOUT_SECONDS = 30
+
+# 每次 fetchmany 取回的筆數
+DEFAULT_FETCH_SIZE = 500
+
+# 串流查詢每個 DataFrame 區塊的預設筆數
+DEFAULT_CHUNK_SIZE = 5000
+
+# SQLite 每執行多少個虛擬機指令呼叫一次進度回呼
+PROGRESS_HANDLER_INTERVAL = 10000
+
+
+class QueryGovernor:
+    """查詢限制器
+
+    所有查詢執行器共用的結果筆數上限與執行時間上限。結果以 fetchmany 分批讀取，
+    超過筆數上限即停止；執行時間超過期限時由 SQLite 進度回呼中斷語句。
+    被截斷的結果會在 `DataFrame.attrs` 標記 `partial` 與原因，供介面提示使用者。
+    """
+
+    def __init__(self, max_rows: int = DEFAULT_MAX_ROWS,
+                 timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+                 fetch_size: int = DEFAULT_FETCH_SIZE):
+        self.max_rows = max_rows
+        self.timeout_seconds = timeout_seconds
+        self.fetch_size = fetch_size
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    def update_settings(self, max_rows: int, timeout_seconds: float):
+        """更新查詢限制（立即套用到所有執行器）"""
+        with self._lock:
+            self.max_rows = int(max_rows)
+            self.timeout_seconds = float(timeout_seconds)
+        self.logger.info(f"查詢限制已更新: 最大結果數 {self.max_rows}，超時 {self.timeout_seconds} 秒")
+
+    def get_settings(self) -> Dict[str, Any]:
+        """獲取目前的查詢限制"""
+        with self._lock:
+            return {'max_rows': self.max_rows, 'timeout_seconds': self.timeout_seconds}
+
+    def run(self, conn: sqlite3.Connection, sql: str, params: Optional[tuple] = None,
+            max_rows: Optional[int] = None, timeout_seconds: Optional[float] = None) -> pd.DataFrame:
+        """在限制下執行查詢並返回 DataFrame
+
+        `max_rows` 為 None 時不限制筆數（應用程式內建查詢），僅套用執行時間上限。
+        超時且尚未取得任何欄位資訊時拋出 TimeoutError。
+        """
+        if timeout_seconds is None:
+            timeout_seconds = self.timeout_seconds
+        deadline = time.monotonic() + timeout_seconds
+        timed_out = False
+
+        def _check_deadline() -> int:
+            nonlocal timed_out
+            if time.monotonic() > deadline:
+                timed_out = True
+                return 1
+            return 0
+
+        rows = []
+        columns = None
+        truncated = False
+
+        started = time.perf_counter()
+        conn.set_progress_handler(_check_deadline, PROGRESS_HANDLER_INTERVAL)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params or ())
+            columns = [column[0] for column in cursor.description or ()]
+
+            while True:
+                batch_size = self.fetch_size
+                if max_rows is not None:
+                    # 多取一筆以判斷是否超過上限
+                    batch_size = min(batch_size, max_rows + 1 - len(rows))
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                rows.extend(batch)
+                if max_rows is not None and len(rows) > max_rows:
+                    del rows[max_rows:]
+                    truncated = True
+                    break
+
+        except sqlite3.OperationalError as e:
+            if not timed_out:
+                get_query_logger().record(sql, time.perf_counter() - started, params=params, error=e)
+                raise
+            if columns is None:
+                error = TimeoutError(f"查詢超過 {timeout_seconds:g} 秒已中斷")
+                get_query_logger().record(sql, time.perf_counter() - started, params=params, error=error)
+                raise error
+        except Exception as e:
+            get_query_logger().record(sql, time.perf_counter() - started, params=params, error=e)
+            raise
+        finally:
+            cursor.close()
+            conn.set_progress_handler(None, 0)
+
+        get_query_logger().record(sql, time.perf_counter() - started, len(rows), conn=conn, params=params)
+        df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+        if timed_out:
+            df.attrs['partial'] = True
+            df.attrs['partial_reason'] = 'timeout'
+            self.logger.warning(f"查詢超過 {timeout_seconds:g} 秒已中斷，返回 {len(df)} 筆部分結果")
+        elif truncated:
+            df.attrs['partial'] = True
+            df.attrs['partial_reason'] = 'row_limit'
+            self.logger.info(f"查詢結果超過 {max_rows} 筆，已截斷")
+
+        return df
+
+    def fetch_rows(self, conn: sqlite3.Connection, sql: str, params: Optional[tuple] = None,
+                   max_rows: Optional[int] = None, timeout_seconds: Optional[float] = None) -> List[tuple]:
+        """在執行時間上限下執行查詢並直接返回 tuple 列表（不建立 DataFrame）
+
+        用於單值或少量資料的內建查詢；`max_rows` 只限制讀取筆數，不標記部分結果。
+        以 `conn.execute` 執行，相同 SQL 文字重複使用連線的預備語句快取。超時拋出 TimeoutError。
+        """
+        if timeout_seconds is None:
+            timeout_seconds = self.timeout_seconds
+        deadline = time.monotonic() + timeout_seconds
+        timed_out = False
+
+        def _check_deadline() -> int:
+            nonlocal timed_out
+            if time.monotonic() > deadline:
+                timed_out = True
+                return 1
+            return 0
+
+        started = time.perf_counter()
+        conn.set_progress_handler(_check_deadline, PROGRESS_HANDLER_INTERVAL)
+        try:
+            cursor = conn.execute(sql, params or ())
+            rows = cursor.fetchall() if max_rows is None else cursor.fetchmany(max_rows)
+            cursor.close()
+        except Exception as e:
+            error = TimeoutError(f"查詢超過 {timeout_seconds:g} 秒已中斷") if timed_out else e
+            get_query_logger().record(sql, time.perf_counter() - started, params=params, error=error)
+            if timed_out:
+                raise error from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+        get_query_logger().record(sql, time.perf_counter() - started, len(rows), conn=conn, params=params)
+        return rows
+
+    def iter_chunks(self, conn: sqlite3.Connection, sql: str, params: Optional[tuple] = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE, max_rows: Optional[int] = None,
+                    timeout_seconds: Optional[float] = None) -> Iterator[pd.DataFrame]:
+        """以單一游標分批讀取查詢結果，逐一產生 DataFrame 區塊
+
+        執行時間上限只計算 SQLite 實際執行的時間（不含呼叫端處理區塊的時間），
+        超時拋出 TimeoutError。達到 `max_rows` 時最後一個區塊標記為部分結果。
+        進度回呼只在每次讀取期間設置，區塊之間同一連線仍可執行其他查詢。
+        """
+        if timeout_seconds is None:
+            timeout_seconds = self.timeout_seconds
+        elapsed = 0.0
+        timed_out = False
+        started = 0.0
+
+        def _check_deadline() -> int:
+            nonlocal timed_out
+            if elapsed + (time.monotonic() - started) > timeout_seconds:
+                timed_out = True
+                return 1
+            return 0
+
+        def _governed(call, *args):
+            nonlocal elapsed, started
+            started = time.monotonic()
+            conn.set_progress_handler(_check_deadline, PROGRESS_HANDLER_INTERVAL)
+            try:
+                return call(*args)
+            except sqlite3.OperationalError:
+                if timed_out:
+                    raise TimeoutError(f"查詢超過 {timeout_seconds:g} 秒已中斷")
+                raise
+            finally:
+                conn.set_progress_handler(None, 0)
+                elapsed += time.monotonic() - started
+
+        cursor = conn.cursor()
+        fetched = 0
+        error = None
+        try:
+            _governed(cursor.execute, sql, params or ())
+            columns = [column[0] for column in cursor.description or ()]
+
+            while True:
+                batch_size = chunk_size
+                if max_rows is not None:
+                    batch_size = min(batch_size, max_rows + 1 - fetched)
+                rows = _governed(cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+
+                truncated = max_rows is not None and fetched + len(rows) > max_rows
+                if truncated:
+                    del rows[max_rows - fetched:]
+                fetched += len(rows)
+
+                chunk = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+                if truncated:
+                    chunk.attrs['partial'] = True
+                    chunk.attrs['partial_reason'] = 'row_limit'
+                yield chunk
+                if truncated:
+                    break
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            cursor.close()
+            # 記錄 SQLite 實際執行時間（不含呼叫端處理區塊的時間）
+            get_query_logger().record(sql, elapsed, fetched, conn=conn if error is None else None,
+                                      params=params, error=error)
+
+
+def describe_partial_result(df: pd.DataFrame) -> Optional[str]:
+    """產生部分結果的提示文字（完整結果返回 None）"""
+    if not df.attrs.get('partial'):
+        return None
+    if df.attrs.get('partial_reason') == 'timeout':
+        return f"查詢超過時間上限已中斷，僅顯示已取得的 {len(df)} 筆資料"
+    return f"結果超過最大查詢結果數，僅顯示前 {len(df)} 筆資料"
+
+
+_query_governor = QueryGovernor()
+
+
+def get_query_governor() -> QueryGovernor:
+    """取得行程共用的查詢限制器"""
+    return _query_governor
@@ -0,0 +1,252 @@
+import os
+import sys
+import sqlite3
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+# 執行時間超過此值（毫秒）的查詢記錄 EXPLAIN QUERY PLAN
+DEFAULT_SLOW_THRESHOLD_MS = 200
+
+# 記憶體環狀緩衝區保留的紀錄筆數
+DEFAULT_RING_SIZE = 500
+
+# 累積多少筆紀錄後批次寫入 query_log
+FLUSH_BATCH_SIZE = 50
+
+# query_log 保留的最大筆數（超過時刪除最舊的紀錄）
+MAX_PERSISTED_ROWS = 20000
+
+# 判斷呼叫端時略過的查詢包裝函式
+_WRAPPER_FUNCTIONS = {'run', 'iter_chunks', 'fetch_rows', 'fetch_scalar', 'fetch_frame', 'execute_query',
+                      'iter_query', 'iter_safe_query', 'execute_safe_query', 'run_sql_sqlite', '_run_task'}
+
+# 與上游 query_log 相同的欄位，另加執行統計欄位
+QUERY_LOG_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS query_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user TEXT,
+        query_text TEXT,
+        sql_text TEXT,
+        result_summary TEXT,
+        timestamp TEXT,
+        caller TEXT,
+        duration_ms REAL,
+        row_count INTEGER,
+        error TEXT,
+        query_plan TEXT,
+        full_scan INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+
+def query_log_db_path(db_path: str) -> str:
+    """取得查詢紀錄資料庫路徑（與上游及衍生資料庫分開，寫入不影響讀取端的版本識別）"""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}_querylog{ext or '.db'}"
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str, params: Optional[tuple] = None) -> List[str]:
+    """取得查詢的 EXPLAIN QUERY PLAN（依層級縮排）"""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+def is_full_scan(plan_line: str) -> bool:
+    """查詢計畫的步驟是否為未使用索引的全表掃描"""
+    detail = plan_line.strip()
+    return detail.startswith('SCAN ') and 'USING' not in detail and not detail.startswith('SCAN CONSTANT')
+
+
+def _find_caller() -> str:
+    """找出發出查詢的函式（略過查詢包裝函式）"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name not in _WRAPPER_FUNCTIONS and not code.co_filename.endswith(
+                ('query_log.py', 'query_governor.py', 'contextlib.py')):
+            return getattr(code, 'co_qualname', code.co_name)
+        frame = frame.f_back
+    return ''
+
+
+class QueryLogger:
+    """行程共用的查詢紀錄器
+
+    記錄每個語句的執行時間、結果筆數、呼叫端與錯誤。超過門檻的慢查詢另外擷取
+    EXPLAIN QUERY PLAN 並標記全表掃描。紀錄保存在有上限的環狀緩衝區，並批次寫入
+    查詢紀錄資料庫的 query_log 資料表（需先以 `configure()` 指定路徑）。
+    """
+
+    def __init__(self, slow_threshold_ms: float = DEFAULT_SLOW_THRESHOLD_MS,
+                 ring_size: int = DEFAULT_RING_SIZE):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.logger = logging.getLogger(__name__)
+        self.db_path: Optional[str] = None
+
+        self._records = deque(maxlen=ring_size)
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._total = 0
+        self._slow = 0
+
+    def configure(self, db_path: str):
+        """指定查詢紀錄資料庫並建立 query_log 資料表"""
+        db_path = os.path.abspath(db_path)
+        if db_path == self.db_path:
+            return
+        conn = sqlite3.connect(db_path, timeout=5)
+        try:
+            conn.execute(QUERY_LOG_SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_query_log_duration ON query_log (duration_ms)")
+            conn.commit()
+        finally:
+            conn.close()
+        self.db_path = db_path
+
+    def record(self, sql: str, duration: float, row_count: Optional[int] = None,
+               conn: Optional[sqlite3.Connection] = None, params: Optional[tuple] = None,
+               error: Optional[BaseException] = None, caller: Optional[str] = None,
+               question: Optional[str] = None) -> Dict[str, Any]:
+        """記錄一次查詢（duration 單位為秒），慢查詢且提供連線時擷取查詢計畫"""
+        duration_ms = duration * 1000
+        plan: List[str] = []
+        if duration_ms >= self.slow_threshold_ms and conn is not None and error is None:
+            try:
+                plan = explain_query_plan(conn, sql, params)
+            except Exception as e:
+                self.logger.debug(f"查詢計畫擷取失敗: {str(e)}")
+
+        entry = {
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            'caller': caller or _find_caller(),
+            'sql': sql.strip(),
+            'question': question,
+            'duration_ms': round(duration_ms, 3),
+            'row_count': row_count,
+            'error': f"{type(error).__name__}: {error}" if error is not None else None,
+            'plan': plan,
+            'full_scan': any(is_full_scan(line) for line in plan),
+        }
+
+        with self._lock:
+            self._records.append(entry)
+            self._total += 1
+            if plan:
+                self._slow += 1
+            if self.db_path:
+                self._pending.append(entry)
+            should_flush = len(self._pending) >= FLUSH_BATCH_SIZE
+
+        if plan:
+            self.logger.warning(f"慢查詢 {duration_ms:.1f} ms ({entry['caller']})"
+                                f"{'，含全表掃描' if entry['full_scan'] else ''}: {' '.join(sql.split())[:200]}")
+        if should_flush:
+            self.flush()
+        return entry
+
+    def flush(self):
+        """將累積的紀錄寫入 query_log"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending or not self.db_path:
+                return
+
+            rows = [(None, entry['question'], entry['sql'],
+                     f"{entry['row_count'] if entry['row_count'] is not None else '-'} 筆，{entry['duration_ms']:.1f} ms",
+                     entry['timestamp'], entry['caller'], entry['duration_ms'], entry['row_count'],
+                     entry['error'], "\n".join(entry['plan']) or None, int(entry['full_scan']))
+                    for entry in pending]
+            try:
+                conn = sqlite3.connect(self.db_path, timeout=5)
+                try:
+                    with conn:
+                        conn.executemany("""
+                            INSERT INTO query_log (user, query_text, sql_text, result_summary, timestamp,
+                                                   caller, duration_ms, row_count, error, query_plan, full_scan)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """, rows)
+                        conn.execute(
+                            "DELETE FROM query_log WHERE id <= (SELECT MAX(id) FROM query_log) - ?",
+                            (MAX_PERSISTED_ROWS,)
+                        )
+                finally:
+                    conn.close()
+            except Exception as e:
+                self.logger.warning(f"查詢紀錄寫入失敗: {str(e)}")
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """最近的查詢紀錄（新到舊）"""
+        with self._lock:
+            return list(self._records)[-limit:][::-1]
+
+    def top_slowest(self, limit: int = 10) -> pd.DataFrame:
+        """依最長執行時間排列的查詢（相同 SQL 合併），優先讀取 query_log，否則使用環狀緩衝區"""
+        columns = ['SQL', '呼叫端', '執行次數', '最長(ms)', '平均(ms)', '最近筆數', '全表掃描', '查詢計畫']
+        if self.db_path:
+            self.flush()
+            try:
+                conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+                try:
+                    return pd.read_sql_query("""
+                        SELECT sql_text as SQL,
+                               MAX(caller) as 呼叫端,
+                               COUNT(*) as 執行次數,
+                               ROUND(MAX(duration_ms), 1) as "最長(ms)",
+                               ROUND(AVG(duration_ms), 1) as "平均(ms)",
+                               MAX(row_count) as 最近筆數,
+                               MAX(full_scan) as 全表掃描,
+                               MAX(query_plan) as 查詢計畫
+                        FROM query_log
+                        WHERE error IS NULL
+                        GROUP BY sql_text
+                        ORDER BY MAX(duration_ms) DESC
+                        LIMIT ?
+                    """, conn, params=(limit,))
+                finally:
+                    conn.close()
+            except Exception as e:
+                self.logger.warning(f"查詢紀錄讀取失敗: {str(e)}")
+
+        records = pd.DataFrame([entry for entry in self.recent(len(self._records)) if not entry['error']])
+        if records.empty:
+            return pd.DataFrame(columns=columns)
+        records['plan'] = records['plan'].map(lambda plan: "\n".join(plan) or None)
+        grouped = records.groupby('sql', sort=False).agg(
+            caller=('caller', 'first'), runs=('sql', 'size'), longest=('duration_ms', 'max'),
+            average=('duration_ms', 'mean'), rows=('row_count', 'first'),
+            full_scan=('full_scan', 'max'), plan=('plan', 'first')
+        ).reset_index()
+        grouped['average'] = grouped['average'].round(1)
+        grouped.columns = columns
+        return grouped.sort_values('最長(ms)', ascending=False).head(limit).reset_index(drop=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取查詢紀錄統計"""
+        with self._lock:
+            return {
+                'total': self._total,
+                'slow': self._slow,
+                'buffered': len(self._records),
+                'slow_threshold_ms': self.slow_threshold_ms,
+                'persisted_to': self.db_path
+            }
+
+
+_query_logger = QueryLogger()
+
+
+def get_query_logger() -> QueryLogger:
+    """取得行程共用的查詢紀錄器"""
+    return _query_logger
@@ -0,0 +1,288 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+
+# 問題快取檔名（與向量資料庫放在同一目錄）
+CACHE_FILENAME = "question_cache.db"
+
+# 語意比對的預設相似度門檻（餘弦相似度），可由環境變數調整；
+# 在設定頁調整的門檻保存在快取檔案中，優先於環境變數
+SIMILARITY_ENV = "VANNA_CACHE_SIMILARITY"
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+# 快取保留的最大問題數（超過時淘汰最久未命中的項目）
+DEFAULT_MAX_ENTRIES = 1000
+
+# 正規化問題時去除的結尾標點
+_TRAILING_PUNCTUATION = re.compile(r'[\s?？!！。.,，、~～]+$')
+
+QUESTION_CACHE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS question_cache (
+        normalized TEXT PRIMARY KEY,
+        question TEXT NOT NULL,
+        sql_text TEXT NOT NULL,
+        embedding BLOB,
+        fingerprint TEXT NOT NULL,
+        generate_ms REAL NOT NULL DEFAULT 0,
+        hits INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT,
+        last_used REAL NOT NULL DEFAULT 0
+    )
+"""
+
+QUESTION_CACHE_SETTINGS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS question_cache_settings (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+"""
+
+SIMILARITY_SETTING = "similarity_threshold"
+
+
+def normalize_question(question: str) -> str:
+    """正規化問題（全形轉半形、轉小寫、合併空白、去除結尾標點），作為完全比對的鍵"""
+    text = unicodedata.normalize('NFKC', question or '').lower()
+    text = ' '.join(text.split())
+    return _TRAILING_PUNCTUATION.sub('', text)
+
+
+def cache_fingerprint(parts: Iterable[str]) -> str:
+    """以資料庫結構與訓練資料的內容計算快取指紋，任一項改變時舊的快取項目失效"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class CacheLookup(NamedTuple):
+    """問題快取查詢結果"""
+    sql: Optional[str]
+    tier: Optional[str]                 # 'exact'、'semantic' 或 None（未命中）
+    similarity: float = 0.0
+    embedding: Optional[np.ndarray] = None
+
+
+class QuestionSqlCache:
+    """問題到 SQL 的兩層快取
+
+    第一層以正規化後的問題完全比對；第二層以問題的嵌入向量計算餘弦相似度，
+    超過門檻時沿用最相似問題的 SQL。只快取通過安全性驗證並成功執行的 SQL，
+    保存在 SQLite 檔案中，重新啟動後仍有效。每個項目帶有建立時的快取指紋
+    （資料庫結構與訓練資料），指紋改變時整批失效。相似度門檻的優先順序為：
+    建構參數、快取檔案中保存的設定、環境變數、預設值。
+    """
+
+    def __init__(self, db_path: str, similarity_threshold: Optional[float] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = os.path.abspath(db_path)
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: list = []
+        self._fingerprint: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0,
+                       'saved_ms': 0.0, 'lookup_ms': 0.0, 'invalidations': 0}
+        self._load()
+        if self.similarity_threshold is None:
+            self.similarity_threshold = float(os.getenv(SIMILARITY_ENV, DEFAULT_SIMILARITY_THRESHOLD))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _load(self):
+        """讀取已保存的快取項目（檔案無法使用時以空快取運作）"""
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = self._connect()
+            try:
+                conn.execute(QUESTION_CACHE_SCHEMA)
+                conn.execute(QUESTION_CACHE_SETTINGS_SCHEMA)
+                rows = conn.execute(
+                    "SELECT normalized, question, sql_text, embedding, fingerprint, generate_ms, hits, last_used "
+                    "FROM question_cache"
+                ).fetchall()
+                setting = conn.execute("SELECT value FROM question_cache_settings WHERE name = ?",
+                                       (SIMILARITY_SETTING,)).fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            self.logger.warning(f"問題快取讀取失敗: {str(e)}")
+            return
+
+        if setting and self.similarity_threshold is None:
+            try:
+                self.similarity_threshold = float(setting[0])
+            except ValueError:
+                self.logger.warning(f"保存的相似度門檻無效，改用預設值: {setting[0]}")
+
+        for normalized, question, sql, embedding, fingerprint, generate_ms, hits, last_used in rows:
+            self._entries[normalized] = {
+                'question': question,
+                'sql': sql,
+                'embedding': np.frombuffer(embedding, dtype=np.float32) if embedding else None,
+                'fingerprint': fingerprint,
+                'generate_ms': generate_ms,
+                'hits': hits,
+                'last_used': last_used
+            }
+        self._matrix = None
+
+    def _execute(self, sql: str, params: tuple = ()):
+        """寫入快取檔案（失敗時只記錄警告，記憶體中的快取仍可使用）"""
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(sql, params)
+            finally:
+                conn.close()
+        except Exception as e:
+            self.logger.warning(f"問題快取寫入失敗: {str(e)}")
+
+    def _validate_fingerprint(self, fingerprint: str):
+        """指紋改變時移除建立於舊指紋的項目（需持有鎖）"""
+        if fingerprint == self._fingerprint:
+            return
+        stale = [key for key, entry in self._entries.items() if entry['fingerprint'] != fingerprint]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self._matrix = None
+            self._stats['invalidations'] += 1
+            self._execute("DELETE FROM question_cache WHERE fingerprint != ?", (fingerprint,))
+            self.logger.info(f"資料庫結構或訓練資料已變更，問題快取移除 {len(stale)} 筆")
+        self._fingerprint = fingerprint
+
+    def _similarity_matrix(self):
+        """具有嵌入向量的項目組成的單位向量矩陣（需持有鎖）"""
+        if self._matrix is None:
+            self._matrix_keys = [key for key, entry in self._entries.items() if entry['embedding'] is not None]
+            if self._matrix_keys:
+                matrix = np.vstack([self._entries[key]['embedding'] for key in self._matrix_keys])
+                self._matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            else:
+                self._matrix = np.empty((0, 0), dtype=np.float32)
+        return self._matrix
+
+    def _hit(self, key: str, tier: str, similarity: float, embedding: Optional[np.ndarray]) -> CacheLookup:
+        """記錄命中並返回結果（需持有鎖）"""
+        entry = self._entries[key]
+        entry['hits'] += 1
+        entry['last_used'] = time.time()
+        self._stats[f'{tier}_hits'] += 1
+        self._stats['saved_ms'] += entry['generate_ms']
+        self._execute("UPDATE question_cache SET hits = ?, last_used = ? WHERE normalized = ?",
+                      (entry['hits'], entry['last_used'], key))
+        return CacheLookup(entry['sql'], tier, similarity, embedding)
+
+    def lookup(self, question: str, fingerprint: str,
+               embed: Optional[Callable[[str], Any]] = None) -> CacheLookup:
+        """查詢快取：先完全比對正規化問題，再以嵌入向量做語意比對
+
+        未命中時返回計算過的嵌入向量，寫入快取時可直接沿用。
+        """
+        started = time.perf_counter()
+        key = normalize_question(question)
+        try:
+            with self._lock:
+                self._validate_fingerprint(fingerprint)
+                if key in self._entries:
+                    return self._hit(key, 'exact', 1.0, self._entries[key]['embedding'])
+
+            embedding = None
+            if embed is not None:
+                try:
+                    embedding = np.asarray(embed(question), dtype=np.float32).ravel()
+                except Exception as e:
+                    self.logger.warning(f"問題嵌入向量計算失敗，僅使用完全比對: {str(e)}")
+
+            with self._lock:
+                if embedding is not None and embedding.size:
+                    matrix = self._similarity_matrix()
+                    if len(self._matrix_keys) and matrix.shape[1] == embedding.size:
+                        scores = matrix @ (embedding / max(float(np.linalg.norm(embedding)), 1e-12))
+                        best = int(np.argmax(scores))
+                        if scores[best] >= self.similarity_threshold:
+                            return self._hit(self._matrix_keys[best], 'semantic', float(scores[best]), embedding)
+                self._stats['misses'] += 1
+                return CacheLookup(None, None, 0.0, embedding)
+        finally:
+            with self._lock:
+                self._stats['lookup_ms'] += (time.perf_counter() - started) * 1000
+
+    def store(self, question: str, sql: str, fingerprint: str, generate_ms: float,
+              embedding: Optional[np.ndarray] = None):
+        """保存已驗證並成功執行的 SQL"""
+        key = normalize_question(question)
+        now = time.time()
+        embedding = np.asarray(embedding, dtype=np.float32).ravel() if embedding is not None else None
+        with self._lock:
+            self._validate_fingerprint(fingerprint)
+            self._entries[key] = {
+                'question': question,
+                'sql': sql,
+                'embedding': embedding,
+                'fingerprint': fingerprint,
+                'generate_ms': generate_ms,
+                'hits': 0,
+                'last_used': now
+            }
+            self._execute(
+                "INSERT OR REPLACE INTO question_cache (normalized, question, sql_text, embedding, fingerprint, "
+                "generate_ms, hits, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                (key, question, sql, embedding.tobytes() if embedding is not None else None, fingerprint,
+                 generate_ms, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), now)
+            )
+
+            # 超過容量時淘汰最久未使用的項目
+            if len(self._entries) > self.max_entries:
+                excess = sorted(self._entries, key=lambda k: self._entries[k]['last_used'])
+                for stale_key in excess[:len(self._entries) - self.max_entries]:
+                    del self._entries[stale_key]
+                    self._execute("DELETE FROM question_cache WHERE normalized = ?", (stale_key,))
+            self._matrix = None
+
+    def clear(self):
+        """清除所有快取項目（新增或移除訓練資料後使用）"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._stats['invalidations'] += 1
+            self._execute("DELETE FROM question_cache")
+
+    def set_threshold(self, similarity_threshold: float):
+        """更新語意比對的相似度門檻（保存在快取檔案中，重新啟動後沿用）"""
+        with self._lock:
+            self.similarity_threshold = float(similarity_threshold)
+            self._execute("INSERT OR REPLACE INTO question_cache_settings (name, value) VALUES (?, ?)",
+                          (SIMILARITY_SETTING, repr(self.similarity_threshold)))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取快取統計資訊（命中率、節省的 SQL 生成時間與平均查詢延遲）"""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['exact_hits'] + stats['semantic_hits'] + stats['misses']
+            stats['lookups'] = lookups
+            stats['hit_rate'] = (stats['exact_hits'] + stats['semantic_hits']) / lookups if lookups else 0.0
+            stats['avg_lookup_ms'] = stats['lookup_ms'] / lookups if lookups else 0.0
+            stats['entries'] = len(self._entries)
+            stats['similarity_threshold'] = self.similarity_threshold
+            return stats
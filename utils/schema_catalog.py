@@ -0,0 +1,122 @@
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from utils.db_connection import ConnectionProvider
+
+
+class SchemaCatalog:
+    """資料庫結構目錄
+
+    一次讀取 sqlite_master 與各資料表的 PRAGMA table_info，整理出資料表、欄位、
+    型別、索引與資料筆數。每個資料庫版本只建立一次，側邊欄狀態檢查、自訂報表
+    欄位清單與 Vanna DDL 訓練都從這裡讀取，不必每次重新查詢 schema。
+    """
+
+    def __init__(self, tables: Dict[str, Dict[str, Any]], version: Hashable):
+        self.tables = tables
+        self.version = version
+        self.load_seconds = 0.0
+
+    @classmethod
+    def load(cls, provider: ConnectionProvider) -> "SchemaCatalog":
+        """從資料庫讀取結構目錄"""
+        started = time.perf_counter()
+        version = provider.version_token()
+        conn = provider.get_connection()
+
+        rows = conn.execute(
+            "SELECT type, name, tbl_name, sql FROM sqlite_master "
+            "WHERE type IN ('table', 'view', 'index') ORDER BY name"
+        ).fetchall()
+
+        tables = {}
+        for object_type, name, _, sql in rows:
+            if object_type == 'index':
+                continue
+            columns = [
+                {'name': column[1], 'type': column[2], 'notnull': bool(column[3]), 'pk': bool(column[5])}
+                for column in conn.execute(f'PRAGMA table_info("{name}")')
+            ]
+            row_count = None
+            if object_type == 'table':
+                row_count = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+            tables[name] = {
+                'name': name,
+                'type': object_type,
+                'sql': sql,
+                'columns': columns,
+                'indexes': [],
+                'row_count': row_count
+            }
+
+        for object_type, name, table_name, _ in rows:
+            if object_type == 'index' and table_name in tables:
+                tables[table_name]['indexes'].append(name)
+
+        catalog = cls(tables, version)
+        catalog.load_seconds = time.perf_counter() - started
+        return catalog
+
+    def table_names(self, include_views: bool = False) -> List[str]:
+        """資料表名稱（依名稱排序）"""
+        return [name for name, table in self.tables.items()
+                if include_views or table['type'] == 'table']
+
+    def has_table(self, name: str) -> bool:
+        """資料表或檢視表是否存在"""
+        return name in self.tables
+
+    def missing_tables(self, required: Iterable[str]) -> List[str]:
+        """找出不存在的資料表"""
+        return [name for name in required if name not in self.tables]
+
+    def columns(self, table: str) -> List[str]:
+        """資料表的欄位名稱（依定義順序）"""
+        return [column['name'] for column in self.tables.get(table, {}).get('columns', [])]
+
+    def column_types(self, table: str) -> Dict[str, str]:
+        """資料表的欄位型別"""
+        return {column['name']: column['type'] for column in self.tables.get(table, {}).get('columns', [])}
+
+    def available_columns(self, tables: Iterable[str]) -> List[str]:
+        """多個資料表的欄位聯集（排序後）"""
+        columns = set()
+        for table in tables:
+            columns.update(self.columns(table))
+        return sorted(columns)
+
+    def indexes(self, table: str) -> List[str]:
+        """資料表上的索引名稱"""
+        return list(self.tables.get(table, {}).get('indexes', []))
+
+    def row_count(self, table: str) -> Optional[int]:
+        """資料表筆數（檢視表或不存在時返回 None）"""
+        return self.tables.get(table, {}).get('row_count')
+
+    def ddl_statements(self, exclude: Optional[Callable[[str], bool]] = None) -> List[str]:
+        """資料表的 CREATE 語句，可排除特定資料表（例如衍生資料表）"""
+        return [table['sql'] for name, table in self.tables.items()
+                if table['type'] == 'table' and table['sql'] and table['sql'].strip()
+                and not (exclude and exclude(name))]
+
+
+_catalogs: Dict[str, SchemaCatalog] = {}
+_catalogs_lock = threading.Lock()
+_logger = logging.getLogger(__name__)
+
+
+def get_schema_catalog(provider: ConnectionProvider) -> SchemaCatalog:
+    """取得資料庫目前版本的結構目錄，資料庫檔案變更後重新建立"""
+    version = provider.version_token()
+    with _catalogs_lock:
+        catalog = _catalogs.get(provider.db_path)
+        if catalog is not None and catalog.version == version:
+            return catalog
+
+        catalog = SchemaCatalog.load(provider)
+        _catalogs[provider.db_path] = catalog
+        _logger.info(f"資料庫結構目錄已建立，共 {len(catalog.tables)} 個資料表，"
+                     f"耗時 {catalog.load_seconds:.3f} 秒")
+        return catalog
@@ -0,0 +1,127 @@
+import os
+import re
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.derived_database import (
+    SOURCE_TABLES, UNIFIED_COLUMNS, status_code_case_sql, status_label_case_sql
+)
+
+# 站點設定檔（JSON），可由環境變數指定路徑
+SITE_CONFIG_ENV = "TOOLING_SITES_CONFIG"
+DEFAULT_SITE_CONFIG = "sites.json"
+
+# 跨站點的統一配件檢視表（TEMP VIEW，每條連線建立）
+SITES_UNIFIED_VIEW = "sites_parts_unified"
+
+_ALIAS_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_RESERVED_ALIASES = {'main', 'temp'}
+
+
+class SiteRegistry:
+    """外包廠站點資料庫登錄表
+
+    每個站點擁有自己的資料庫檔案（與下載網址），以 ATTACH 掛載在獨立的 schema
+    別名下，例如 `pat.pat_parts_all`。站點的資料表格式沿用既有來源（PAT / KYEC）
+    的欄位對應，跨站點查詢使用統一檢視表 `sites_parts_unified`。
+
+    設定檔格式：
+        {"sites": [{"alias": "pat", "name": "PAT", "source": "PAT",
+                    "db_path": "sites/pat.db", "url": "https://..."}]}
+    """
+
+    def __init__(self, sites: Optional[List[Dict[str, Any]]] = None, base_dir: str = "."):
+        self.logger = logging.getLogger(__name__)
+        self.sites: Dict[str, Dict[str, Any]] = {}
+
+        for site in sites or []:
+            alias = site.get('alias', '')
+            source = site.get('source', '')
+            if not _ALIAS_PATTERN.match(alias) or alias.lower() in _RESERVED_ALIASES:
+                raise ValueError(f"站點別名不合法: {alias!r}")
+            if alias in self.sites:
+                raise ValueError(f"站點別名重複: {alias}")
+            if source not in SOURCE_TABLES:
+                raise ValueError(f"站點 {alias} 的資料格式不支援: {source!r}")
+
+            db_path = site.get('db_path') or f"{alias}.db"
+            self.sites[alias] = {
+                'alias': alias,
+                'name': site.get('name', alias),
+                'source': source,
+                'db_path': os.path.abspath(os.path.join(base_dir, db_path)),
+                'url': site.get('url'),
+            }
+
+    @classmethod
+    def from_file(cls, path: str) -> "SiteRegistry":
+        """從設定檔載入登錄表，檔案不存在時返回空的登錄表"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config.get('sites', []), base_dir=os.path.dirname(os.path.abspath(path)))
+
+    def __bool__(self) -> bool:
+        return bool(self.sites)
+
+    def aliases(self) -> List[str]:
+        """已登錄的站點別名"""
+        return list(self.sites)
+
+    def get(self, alias: str) -> Optional[Dict[str, Any]]:
+        """取得站點設定"""
+        return self.sites.get(alias)
+
+    def attachments(self) -> Dict[str, str]:
+        """站點別名與資料庫路徑（供 ConnectionProvider 掛載）"""
+        return {alias: site['db_path'] for alias, site in self.sites.items()}
+
+    def view_statements(self, aliases: Iterable[str]) -> List[str]:
+        """建立跨站點統一檢視表的 SQL（僅包含已掛載的站點）"""
+        unified_columns = list(UNIFIED_COLUMNS['PAT'])
+        selects = []
+        for alias in aliases:
+            site = self.sites[alias]
+            source = site['source']
+            select_list = ", ".join(f"{UNIFIED_COLUMNS[source][column]} as {column}" for column in unified_columns)
+            selects.append(f"""
+                SELECT '{alias}' as 站點代號, '{source}' as 來源, {select_list}, 配件狀態,
+                       {status_code_case_sql(source)} as 狀態代碼
+                FROM {alias}.{SOURCE_TABLES[source]}
+            """)
+        if not selects:
+            return []
+
+        column_list = ", ".join(unified_columns)
+        return [f"""
+            CREATE TEMP VIEW {SITES_UNIFIED_VIEW} AS
+            SELECT 站點代號, 來源, {column_list}, 配件狀態, 狀態代碼, {status_label_case_sql()} as 標準狀態
+            FROM ({' UNION ALL '.join(selects)})
+        """]
+
+    def sites_for_query(self, sql: str) -> Tuple[str, ...]:
+        """找出查詢引用的站點（用於只以相關站點的版本作為快取鍵）"""
+        if not self.sites:
+            return ()
+        if SITES_UNIFIED_VIEW in sql:
+            return tuple(self.sites)
+        return tuple(alias for alias in self.sites
+                     if re.search(rf'(?<![\w.]){re.escape(alias)}\s*\.', sql, re.IGNORECASE))
+
+
+_site_registry: Optional[SiteRegistry] = None
+
+
+def get_site_registry() -> SiteRegistry:
+    """取得行程共用的站點登錄表（設定檔讀取失敗時視為未設定站點）"""
+    global _site_registry
+    if _site_registry is None:
+        path = os.getenv(SITE_CONFIG_ENV, DEFAULT_SITE_CONFIG)
+        try:
+            _site_registry = SiteRegistry.from_file(path)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"站點設定讀取失敗: {str(e)}")
+            _site_registry = SiteRegistry()
+    return _site_registry
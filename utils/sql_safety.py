@@ -0,0 +1,219 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+# 驗證結果快取的最大筆數
+DEFAULT_CACHE_ENTRIES = 2048
+
+# 唯讀查詢允許的起始關鍵字
+READ_ONLY_STARTERS = {'SELECT', 'WITH'}
+
+# 會修改資料庫或執行外部指令的關鍵字
+FORBIDDEN_KEYWORDS = (
+    'DROP', 'DELETE', 'INSERT', 'UPDATE', 'ALTER', 'CREATE', 'TRUNCATE',
+    'EXEC', 'EXECUTE', 'ATTACH', 'DETACH', 'PRAGMA', 'VACUUM', 'REINDEX'
+)
+
+# 集合運算子（其後必須接 SELECT）
+SET_OPERATORS = {'UNION', 'INTERSECT', 'EXCEPT'}
+
+# 單次掃描的詞法規則：字串常值、註解與引號識別字整段略過，其餘只擷取有意義的關鍵字與分號。
+# 未擷取的字元（一般識別字、數字、運算子、空白）由正規表達式引擎直接跳過；
+# 開頭的前瞻只讓可能成為 token 的字元進入各分支比對。
+_KEYWORDS = ('SELECT', 'WITH', 'UNION', 'INTERSECT', 'EXCEPT', 'ALL') + FORBIDDEN_KEYWORDS
+_TOKEN_START = ''.join(sorted({word[0] for word in _KEYWORDS + ('REPLACE',)}))
+
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?=['"`\[/;\-""" + _TOKEN_START + r"""])
+    (?:
+      (?P<string>'(?:[^']|'')*')
+    | (?P<identifier>"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])
+    | (?P<line_comment>--[^\n]*)
+    | (?P<block_comment>/\*.*?\*/)
+    | (?P<unterminated>['"`\[]|/\*)
+    | (?P<semicolon>;)
+    | (?P<replace>\bREPLACE\b(?!\s*\())
+    | (?P<keyword>\b(?:""" + '|'.join(_KEYWORDS) + r""")\b)
+    )
+    """,
+    re.IGNORECASE | re.DOTALL | re.VERBOSE
+)
+
+_FIRST_WORD_PATTERN = re.compile(r'\s*(\w+)')
+
+
+class SqlVerdict(NamedTuple):
+    """SQL 驗證結果"""
+    is_safe: bool
+    statement_type: str
+    reason: Optional[str] = None
+
+
+def _gap_is_blank(sql: str, start: int, end: int, allowed: str = '') -> bool:
+    """兩個 token 之間是否只有空白（或允許的字元）"""
+    return not sql[start:end].strip().strip(allowed).strip()
+
+
+def _first_word(sql: str, start: int) -> str:
+    """取得位置之後的第一個字（用於描述語句類型）"""
+    match = _FIRST_WORD_PATTERN.match(sql, start)
+    return match.group(1).upper() if match else ''
+
+
+def analyze_sql(sql: str) -> SqlVerdict:
+    """以單次詞法掃描判斷 SQL 是否為單一唯讀查詢
+
+    字串常值、註解與引號識別字內的文字不視為關鍵字；只允許以 SELECT / WITH
+    開始的單一語句，集合運算子之後必須接 SELECT，結尾的分號與註解允許存在。
+    """
+    if not sql or not sql.strip():
+        return SqlVerdict(False, '', '空白查詢')
+
+    statement_type = None
+    position = 0
+    terminated = False
+    expect_select = None
+    expect_position = 0
+
+    for match in _TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind == 'unterminated':
+            return SqlVerdict(False, statement_type or '', '未結束的字串、識別字或註解')
+
+        # 語句開始前、分號之後不得出現未擷取的內容；集合運算子之後只允許括號
+        if expect_select and not _gap_is_blank(sql, expect_position, match.start(), '('):
+            return SqlVerdict(False, statement_type, f'{expect_select} 之後必須接 SELECT')
+        if (statement_type is None or terminated) and not _gap_is_blank(sql, position, match.start()):
+            break
+        position = match.end()
+
+        if kind in ('line_comment', 'block_comment'):
+            expect_position = position
+            continue
+
+        if terminated:
+            if kind == 'semicolon':
+                continue
+            return SqlVerdict(False, statement_type, '不允許多個語句')
+
+        if kind in ('string', 'identifier'):
+            if statement_type is None:
+                break
+            if expect_select:
+                return SqlVerdict(False, statement_type, f'{expect_select} 之後必須接 SELECT')
+            continue
+
+        if kind == 'semicolon':
+            if statement_type is None or expect_select:
+                break
+            terminated = True
+            continue
+
+        word = match.group().upper()
+        if kind == 'replace' or word in FORBIDDEN_KEYWORDS:
+            return SqlVerdict(False, statement_type or word, f'不允許的關鍵字: {word}')
+
+        if statement_type is None:
+            if word not in READ_ONLY_STARTERS:
+                return SqlVerdict(False, word, '只允許 SELECT 查詢')
+            statement_type = word
+        elif expect_select:
+            if word == 'ALL' and expect_select == 'UNION':
+                expect_position = position
+                continue
+            if word != 'SELECT':
+                return SqlVerdict(False, statement_type, f'{expect_select} 之後必須接 SELECT')
+            expect_select = None
+        elif word in SET_OPERATORS:
+            expect_select = word
+            expect_position = position
+    else:
+        # 掃描完畢：檢查結尾內容
+        if statement_type is None:
+            word = _first_word(sql, position)
+            return SqlVerdict(False, word, '只允許 SELECT 查詢' if word else '空白查詢')
+        if terminated and not _gap_is_blank(sql, position, len(sql)):
+            return SqlVerdict(False, statement_type, '不允許多個語句')
+        if expect_select:
+            return SqlVerdict(False, statement_type, f'{expect_select} 之後必須接 SELECT')
+        return SqlVerdict(True, statement_type)
+
+    # 在語句開始前或分號之後遇到未擷取的內容
+    if statement_type is None:
+        return SqlVerdict(False, _first_word(sql, position), '只允許 SELECT 查詢')
+    if expect_select:
+        return SqlVerdict(False, statement_type, f'{expect_select} 之後必須接 SELECT')
+    return SqlVerdict(False, statement_type, '不允許多個語句')
+
+
+class SqlSafetyValidator:
+    """行程共用的 SQL 安全性驗證器
+
+    以 analyze_sql 的單次詞法掃描取代逐一比對多個正規表達式，
+    並以 SQL 內容雜湊為鍵快取驗證結果（LRU），同一查詢在生成、執行與
+    報表流程中重複驗證時不必重新掃描。
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+
+        self._verdicts: "OrderedDict[bytes, SqlVerdict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def validate(self, sql: str) -> SqlVerdict:
+        """驗證 SQL 並返回驗證結果"""
+        if not sql:
+            return SqlVerdict(False, '', '空白查詢')
+
+        key = hashlib.blake2b(sql.encode('utf-8'), digest_size=16).digest()
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is not None:
+                self._verdicts.move_to_end(key)
+                self._hits += 1
+                return verdict
+            self._misses += 1
+
+        verdict = analyze_sql(sql)
+
+        with self._lock:
+            self._verdicts[key] = verdict
+            while len(self._verdicts) > self.max_entries:
+                self._verdicts.popitem(last=False)
+        return verdict
+
+    def is_safe(self, sql: str) -> bool:
+        """SQL 是否為單一唯讀查詢"""
+        return self.validate(sql).is_safe
+
+    def clear(self):
+        """清除驗證結果快取"""
+        with self._lock:
+            self._verdicts.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取快取統計資訊"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'entries': len(self._verdicts),
+                'max_entries': self.max_entries
+            }
+
+
+_sql_validator = SqlSafetyValidator()
+
+
+def get_sql_validator() -> SqlSafetyValidator:
+    """取得行程共用的 SQL 安全性驗證器"""
+    return _sql_validator
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.training_store import STORE_COLLECTIONS, ingest_training_items
+
+# 訓練清單檔名（與向量資料庫放在同一目錄，刪除向量資料庫時一併失效）
+MANIFEST_FILENAME = "training_manifest.json"
+
+# 訓練項目種類與 vn.train 的參數對應
+TRAINING_KINDS = ('ddl', 'documentation', 'sql')
+
+
+def training_item(kind: str, content: str, question: Optional[str] = None) -> Dict[str, Any]:
+    """建立訓練項目並計算內容雜湊（種類、問題與內容去除首尾空白後計算）"""
+    if kind not in TRAINING_KINDS:
+        raise ValueError(f"不支援的訓練資料種類: {kind!r}")
+    content = content.strip()
+    question = question.strip() if question else None
+    digest = hashlib.sha256(json.dumps([kind, question, content], ensure_ascii=False).encode('utf-8'))
+    return {'kind': kind, 'question': question, 'content': content, 'hash': digest.hexdigest()}
+
+
+class TrainingManifest:
+    """內建訓練資料的內容雜湊清單
+
+    記錄每個已嵌入項目的內容雜湊與向量資料庫中的訓練資料 ID。啟動時比對目前的
+    訓練項目：只嵌入新增或內容變更的項目，並移除已不存在的項目；全部相同時
+    不呼叫嵌入模型。清單只管理內建項目，使用者另外新增的訓練資料不受影響。
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.logger = logging.getLogger(__name__)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.updated_at: Optional[str] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def for_store(cls, store_path: str) -> "TrainingManifest":
+        """取得向量資料庫目錄中的訓練清單"""
+        return cls(os.path.join(store_path, MANIFEST_FILENAME))
+
+    def _load(self):
+        """讀取清單檔（不存在或損毀時視為空清單，所有項目重新嵌入）"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = dict(data.get('entries', {}))
+            self.updated_at = data.get('updated_at')
+        except Exception as e:
+            self.logger.warning(f"訓練清單讀取失敗，將重新嵌入所有項目: {str(e)}")
+            self.entries = {}
+
+    def save(self):
+        """寫入清單檔（先寫暫存檔再替換，避免中斷時留下不完整的檔案）"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'updated_at': self.updated_at, 'entries': self.entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _drop_missing_collections(self, vn):
+        """向量資料庫的 collection 已清空時，移除清單中對應種類的紀錄（避免誤判為已嵌入）"""
+        for kind, attribute in STORE_COLLECTIONS.items():
+            collection = getattr(vn, attribute, None)
+            if collection is None:
+                continue
+            try:
+                empty = collection.count() == 0
+            except Exception:
+                continue
+            if empty:
+                self.entries = {digest: entry for digest, entry in self.entries.items() if entry['kind'] != kind}
+
+    def sync(self, vn, items: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """讓向量資料庫中的內建訓練資料與 items 一致
+
+        返回各項數量：實際嵌入的新項目 (`added`)、向量資料庫已有而直接記錄的項目
+        (`skipped`)、移除、嵌入失敗 (`failed`)、未通過 SQL 驗證 (`rejected`) 與未變更。
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if self.entries:
+                self._drop_missing_collections(vn)
+
+            desired = {item['hash']: item for item in items}
+            stale = [digest for digest in self.entries if digest not in desired]
+            pending = [item for digest, item in desired.items() if digest not in self.entries]
+
+            removed = 0
+            for digest in stale:
+                entry = self.entries[digest]
+                try:
+                    if entry.get('id'):
+                        vn.remove_training_data(entry['id'])
+                    del self.entries[digest]
+                    removed += 1
+                except Exception as e:
+                    self.logger.warning(f"移除過期訓練資料失敗 ({entry.get('label')}): {str(e)}")
+
+            # 批次嵌入新增或變更的項目；失敗或未通過驗證的項目不寫入清單，下次啟動時重試
+            ingested = ingest_training_items(vn, pending)
+            for item in pending:
+                training_id = ingested['ids'].get(item['hash'])
+                if training_id is None:
+                    continue
+                self.entries[item['hash']] = {
+                    'kind': item['kind'],
+                    'id': training_id,
+                    'label': (item['question'] or item['content'])[:60]
+                }
+            for rejected in ingested['rejected']:
+                self.logger.warning(f"內建訓練資料未通過 SQL 安全性驗證 ({rejected['question']}): {rejected['reason']}")
+
+            if ingested['added'] or ingested['skipped'] or removed or not os.path.exists(self.path):
+                self.save()
+
+        return {
+            'added': ingested['added'],
+            'skipped': ingested['skipped'],
+            'removed': removed,
+            'failed': ingested['failed'],
+            'rejected': len(ingested['rejected']),
+            'unchanged': len(desired) - len(pending),
+            'seconds': time.perf_counter() - started
+        }
+
+    def training_ids(self) -> List[str]:
+        """清單記錄的向量資料庫訓練資料 ID"""
+        with self._lock:
+            return [entry['id'] for entry in self.entries.values() if entry.get('id')]
+
+    def content_hashes(self) -> List[str]:
+        """已嵌入項目的內容雜湊（排序後）"""
+        with self._lock:
+            return sorted(self.entries)
+
+    def summary(self) -> Dict[str, Any]:
+        """清單摘要（各種類的項目數量與最後更新時間）"""
+        with self._lock:
+            counts = {kind: 0 for kind in TRAINING_KINDS}
+            for entry in self.entries.values():
+                counts[entry['kind']] = counts.get(entry['kind'], 0) + 1
+            return {'total': len(self.entries), 'counts': counts, 'updated_at': self.updated_at}
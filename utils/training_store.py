@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import statistics
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from vanna.utils import deterministic_uuid
+
+from utils.sql_safety import get_sql_validator
+
+# 訓練資料種類與 ChromaDB_VectorStore 上的 collection 屬性
+STORE_COLLECTIONS = {'ddl': 'ddl_collection', 'documentation': 'documentation_collection', 'sql': 'sql_collection'}
+
+# 重建 collection 時每批寫入的筆數（低於 Chroma 的單批上限）
+REBUILD_BATCH_SIZE = 1000
+
+# 量測檢索延遲時每個問題重複的次數
+LATENCY_REPEAT = 3
+
+# 批次匯入時每次計算嵌入向量與寫入 Chroma 的筆數
+DEFAULT_INGEST_BATCH_SIZE = 64
+
+# 重建 collection 時暫存 collection 的名稱後綴
+STAGING_SUFFIX = "-compact"
+
+# 與 Vanna 的 ChromaDB_VectorStore 相同的訓練資料 ID 後綴
+_ID_SUFFIXES = {'ddl': '-ddl', 'documentation': '-doc', 'sql': '-sql'}
+
+_logger = logging.getLogger(__name__)
+
+
+def normalize_training_text(text: Optional[str]) -> str:
+    """正規化訓練內容（合併空白、去除結尾分號），用於判斷重複項目"""
+    if not text:
+        return ''
+    return ' '.join(str(text).split()).rstrip(';').strip()
+
+
+def _dedup_key(kind: str, document: Optional[str]) -> tuple:
+    """重複判斷鍵：問題-SQL 對以正規化後的問題與 SQL 判斷，其餘以正規化內容判斷"""
+    if kind == 'sql':
+        try:
+            pair = json.loads(document or '{}')
+            return (normalize_training_text(pair.get('question')), normalize_training_text(pair.get('sql')))
+        except (ValueError, AttributeError):
+            pass
+    return (normalize_training_text(document),)
+
+
+def train_item(vn, item: Dict[str, Any]) -> Optional[str]:
+    """以 vn.train 嵌入單一訓練項目，返回向量資料庫的訓練資料 ID"""
+    if item['kind'] == 'ddl':
+        return vn.train(ddl=item['content'])
+    if item['kind'] == 'documentation':
+        return vn.train(documentation=item['content'])
+    return vn.train(question=item['question'], sql=item['content'])
+
+
+def _store_document(item: Dict[str, Any]) -> str:
+    """訓練項目寫入 Chroma 的文件內容（與 ChromaDB_VectorStore.add_* 相同）"""
+    if item['kind'] == 'sql':
+        return json.dumps({'question': item['question'], 'sql': item['content']}, ensure_ascii=False)
+    return item['content']
+
+
+def ingest_training_items(vn, items: Iterable[Dict[str, Any]],
+                          batch_size: int = DEFAULT_INGEST_BATCH_SIZE) -> Dict[str, Any]:
+    """批次嵌入並寫入訓練項目
+
+    問題-SQL 對先經過 SQL 安全性驗證，未通過的項目不寫入。每批項目以一次
+    embedding_function 呼叫計算向量、一次 collection.add 寫入，訓練資料 ID 與
+    vn.train 產生的相同；向量資料庫已有的項目直接沿用不重新嵌入。
+    向量資料庫不是 Chroma 時改為逐筆呼叫 vn.train。
+
+    返回新增、略過（已存在或重複）、拒絕與失敗的數量、各項目的訓練資料 ID
+    (`ids`: 內容雜湊 → ID) 與每秒處理筆數。
+    """
+    started = time.perf_counter()
+    validator = get_sql_validator()
+    report = {'added': 0, 'skipped': 0, 'failed': 0, 'rejected': [], 'ids': {}}
+
+    accepted = []
+    for item in items:
+        if item['kind'] == 'sql':
+            verdict = validator.validate(item['content'])
+            if not verdict.is_safe:
+                report['rejected'].append({'question': item['question'], 'sql': item['content'],
+                                           'reason': verdict.reason})
+                continue
+        accepted.append(item)
+
+    batched = getattr(vn, 'embedding_function', None) is not None and all(
+        getattr(vn, attribute, None) is not None for attribute in STORE_COLLECTIONS.values())
+
+    by_kind: Dict[str, List[Dict[str, Any]]] = {}
+    for item in accepted:
+        by_kind.setdefault(item['kind'], []).append(item)
+
+    for kind, kind_items in by_kind.items():
+        for start in range(0, len(kind_items), batch_size):
+            batch = kind_items[start:start + batch_size]
+            if not batched:
+                for item in batch:
+                    try:
+                        report['ids'][item['hash']] = train_item(vn, item)
+                        report['added'] += 1
+                    except Exception as e:
+                        report['failed'] += 1
+                        _logger.warning(f"訓練資料嵌入失敗 ({kind}): {str(e)}")
+                continue
+
+            collection = getattr(vn, STORE_COLLECTIONS[kind])
+            documents = {}
+            for item in batch:
+                document = _store_document(item)
+                training_id = deterministic_uuid(document) + _ID_SUFFIXES[kind]
+                report['ids'][item['hash']] = training_id
+                documents.setdefault(training_id, document)
+            try:
+                existing = set(collection.get(ids=list(documents), include=[])['ids'])
+                new_ids = [training_id for training_id in documents if training_id not in existing]
+                if new_ids:
+                    new_documents = [documents[training_id] for training_id in new_ids]
+                    collection.add(ids=new_ids, documents=new_documents,
+                                   embeddings=vn.embedding_function(new_documents))
+            except Exception as e:
+                for item in batch:
+                    report['ids'].pop(item['hash'], None)
+                report['failed'] += len(batch)
+                _logger.warning(f"訓練資料批次寫入失敗 ({kind}，{len(batch)} 筆): {str(e)}")
+                continue
+            report['added'] += len(new_ids)
+            report['skipped'] += len(batch) - len(new_ids)
+
+    report['seconds'] = time.perf_counter() - started
+    processed = len(accepted)
+    report['items_per_second'] = processed / report['seconds'] if report['seconds'] > 0 else float(processed)
+    return report
+
+
+def store_disk_bytes(store_path: str) -> int:
+    """向量資料庫目錄的磁碟用量（位元組）"""
+    total = 0
+    for root, _, files in os.walk(store_path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def collection_counts(vn) -> Dict[str, int]:
+    """各 collection 的訓練資料筆數"""
+    counts = {}
+    for kind, attribute in STORE_COLLECTIONS.items():
+        collection = getattr(vn, attribute, None)
+        counts[kind] = collection.count() if collection is not None else 0
+    counts['total'] = sum(counts.values())
+    return counts
+
+
+def measure_retrieval_latency(vn, questions: Iterable[str], repeat: int = LATENCY_REPEAT) -> Optional[float]:
+    """量測產生 SQL 前的檢索延遲（相似問題、相關 DDL 與文件），返回每個問題的中位數毫秒"""
+    timings = []
+    try:
+        for question in questions:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                vn.get_similar_question_sql(question)
+                vn.get_related_ddl(question)
+                vn.get_related_documentation(question)
+                timings.append((time.perf_counter() - started) * 1000)
+    except Exception as e:
+        _logger.warning(f"檢索延遲量測失敗: {str(e)}")
+        return None
+    return statistics.median(timings) if timings else None
+
+
+def _rebuild_collection(vn, kind: str, keep_ids: Set[str]) -> int:
+    """只保留 keep_ids 重建 collection（沿用既有向量，不重新嵌入），返回移除的筆數
+
+    先寫入暫存名稱的新 collection，完成後替換 vn 上的 collection 屬性，再刪除舊的
+    collection 並將新 collection 改回原名稱；重建期間其他工作階段仍可查詢舊的 collection。
+    """
+    attribute = STORE_COLLECTIONS[kind]
+    collection = getattr(vn, attribute)
+    data = collection.get(include=['documents', 'embeddings', 'metadatas'])
+
+    kept = [index for index, training_id in enumerate(data['ids']) if training_id in keep_ids]
+    removed = len(data['ids']) - len(kept)
+    if not removed:
+        return 0
+
+    ids = [data['ids'][index] for index in kept]
+    documents = [data['documents'][index] for index in kept]
+    embeddings = [data['embeddings'][index] for index in kept]
+    metadatas = data.get('metadatas')
+    if metadatas is not None and all(metadata is None for metadata in metadatas):
+        metadatas = None
+
+    # 寫入新的 collection（釋放向量索引中已刪除項目佔用的空間）
+    name = collection.name
+    staging_name = f"{name}{STAGING_SUFFIX}"
+    try:
+        vn.chroma_client.delete_collection(staging_name)  # 上次中斷留下的暫存 collection
+    except Exception:
+        pass
+    rebuilt = vn.chroma_client.create_collection(
+        name=staging_name, embedding_function=vn.embedding_function, metadata=collection.metadata
+    )
+    for start in range(0, len(ids), REBUILD_BATCH_SIZE):
+        end = start + REBUILD_BATCH_SIZE
+        rebuilt.add(
+            ids=ids[start:end],
+            documents=documents[start:end],
+            embeddings=embeddings[start:end],
+            metadatas=[metadatas[index] for index in kept[start:end]] if metadatas is not None else None
+        )
+
+    # 先切換查詢使用的 collection，再移除舊的並沿用原名稱（重新啟動時 Vanna 依名稱開啟）
+    setattr(vn, attribute, rebuilt)
+    vn.chroma_client.delete_collection(name)
+    rebuilt.modify(name=name)
+    return removed
+
+
+def _vacuum_store(store_path: str):
+    """壓縮 Chroma 的 SQLite 檔案（失敗時只記錄警告）"""
+    sqlite_path = os.path.join(store_path, 'chroma.sqlite3')
+    if not os.path.exists(sqlite_path):
+        return
+    try:
+        conn = sqlite3.connect(sqlite_path, timeout=5)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    except Exception as e:
+        _logger.warning(f"向量資料庫壓縮失敗: {str(e)}")
+
+
+def compact_training_store(vn, store_path: str, preferred_ids: Iterable[str] = (),
+                           probe_questions: Iterable[str] = ()) -> Dict[str, Any]:
+    """合併向量資料庫中內容相同的訓練資料並重建 collection
+
+    依正規化後的內容分組，每組保留一筆（優先保留 `preferred_ids`，例如訓練清單
+    記錄的 ID，其次為 ID 最小的一筆，不依賴 Chroma 返回的順序），保留項目沿用原本的
+    ID 與向量。返回整理前後的筆數、磁碟用量與檢索延遲。
+    """
+    started = time.perf_counter()
+    preferred_ids = set(preferred_ids)
+    probe_questions = list(probe_questions)
+
+    report = {
+        'before': collection_counts(vn),
+        'disk_bytes_before': store_disk_bytes(store_path),
+        'latency_ms_before': measure_retrieval_latency(vn, probe_questions) if probe_questions else None,
+        'removed': {},
+    }
+
+    for kind, attribute in STORE_COLLECTIONS.items():
+        collection = getattr(vn, attribute, None)
+        if collection is None:
+            continue
+        data = collection.get(include=['documents'])
+
+        groups: Dict[tuple, List[str]] = {}
+        for training_id, document in zip(data['ids'], data['documents']):
+            groups.setdefault(_dedup_key(kind, document), []).append(training_id)
+
+        keep_ids = set()
+        for training_ids in groups.values():
+            preferred = [training_id for training_id in training_ids if training_id in preferred_ids]
+            keep_ids.add(min(preferred or training_ids))
+
+        report['removed'][kind] = _rebuild_collection(vn, kind, keep_ids) if len(keep_ids) < len(data['ids']) else 0
+
+    if any(report['removed'].values()):
+        _vacuum_store(store_path)
+
+    report['after'] = collection_counts(vn)
+    report['disk_bytes_after'] = store_disk_bytes(store_path)
+    report['latency_ms_after'] = measure_retrieval_latency(vn, probe_questions) if probe_questions else None
+    report['seconds'] = time.perf_counter() - started
+    _logger.info(f"訓練資料整理完成: {report['before']['total']} → {report['after']['total']} 筆，"
+                 f"耗時 {report['seconds']:.2f} 秒")
+    return report
+
+
+if __name__ == '__main__':
+    # 維護指令：python -m utils.training_store
+    from utils.vanna_config import VannaConfig
+
+    logging.basicConfig(level=logging.INFO)
+    result = VannaConfig().compact_training_store()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
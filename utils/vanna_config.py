@@ -13,11 +13,20 @@ from vanna.openai.openai_chat import OpenAI_Chat
 from vanna.chromadb import ChromaDB_VectorStore
 import streamlit as st
 import pandas as pd
-from datetime import datetime
 import logging
+import threading
+import time
 from typing import Dict, List, Optional, Any
 import os
 import json
+from utils.db_connection import get_connection_provider
+from utils.derived_database import is_derived_table, resolve_read_path
+from utils.query_governor import describe_partial_result, get_query_governor
+from utils.sql_safety import get_sql_validator
+from utils.schema_catalog import get_schema_catalog
+from utils.training_manifest import TrainingManifest, training_item
+from utils.training_store import compact_training_store, ingest_training_items
+from utils.question_cache import CACHE_FILENAME, QuestionSqlCache, cache_fingerprint
 
 class MyVanna(ChromaDB_VectorStore, OpenAI_Chat):
     def __init__(self, config=None):
@@ -28,15 +37,26 @@ class VannaConfig:
     """Vanna AI 配置和管理類別 - 基於官方範例"""
     
     def __init__(self):
+        started = time.perf_counter()
         self.logger = logging.getLogger(__name__)
         self.model_name = "tooling_parts_model"
         self.training_data_file = "data/training_data.json"
+        self.chroma_path = "./chroma_db"
+        self.training_manifest = TrainingManifest.for_store(self.chroma_path)
+        self.question_cache = QuestionSqlCache(os.path.join(self.chroma_path, CACHE_FILENAME))
+        
+        # 初始化狀態（由介面層顯示，建構時不直接輸出 Streamlit 訊息）
+        self.api_key_missing = False
+        self.init_error: Optional[str] = None
+        self.last_training_result: Optional[Dict[str, Any]] = None
         
         # 初始化 Vanna AI
         self.vn = self._initialize_vanna()
         
         # 載入或建立訓練資料
         self._setup_training_data()
+        
+        self.load_seconds = time.perf_counter() - started
     
     def _initialize_vanna(self):
         """初始化 Vanna AI - 根據官方範例"""
@@ -44,7 +64,8 @@ class VannaConfig:
             # 獲取 OpenAI API 金鑰
             api_key = self._get_openai_api_key()
             if not api_key:
-                st.warning("⚠️ 未設置 OpenAI API 金鑰，AI 功能將受限")
+                self.api_key_missing = True
+                self.logger.warning("未設置 OpenAI API 金鑰，AI 功能將受限")
                 # 使用假的 API 金鑰進行初始化，但會在實際調用時失敗
                 api_key = "sk-fake-key-for-initialization"
             
@@ -52,17 +73,28 @@ class VannaConfig:
             vn_instance = MyVanna(config={
                 'api_key': api_key,
                 'model': 'gpt-4',  # 或 'gpt-4'
-                'path': './chroma_db',  # ChromaDB 資料庫路徑
+                'path': self.chroma_path,  # ChromaDB 資料庫路徑
                 'allow_llm_to_see_data': True  # 在配置中設置
             })
             
-            # 連接到 SQLite 資料庫
-            db_path = os.path.abspath("tooling_data.db")
+            # 連接到 SQLite 資料庫（優先使用已建立索引的衍生資料庫）
+            db_path = os.path.abspath(resolve_read_path("tooling_data.db"))
             if not os.path.exists(db_path):
-                self.logger.error(f"資料庫文件不存在: {db_path}")
+                self.init_error = f"資料庫文件不存在: {db_path}"
+                self.logger.error(self.init_error)
                 return None
             
-            vn_instance.connect_to_sqlite(db_path)
+            # 使用行程共用的唯讀連線，取代 connect_to_sqlite 的獨立連線
+            provider = get_connection_provider(db_path)
+            governor = get_query_governor()
+            
+            def run_sql_sqlite(sql: str) -> pd.DataFrame:
+                # AI 產生的 SQL 受最大結果數與超時限制
+                return governor.run(provider.get_connection(), sql, max_rows=governor.max_rows)
+            
+            vn_instance.dialect = "SQLite"
+            vn_instance.run_sql = run_sql_sqlite
+            vn_instance.run_sql_is_set = True
             
             # 確保設置允許 LLM 查看資料庫資料
             try:
@@ -75,8 +107,8 @@ class VannaConfig:
             return vn_instance
             
         except Exception as e:
+            self.init_error = str(e)
             self.logger.error(f"Vanna AI 初始化失敗: {str(e)}")
-            st.error(f"AI 查詢引擎初始化失敗: {str(e)}")
             return None
     
     def _get_openai_api_key(self) -> Optional[str]:
@@ -90,313 +122,301 @@ class VannaConfig:
         # 從環境變數獲取
         return os.getenv("OPENAI_API_KEY")
     
-    def _get_openai_api_key(self) -> Optional[str]:
-        """獲取 OpenAI API 金鑰"""
-        # 優先從 Streamlit secrets 獲取
-        try:
-            return st.secrets["openai"]["api_key"]
-        except:
-            pass
-        
-        # 從環境變數獲取
-        return os.getenv("OPENAI_API_KEY")
-    
     def _setup_training_data(self):
-        """設置訓練資料 - 參考官方範例"""
+        """設置訓練資料 - 依訓練清單只嵌入新增或變更的項目"""
         if not self.vn:
             return
         self._train_model()
-        try:
-            # 檢查是否已經有訓練資料
-            existing_training_data = self.vn.get_training_data()
-            
-            if len(existing_training_data) == 0:
-                self.logger.info("開始訓練 Vanna AI 模型...")
-                self._train_model()
-            else:
-                self.logger.info(f"已有 {len(existing_training_data)} 筆訓練資料")
-                
-        except Exception as e:
-            self.logger.error(f"訓練資料設置失敗: {str(e)}")
     
     def _train_model(self):
-        """訓練模型 - 基於官方範例的方式"""
+        """訓練模型 - 比對訓練清單的內容雜湊，只嵌入新增或變更的項目並移除已刪除的項目"""
         if not self.vn:
             return
             
         try:
-            # 1. 根據官方範例，先從資料庫獲取實際的 DDL
-            try:
-                df_ddl = self.vn.run_sql("SELECT type, sql FROM sqlite_master WHERE sql is not null")
-                
-                for ddl in df_ddl['sql'].to_list():
-                    if ddl and ddl.strip():
-                        self.vn.train(ddl=ddl)
-                        self.logger.info(f"訓練 DDL: {ddl[:50]}...")
-                        
-            except Exception as ddl_error:
-                self.logger.warning(f"無法從資料庫獲取 DDL，使用預設 DDL: {str(ddl_error)}")
-                
-                # 備用 DDL 訓練
-                ddl_statements = [
-                    """
-                    CREATE TABLE kyec_parts_all (
-                        客戶產品型號 TEXT,
-                        客戶名稱 TEXT,
-                        配件編號 TEXT,
-                        財產編號 TEXT,
-                        板全號 TEXT,
-                        目前儲位 TEXT,
-                        配件狀態 TEXT,
-                        舊配件編碼 TEXT,
-                        財產歸屬 TEXT,
-                        所屬客戶 TEXT,
-                        配件種類 TEXT,
-                        Dut數 INTEGER,
-                        機台型號 TEXT,
-                        Handler型號 TEXT,
-                        封裝型式 TEXT,
-                        狀態開始時間 TEXT,
-                        上一個狀態 TEXT,
-                        處理時間 TEXT,
-                        領用時間 TEXT,
-                        配件種類編號 TEXT
-                    );
-                    """,
-                    """
-                    CREATE TABLE pat_parts_all (
-                        客戶名稱 TEXT,
-                        站點 TEXT,
-                        配件名稱 TEXT,
-                        GLB_NO TEXT,
-                        Package_Type TEXT,
-                        配件種類 TEXT,
-                        LB_DB_NO TEXT,
-                        配件狀態 TEXT,
-                        待驗收 TEXT,
-                        儲位 TEXT,
-                        製作出廠日期 TIMESTAMP,
-                        財產歸屬 TEXT,
-                        客戶財編 TEXT,
-                        產品型號 TEXT,
-                        配件編號 TEXT,
-                        配件種類編號 TEXT,
-                        開始時間 TEXT,
-                        借出天數 REAL,
-                        說明 TEXT,
-                        維修天數 REAL,
-                        產品型號_簡化 TEXT
-                    );
-                    """,
-                    """
-                    CREATE TABLE table_change_log (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        table_name TEXT,
-                        operation TEXT,
-                        timestamp TEXT,
-                        row_key TEXT,
-                        column_name TEXT,
-                        old_value TEXT,
-                        new_value TEXT,
-                        user TEXT,
-                        note TEXT
-                    );
-                    """
-                ]
+            result = self.training_manifest.sync(self.vn, self._collect_training_items())
+            self.last_training_result = result
+            if result['added'] or result['skipped'] or result['removed']:
+                self.logger.info(f"模型訓練完成: 新增 {result['added']} 筆、已存在 {result['skipped']} 筆、"
+                                 f"移除 {result['removed']} 筆、未變更 {result['unchanged']} 筆，"
+                                 f"耗時 {result['seconds']:.2f} 秒")
+            else:
+                self.logger.info(f"訓練資料未變更（{result['unchanged']} 筆），"
+                                 f"略過嵌入，耗時 {result['seconds'] * 1000:.1f} ms")
+        except Exception as e:
+            self.logger.error(f"模型訓練失敗: {str(e)}")
+    
+    def _collect_training_items(self) -> List[Dict[str, Any]]:
+        """整理內建訓練資料（DDL、文件說明與問題-SQL 對）"""
+        items = []
+        
+        # 1. 根據官方範例，先從資料庫獲取實際的 DDL
+        try:
+            catalog = get_schema_catalog(get_connection_provider(resolve_read_path("tooling_data.db")))
+            
+            for ddl in catalog.ddl_statements(exclude=is_derived_table):
+                items.append(training_item('ddl', ddl))
                 
-                for ddl in ddl_statements:
-                    self.vn.train(ddl=ddl)
-            
-            # 2. 訓練文檔說明
-            documentation = [
-                "The database contains information about tooling parts from two main sources: PAT and KYEC.",
-                "PAT is also known as 鴻谷, 紅古, or 鴻股.",
-                "KYEC is also known as 京元電子, 京元電, 京元, or 晶圓.",
-                "The customer '創惟' and '創惟科技' refer to the same company, Genesys Logic.",
-                "The table 'table_change_log' stores table change log. Its columns are: id, table_name, operation, timestamp, row_key, column_name, old_value, new_value, user, note.",
-                "'table_change_log' is an audit table that records all changes made to other tables.",
-                "The 'operation' column shows the type of change (e.g., 'update', 'insert').",
-                "The table 'query_log' is currently empty.",
-                "The table 'pat_parts_all' stores pat parts all. Its columns are: 客戶名稱, 站點, 配件名稱, GLB_NO, Package Type, 配件種類, LB / DB NO, 配件狀態, 待驗收, 儲 位, 製作出廠日期, 財產歸屬, 客戶財編, 產品型號, 配件編號, 配件種類編號, 開始時間, 借出天數, 說明, 維修天數, 產品型號_簡化.",
-                "'pat_parts_all' contains detailed records of individual parts from PAT.",
-                "'配件狀態' (Part Status) indicates the current state of a part.",
-                "Possible values for '配件狀態' in 'pat_parts_all' are: ['OUT_REPAIR', 'REPAIR', 'BORROW', 'PRODUCTION', '其它'].",
-                "'維修天數' means repair days, and '借出天數' means loan days.",
-                "The table 'pat_stats_weekly' stores pat stats weekly. Its columns are: 配件種類編號, 產品型號_簡化, 站點, 配件種類, 總數量, 正常生產, 廠內維修, 客戶維修, 客戶借出, 其它, 每周狀態.",
-                "'pat_stats_weekly' provides weekly aggregated statistics for PAT parts.",
-                "Columns like '總數量', '正常生產', '廠內維修' represent the count of parts in each status for that week.",
-                "The table 'kyec_parts_all' stores kyec parts all. Its columns are: 客戶產品型號, 客戶名稱, 配件編號, 財產編號, 板全號, 目前儲位, 配件狀態, 舊配件編碼, 財產歸屬, 所屬客戶, 配件種類, Dut數, 機台型號, Handler型號, 封裝型式, 狀態開始時間, 上一個狀態, 處理時間, 領用時間, 配件種類編號.",
-                "'kyec_parts_all' contains detailed records of individual parts from KYEC.",
-                "'配件狀態' (Part Status) indicates the current state of a part.",
-                "Possible values for '配件狀態' in 'kyec_parts_all' are: ['廠內維修', '客戶維修', '正常生產', '其它', '待release'].",
-                "The table 'kyec_stats_weekly' stores kyec stats weekly. Its columns are: 板全號, 客戶產品型號, 機台型號, 配件種類, 總數量, 正常生產, 廠內維修, 客戶維修, 客戶借出, 待release, 其它, 每周狀態.",
-                "'kyec_stats_weekly' provides weekly aggregated statistics for KYEC parts.",
-                "Columns like '總數量', '正常生產', '廠內維修' represent the count of parts in each status for that week."
+        except Exception as ddl_error:
+            self.logger.warning(f"無法從資料庫獲取 DDL，使用預設 DDL: {str(ddl_error)}")
+            
+            # 備用 DDL 訓練
+            ddl_statements = [
+                """
+                CREATE TABLE kyec_parts_all (
+                    客戶產品型號 TEXT,
+                    客戶名稱 TEXT,
+                    配件編號 TEXT,
+                    財產編號 TEXT,
+                    板全號 TEXT,
+                    目前儲位 TEXT,
+                    配件狀態 TEXT,
+                    舊配件編碼 TEXT,
+                    財產歸屬 TEXT,
+                    所屬客戶 TEXT,
+                    配件種類 TEXT,
+                    Dut數 INTEGER,
+                    機台型號 TEXT,
+                    Handler型號 TEXT,
+                    封裝型式 TEXT,
+                    狀態開始時間 TEXT,
+                    上一個狀態 TEXT,
+                    處理時間 TEXT,
+                    領用時間 TEXT,
+                    配件種類編號 TEXT
+                );
+                """,
+                """
+                CREATE TABLE pat_parts_all (
+                    客戶名稱 TEXT,
+                    站點 TEXT,
+                    配件名稱 TEXT,
+                    GLB_NO TEXT,
+                    Package_Type TEXT,
+                    配件種類 TEXT,
+                    LB_DB_NO TEXT,
+                    配件狀態 TEXT,
+                    待驗收 TEXT,
+                    儲位 TEXT,
+                    製作出廠日期 TIMESTAMP,
+                    財產歸屬 TEXT,
+                    客戶財編 TEXT,
+                    產品型號 TEXT,
+                    配件編號 TEXT,
+                    配件種類編號 TEXT,
+                    開始時間 TEXT,
+                    借出天數 REAL,
+                    說明 TEXT,
+                    維修天數 REAL,
+                    產品型號_簡化 TEXT
+                );
+                """,
+                """
+                CREATE TABLE table_change_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    table_name TEXT,
+                    operation TEXT,
+                    timestamp TEXT,
+                    row_key TEXT,
+                    column_name TEXT,
+                    old_value TEXT,
+                    new_value TEXT,
+                    user TEXT,
+                    note TEXT
+                );
+                """
             ]
             
-            for doc in documentation:
-                self.vn.train(documentation=doc)
-            
-            # 3. 訓練問題-SQL 對
-            question_sql_pairs = [
-                {
-                    "question": "顯示所有正在客戶維修的配件",
-                    "sql": """
-                    SELECT 配件編號, 配件名稱, 客戶名稱, 開始時間, 說明
-                    FROM pat_parts_all 
-                    WHERE 配件狀態 = 'OUT_REPAIR'
-                    UNION ALL
-                    SELECT 配件編號, 配件種類 as 配件名稱, 客戶名稱, 狀態開始時間 as 開始時間, 目前儲位 as 說明
-                    FROM kyec_parts_all 
-                    WHERE 配件狀態 = '客戶維修'
-                    """
-                },
-                {
-                    "question": "統計各種配件狀態的數量",
-                    "sql": """
-                    SELECT 配件狀態, COUNT(*) as 數量
-                    FROM (
-                        SELECT 配件狀態 FROM pat_parts_all
-                        UNION ALL
-                        SELECT 配件狀態 FROM kyec_parts_all
-                    ) 
-                    GROUP BY 配件狀態
-                    ORDER BY 數量 DESC
-                    """
-                },
-                {
-                    "question": "查看配件變更歷史",
-                    "sql": """
-                    SELECT timestamp as 變更時間, operation as 操作類型, 
-                            table_name as 資料表, row_key as 配件識別,
-                            column_name as 變更欄位, old_value as 原值, 
-                            new_value as 新值, user as 操作人員
-                    FROM table_change_log
-                    ORDER BY timestamp DESC
-                    LIMIT 100
-                    """
-                },
-                {
-                    "question": "列出PAT客戶維修配件",
-                    "sql": "SELECT * FROM pat_parts_all WHERE 配件狀態 = 'OUT_REPAIR'"
-                },
-                {
-                    "question": "列出PAT送回維修的配件",
-                    "sql": "SELECT * FROM pat_parts_all WHERE 配件狀態 = 'OUT_REPAIR'"
-                },
-                {
-                    "question": "KY送回維修的配件",
-                    "sql": "SELECT * FROM kyec_parts_all WHERE 配件狀態 = '客戶維修'"
-                },
-                {
-                    "question": "LB015T0800127004A 什麼時候寄回維修",
-                    "sql": "SELECT 配件編號, 開始時間 FROM pat_parts_all WHERE 配件編號 = 'LB015T0800127004A' AND 配件狀態 = 'OUT_REPAIR'"
-                },
-                {
-                    "question": "上週有多少配件寄回維修",
-                    "sql": "SELECT COUNT(DISTINCT row_key) FROM table_change_log WHERE (new_value = 'REPAIR' OR new_value = 'OUT_REPAIR' OR new_value = '廠內維修' OR new_value = '客戶維修') AND timestamp >= DATE('now', '-7 days')"
-                },
-                {
-                    "question": "列出正常生產少於2的配件?",
-                    "sql": "SELECT 產品型號_簡化, 正常生產, 站點 FROM pat_stats_weekly WHERE 正常生產 < 2 UNION ALL SELECT 客戶產品型號, 正常生產, 機台型號 FROM kyec_stats_weekly WHERE 正常生產 < 2"
-                },
-                {
-                    "question": "列出總數量少於2的配件?",
-                    "sql": "SELECT 產品型號_簡化, 站點, 總數量 FROM pat_stats_weekly WHERE 總數量 < 2 UNION ALL SELECT 客戶產品型號, 機台型號, 總數量 FROM kyec_stats_weekly WHERE 總數量 < 2"
-                },
-                {
-                    "question": "列出PAT廠內維修的配件",
-                    "sql": "SELECT * FROM pat_parts_all WHERE 配件狀態 = 'REPAIR'"
-                },
-                {
-                    "question": "查詢借出天數最長的配件",
-                    "sql": """
-                    SELECT 配件編號, 配件名稱, 客戶名稱, 借出天數, 開始時間
-                    FROM pat_parts_all
-                    WHERE 借出天數 IS NOT NULL AND 借出天數 > 0
-                    ORDER BY 借出天數 DESC
-                    LIMIT 10
-                    """
-                },
-                {
-                    "question": "顯示所有待release狀態的配件",
-                    "sql": "SELECT * FROM kyec_parts_all WHERE 配件狀態 = '待release'"
-                },
-                {
-                    "question": "顯示最近一週的配件狀態異動",
-                    "sql": "SELECT * FROM table_change_log WHERE column_name LIKE '%配件狀態%' AND timestamp >= DATE('now', '-7 days')"
-                },
-                {
-                    "question": "統計京元電腦總數",
-                    "sql": "SELECT * FROM kyec_stats_weekly WHERE 配件種類='PC'"
-                },
-                {
-                    "question": "統計鴻谷電腦總數",
-                    "sql": "SELECT * FROM pat_stats_weekly WHERE 配件種類='PC'"
-                },
-                {
-                    "question": "顯示7423-OV3 FT2板子",
-                    "sql": """
-                    SELECT
-                    產品型號_簡化 AS 產品型號,
-                    站點,
-                    總數量,
-                    正常生產,
-                    客戶維修,
-                    廠內維修,
-                    其它
-                    FROM pat_stats_weekly
-                    WHERE 產品型號_簡化 LIKE '%7423-OV3%' AND 站點 LIKE '%FT2%'
+            for ddl in ddl_statements:
+                items.append(training_item('ddl', ddl))
+        
+        # 2. 訓練文檔說明
+        documentation = [
+            "The database contains information about tooling parts from two main sources: PAT and KYEC.",
+            "PAT is also known as 鴻谷, 紅古, or 鴻股.",
+            "KYEC is also known as 京元電子, 京元電, 京元, or 晶圓.",
+            "The customer '創惟' and '創惟科技' refer to the same company, Genesys Logic.",
+            "The table 'table_change_log' stores table change log. Its columns are: id, table_name, operation, timestamp, row_key, column_name, old_value, new_value, user, note.",
+            "'table_change_log' is an audit table that records all changes made to other tables.",
+            "The 'operation' column shows the type of change (e.g., 'update', 'insert').",
+            "The table 'query_log' is currently empty.",
+            "The table 'pat_parts_all' stores pat parts all. Its columns are: 客戶名稱, 站點, 配件名稱, GLB_NO, Package Type, 配件種類, LB / DB NO, 配件狀態, 待驗收, 儲 位, 製作出廠日期, 財產歸屬, 客戶財編, 產品型號, 配件編號, 配件種類編號, 開始時間, 借出天數, 說明, 維修天數, 產品型號_簡化.",
+            "'pat_parts_all' contains detailed records of individual parts from PAT.",
+            "'配件狀態' (Part Status) indicates the current state of a part.",
+            "Possible values for '配件狀態' in 'pat_parts_all' are: ['OUT_REPAIR', 'REPAIR', 'BORROW', 'PRODUCTION', '其它'].",
+            "'維修天數' means repair days, and '借出天數' means loan days.",
+            "The table 'pat_stats_weekly' stores pat stats weekly. Its columns are: 配件種類編號, 產品型號_簡化, 站點, 配件種類, 總數量, 正常生產, 廠內維修, 客戶維修, 客戶借出, 其它, 每周狀態.",
+            "'pat_stats_weekly' provides weekly aggregated statistics for PAT parts.",
+            "Columns like '總數量', '正常生產', '廠內維修' represent the count of parts in each status for that week.",
+            "The table 'kyec_parts_all' stores kyec parts all. Its columns are: 客戶產品型號, 客戶名稱, 配件編號, 財產編號, 板全號, 目前儲位, 配件狀態, 舊配件編碼, 財產歸屬, 所屬客戶, 配件種類, Dut數, 機台型號, Handler型號, 封裝型式, 狀態開始時間, 上一個狀態, 處理時間, 領用時間, 配件種類編號.",
+            "'kyec_parts_all' contains detailed records of individual parts from KYEC.",
+            "'配件狀態' (Part Status) indicates the current state of a part.",
+            "Possible values for '配件狀態' in 'kyec_parts_all' are: ['廠內維修', '客戶維修', '正常生產', '其它', '待release'].",
+            "The table 'kyec_stats_weekly' stores kyec stats weekly. Its columns are: 板全號, 客戶產品型號, 機台型號, 配件種類, 總數量, 正常生產, 廠內維修, 客戶維修, 客戶借出, 待release, 其它, 每周狀態.",
+            "'kyec_stats_weekly' provides weekly aggregated statistics for KYEC parts.",
+            "Columns like '總數量', '正常生產', '廠內維修' represent the count of parts in each status for that week."
+        ]
+        
+        for doc in documentation:
+            items.append(training_item('documentation', doc))
+        
+        # 3. 訓練問題-SQL 對
+        question_sql_pairs = [
+            {
+                "question": "顯示所有正在客戶維修的配件",
+                "sql": """
+                SELECT 配件編號, 配件名稱, 客戶名稱, 開始時間, 說明
+                FROM pat_parts_all 
+                WHERE 配件狀態 = 'OUT_REPAIR'
+                UNION ALL
+                SELECT 配件編號, 配件種類 as 配件名稱, 客戶名稱, 狀態開始時間 as 開始時間, 目前儲位 as 說明
+                FROM kyec_parts_all 
+                WHERE 配件狀態 = '客戶維修'
+                """
+            },
+            {
+                "question": "統計各種配件狀態的數量",
+                "sql": """
+                SELECT 配件狀態, COUNT(*) as 數量
+                FROM (
+                    SELECT 配件狀態 FROM pat_parts_all
                     UNION ALL
-                    SELECT
-                    客戶產品型號 AS 產品型號,
-                    板全號 AS 站點,
-                    總數量,
-                    正常生產,
-                    客戶維修,
-                    廠內維修,
-                    其它
-                    FROM kyec_stats_weekly
-                    WHERE 客戶產品型號 LIKE '%7423-OV3%' AND 板全號 LIKE '%FT2%'
-                    """
-                },
-                {
-                    "question": "顯示7423-TB1 FT2在PAT的板子",
-                    "sql": """
-                    SELECT *
-                    FROM pat_stats_weekly
-                    WHERE 產品型號_簡化 LIKE '%7423-TB1%' AND 站點 LIKE '%FT2%'
-                    """
-                },
-                {
-                    "question": "顯示5450-OS1 FT1在KYEC的DB",
-                    "sql": """
-                    SELECT *
-                    FROM kyec_stats_weekly
-                    WHERE 客戶產品型號 LIKE '%5450-OS1%' AND 配件種類 LIKE '%DB%'
-                    """
-                },
-                {
-                    "question": "7423-TB1 FT2的GLB No是什麼",
-                    "sql": "SELECT 產品型號_簡化, GLB_NO, 站點, 配件編號, 配件狀態 FROM pat_parts_all WHERE 產品型號_簡化 LIKE '%7423-TB1%' AND 站點 LIKE '%FT2%'"
-                },
-                {
-                    "question": "列出PAT gen1電腦",
-                    "sql": "SELECT * FROM pat_stats_weekly WHERE 產品型號_簡化 LIKE '%gen1%'"
-                },
-                {
-                    "question": "列出KYEC gen2電腦",
-                    "sql": "SELECT * FROM kyec_stats_weekly WHERE 客戶產品型號 LIKE '%gen2%'"
-                }
-            ]  
-            
-            for pair in question_sql_pairs:
-                self.vn.train(question=pair["question"], sql=pair["sql"])
-            
-            self.logger.info("模型訓練完成")
-            
-        except Exception as e:
-            self.logger.error(f"模型訓練失敗: {str(e)}")
+                    SELECT 配件狀態 FROM kyec_parts_all
+                ) 
+                GROUP BY 配件狀態
+                ORDER BY 數量 DESC
+                """
+            },
+            {
+                "question": "查看配件變更歷史",
+                "sql": """
+                SELECT timestamp as 變更時間, operation as 操作類型, 
+                        table_name as 資料表, row_key as 配件識別,
+                        column_name as 變更欄位, old_value as 原值, 
+                        new_value as 新值, user as 操作人員
+                FROM table_change_log
+                ORDER BY timestamp DESC
+                LIMIT 100
+                """
+            },
+            {
+                "question": "列出PAT客戶維修配件",
+                "sql": "SELECT * FROM pat_parts_all WHERE 配件狀態 = 'OUT_REPAIR'"
+            },
+            {
+                "question": "列出PAT送回維修的配件",
+                "sql": "SELECT * FROM pat_parts_all WHERE 配件狀態 = 'OUT_REPAIR'"
+            },
+            {
+                "question": "KY送回維修的配件",
+                "sql": "SELECT * FROM kyec_parts_all WHERE 配件狀態 = '客戶維修'"
+            },
+            {
+                "question": "LB015T0800127004A 什麼時候寄回維修",
+                "sql": "SELECT 配件編號, 開始時間 FROM pat_parts_all WHERE 配件編號 = 'LB015T0800127004A' AND 配件狀態 = 'OUT_REPAIR'"
+            },
+            {
+                "question": "上週有多少配件寄回維修",
+                "sql": "SELECT COUNT(DISTINCT row_key) FROM table_change_log WHERE (new_value = 'REPAIR' OR new_value = 'OUT_REPAIR' OR new_value = '廠內維修' OR new_value = '客戶維修') AND timestamp >= DATE('now', '-7 days')"
+            },
+            {
+                "question": "列出正常生產少於2的配件?",
+                "sql": "SELECT 產品型號_簡化, 正常生產, 站點 FROM pat_stats_weekly WHERE 正常生產 < 2 UNION ALL SELECT 客戶產品型號, 正常生產, 機台型號 FROM kyec_stats_weekly WHERE 正常生產 < 2"
+            },
+            {
+                "question": "列出總數量少於2的配件?",
+                "sql": "SELECT 產品型號_簡化, 站點, 總數量 FROM pat_stats_weekly WHERE 總數量 < 2 UNION ALL SELECT 客戶產品型號, 機台型號, 總數量 FROM kyec_stats_weekly WHERE 總數量 < 2"
+            },
+            {
+                "question": "列出PAT廠內維修的配件",
+                "sql": "SELECT * FROM pat_parts_all WHERE 配件狀態 = 'REPAIR'"
+            },
+            {
+                "question": "查詢借出天數最長的配件",
+                "sql": """
+                SELECT 配件編號, 配件名稱, 客戶名稱, 借出天數, 開始時間
+                FROM pat_parts_all
+                WHERE 借出天數 IS NOT NULL AND 借出天數 > 0
+                ORDER BY 借出天數 DESC
+                LIMIT 10
+                """
+            },
+            {
+                "question": "顯示所有待release狀態的配件",
+                "sql": "SELECT * FROM kyec_parts_all WHERE 配件狀態 = '待release'"
+            },
+            {
+                "question": "顯示最近一週的配件狀態異動",
+                "sql": "SELECT * FROM table_change_log WHERE column_name LIKE '%配件狀態%' AND timestamp >= DATE('now', '-7 days')"
+            },
+            {
+                "question": "統計京元電腦總數",
+                "sql": "SELECT * FROM kyec_stats_weekly WHERE 配件種類='PC'"
+            },
+            {
+                "question": "統計鴻谷電腦總數",
+                "sql": "SELECT * FROM pat_stats_weekly WHERE 配件種類='PC'"
+            },
+            {
+                "question": "顯示7423-OV3 FT2板子",
+                "sql": """
+                SELECT
+                產品型號_簡化 AS 產品型號,
+                站點,
+                總數量,
+                正常生產,
+                客戶維修,
+                廠內維修,
+                其它
+                FROM pat_stats_weekly
+                WHERE 產品型號_簡化 LIKE '%7423-OV3%' AND 站點 LIKE '%FT2%'
+                UNION ALL
+                SELECT
+                客戶產品型號 AS 產品型號,
+                板全號 AS 站點,
+                總數量,
+                正常生產,
+                客戶維修,
+                廠內維修,
+                其它
+                FROM kyec_stats_weekly
+                WHERE 客戶產品型號 LIKE '%7423-OV3%' AND 板全號 LIKE '%FT2%'
+                """
+            },
+            {
+                "question": "顯示7423-TB1 FT2在PAT的板子",
+                "sql": """
+                SELECT *
+                FROM pat_stats_weekly
+                WHERE 產品型號_簡化 LIKE '%7423-TB1%' AND 站點 LIKE '%FT2%'
+                """
+            },
+            {
+                "question": "顯示5450-OS1 FT1在KYEC的DB",
+                "sql": """
+                SELECT *
+                FROM kyec_stats_weekly
+                WHERE 客戶產品型號 LIKE '%5450-OS1%' AND 配件種類 LIKE '%DB%'
+                """
+            },
+            {
+                "question": "7423-TB1 FT2的GLB No是什麼",
+                "sql": "SELECT 產品型號_簡化, GLB_NO, 站點, 配件編號, 配件狀態 FROM pat_parts_all WHERE 產品型號_簡化 LIKE '%7423-TB1%' AND 站點 LIKE '%FT2%'"
+            },
+            {
+                "question": "列出PAT gen1電腦",
+                "sql": "SELECT * FROM pat_stats_weekly WHERE 產品型號_簡化 LIKE '%gen1%'"
+            },
+            {
+                "question": "列出KYEC gen2電腦",
+                "sql": "SELECT * FROM kyec_stats_weekly WHERE 客戶產品型號 LIKE '%gen2%'"
+            }
+        ]  
+        
+        for pair in question_sql_pairs:
+            items.append(training_item('sql', pair["sql"], pair["question"]))
+        
+        return items
     
     def ask_question(self, question: str) -> Dict[str, Any]:
         """詢問問題並獲取結果 - 參考官方範例"""
@@ -418,9 +438,22 @@ class VannaConfig:
             # 生成 SQL
             self.logger.info(f"開始處理問題: {question}")
             
+            # 先查詢問題快取（完全比對，再以嵌入向量做語意比對）
+            fingerprint = self._cache_fingerprint()
+            cached = None
+            if fingerprint is not None:
+                cached = self.question_cache.lookup(question, fingerprint,
+                                                    embed=getattr(self.vn, 'generate_embedding', None))
+            
             try:
-                sql = self.vn.generate_sql(question)
-                self.logger.info(f"Vanna AI 生成的原始 SQL: {sql}")
+                if cached is not None and cached.sql:
+                    sql = cached.sql
+                    self.logger.info(f"問題快取命中（{cached.tier}，相似度 {cached.similarity:.3f}）: {sql}")
+                else:
+                    generate_started = time.perf_counter()
+                    sql = self.vn.generate_sql(question)
+                    generate_ms = (time.perf_counter() - generate_started) * 1000
+                    self.logger.info(f"Vanna AI 生成的原始 SQL: {sql}")
             except Exception as sql_error:
                 self.logger.error(f"Vanna AI SQL 生成失敗: {str(sql_error)}")
                 
@@ -448,18 +481,25 @@ class VannaConfig:
             # 驗證 SQL 安全性
             self.logger.info(f"開始驗證 SQL 安全性: {sql}")
             
-            if not self._validate_sql(sql):
-                self.logger.warning(f"SQL 安全性驗證失敗: {sql}")
-                
-                # 詳細分析為什麼驗證失敗
-                sql_upper = sql.strip().upper().rstrip(';')
-                self.logger.info(f"處理後的 SQL: {sql_upper}")
+            verdict = get_sql_validator().validate(sql)
+            if not verdict.is_safe:
+                self.logger.warning(f"SQL 安全性驗證失敗 ({verdict.reason}): {sql}")
+                return {
+                    'success': False,
+                    'error': f'生成的 SQL 未通過安全性驗證: {verdict.reason}',
+                    'sql': sql,
+                    'question': question
+                }
             
             self.logger.info("SQL 安全性驗證通過")
             
             # 執行 SQL
             df = self.vn.run_sql(sql)
             
+            # 新生成且執行成功的 SQL 寫入問題快取
+            if fingerprint is not None and not cached.sql:
+                self.question_cache.store(question, sql, fingerprint, generate_ms, cached.embedding)
+            
             # 生成解釋（如果方法存在的話）
             explanation = ""
             try:
@@ -477,7 +517,10 @@ class VannaConfig:
                 'sql': sql,
                 'data': df,
                 'explanation': explanation,
-                'question': question
+                'question': question,
+                'partial': bool(df.attrs.get('partial')),
+                'partial_message': describe_partial_result(df),
+                'cache_tier': cached.tier if cached is not None else None
             }
             
         except Exception as e:
@@ -488,38 +531,31 @@ class VannaConfig:
                 'question': question
             }
     
+    def _cache_fingerprint(self) -> Optional[str]:
+        """問題快取指紋：資料庫結構（DDL）與內建訓練資料的內容雜湊，無法取得時不使用快取"""
+        try:
+            catalog = get_schema_catalog(get_connection_provider(resolve_read_path("tooling_data.db")))
+            return cache_fingerprint(catalog.ddl_statements(exclude=is_derived_table)
+                                     + self.training_manifest.content_hashes())
+        except Exception as e:
+            self.logger.warning(f"問題快取指紋計算失敗，略過快取: {str(e)}")
+            return None
+    
     def _validate_sql(self, sql: str) -> bool:
-        """驗證 SQL 安全性"""
-        if not sql:
-            return False
-        
-        sql_upper = sql.strip().upper()
-        
-        # 移除結尾的分號（這是正常的）
-        sql_upper = sql_upper.rstrip(';')
-        
-        # 只允許 SELECT 查詢
-        if not sql_upper.startswith('SELECT'):
-            return False
-        
-        # 檢查危險關鍵字（但允許在字串中出現）
-        dangerous_patterns = [
-            r'\bDROP\b', r'\bDELETE\b', r'\bINSERT\b', r'\bUPDATE\b',
-            r'\bALTER\b', r'\bCREATE\b', r'\bTRUNCATE\b', r'\bEXEC\b',
-            r'\bEXECUTE\b', r'--'
-        ]
-        
-        import re
-        for pattern in dangerous_patterns:
-            if re.search(pattern, sql_upper):
-                return False
-        
-        # 檢查是否有多個語句（用分號分隔）
-        statements = sql.split(';')
-        if len([s for s in statements if s.strip()]) > 1:
-            return False
-        
-        return True
+        """驗證 SQL 安全性（只允許單一唯讀查詢）"""
+        return get_sql_validator().is_safe(sql)
+    
+    def update_settings(self, max_results: int, query_timeout: int):
+        """更新查詢設定（最大結果數與超時時間）"""
+        get_query_governor().update_settings(max_results, query_timeout)
+    
+    def get_settings(self) -> Dict[str, Any]:
+        """獲取目前的查詢設定"""
+        settings = get_query_governor().get_settings()
+        return {
+            'max_results': settings['max_rows'],
+            'query_timeout': int(settings['timeout_seconds'])
+        }
     
     def generate_plotly_code(self, question: str, sql: str, df: pd.DataFrame) -> Optional[str]:
         """生成 Plotly 圖表代碼 - 參考官方範例"""
@@ -588,6 +624,24 @@ class VannaConfig:
             self.logger.error(f"訓練資料摘要獲取失敗: {str(e)}")
             return {'error': str(e)}
     
+    def compact_training_store(self) -> Dict[str, Any]:
+        """合併向量資料庫中重複的訓練資料並重建 collection，返回整理前後的筆數、磁碟用量與檢索延遲"""
+        try:
+            if not self.vn:
+                return {'error': 'Vanna AI 未初始化'}
+            
+            # 與引擎建立及重新載入互斥，避免其他引擎在重建期間開啟向量資料庫
+            with _vanna_engine_lock:
+                return compact_training_store(
+                    self.vn, self.chroma_path,
+                    preferred_ids=self.training_manifest.training_ids(),
+                    probe_questions=self._get_default_questions()
+                )
+            
+        except Exception as e:
+            self.logger.error(f"訓練資料整理失敗: {str(e)}")
+            return {'error': str(e)}
+    
     def add_training_data(self, question: str, sql: str) -> bool:
         """添加新的訓練資料"""
         try:
@@ -595,6 +649,7 @@ class VannaConfig:
                 return False
             
             self.vn.train(question=question, sql=sql)
+            self.question_cache.clear()
             self.logger.info(f"新增訓練資料: {question}")
             return True
             
@@ -602,6 +657,36 @@ class VannaConfig:
             self.logger.error(f"添加訓練資料失敗: {str(e)}")
             return False
     
+    def bulk_add_training_data(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批次匯入問題-SQL 對（欄位 question/Question 與 sql/SQL），返回匯入結果與每秒處理筆數"""
+        try:
+            if not self.vn:
+                return {'error': 'Vanna AI 未初始化'}
+            
+            items = []
+            incomplete = 0
+            for record in records:
+                question = record.get("question") or record.get("Question")
+                sql = record.get("sql") or record.get("SQL")
+                # CSV 的空白欄位讀入為 NaN，只接受非空字串
+                if isinstance(question, str) and isinstance(sql, str) and question.strip() and sql.strip():
+                    items.append(training_item('sql', sql, question))
+                else:
+                    incomplete += 1
+            
+            result = ingest_training_items(self.vn, items)
+            result['incomplete'] = incomplete
+            if result['added']:
+                self.question_cache.clear()
+            self.logger.info(f"批次匯入訓練資料: 新增 {result['added']} 筆、已存在 {result['skipped']} 筆、"
+                             f"未通過驗證 {len(result['rejected'])} 筆，"
+                             f"{result['items_per_second']:.1f} 筆/秒")
+            return result
+            
+        except Exception as e:
+            self.logger.error(f"批次匯入訓練資料失敗: {str(e)}")
+            return {'error': str(e)}
+    
     def remove_training_data(self, id: str) -> bool:
         """移除訓練資料"""
         try:
@@ -609,6 +694,7 @@ class VannaConfig:
                 return False
             
             self.vn.remove_training_data(id)
+            self.question_cache.clear()
             return True
             
         except Exception as e:
@@ -621,7 +707,7 @@ class VannaConfig:
             if not self.vn:
                 return {
                     'status': '未初始化',
-                    'error': 'Vanna AI 實例未建立'
+                    'error': self.init_error or 'Vanna AI 實例未建立'
                 }
             
             training_summary = self.get_training_data_summary()
@@ -629,13 +715,57 @@ class VannaConfig:
             return {
                 'status': '正常',
                 'training_data_count': training_summary.get('total_count', 0),
-                'last_training': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'last_training': self.training_manifest.updated_at or "未知",
                 'model_name': self.model_name,
-                'database_connected': True
+                'database_connected': True,
+                'api_key_missing': self.api_key_missing,
+                'last_training_result': self.last_training_result
             }
             
         except Exception as e:
             return {
                 'status': '異常',
                 'error': str(e)
-            }
\ No newline at end of file
+            }
+
+
+_vanna_engine: Optional[VannaConfig] = None
+_vanna_engine_lock = threading.Lock()
+
+
+def get_vanna_engine() -> VannaConfig:
+    """取得行程共用的 Vanna AI 引擎（第一次呼叫時建立，所有使用者工作階段共用）
+
+    初始化失敗的引擎不會被共用，下次呼叫時重新建立。
+    """
+    global _vanna_engine
+    engine = _vanna_engine
+    if engine is not None:
+        return engine
+    with _vanna_engine_lock:
+        if _vanna_engine is not None:
+            return _vanna_engine
+        engine = VannaConfig()
+        if engine.vn is None:
+            logging.getLogger(__name__).warning(f"Vanna AI 引擎初始化失敗，下次使用時重試: {engine.init_error}")
+            return engine
+        _vanna_engine = engine
+        logging.getLogger(__name__).info(f"Vanna AI 引擎已建立，耗時 {engine.load_seconds:.2f} 秒")
+        return engine
+
+
+def reload_vanna_engine() -> VannaConfig:
+    """重新建立行程共用的 Vanna AI 引擎（訓練資料或資料庫變更後使用）
+
+    新引擎建立完成後才替換，建立期間其他工作階段仍使用舊引擎；新引擎初始化失敗時
+    保留舊引擎，並返回失敗的引擎讓呼叫端顯示錯誤。
+    """
+    global _vanna_engine
+    with _vanna_engine_lock:
+        engine = VannaConfig()
+        if engine.vn is None:
+            logging.getLogger(__name__).warning(f"Vanna AI 引擎重新載入失敗，沿用原本的引擎: {engine.init_error}")
+            return engine
+        _vanna_engine = engine
+        logging.getLogger(__name__).info(f"Vanna AI 引擎已重新載入，耗時 {engine.load_seconds:.2f} 秒")
+        return engine